@@ -0,0 +1,398 @@
+#!/usr/bin/env python3
+'''
+This code benchmark the hot paths of the analysis at scaled catalog sizes, to see how they grow with the catalog
+and to catch the performance regressions between versions:
+    the preparation of the dataframe (work.prepare_dataframe, from the CSV file),
+    the conversions of a column (conversion.convert_column_to_numeric and convert_column_to_date),
+    the calculation of each delay (calculate_delays.py),
+    the selection of a subset (work.subset_selection),
+    the checks of the dataset (dataset_errors_finding.py),
+    the comparison of 2 datasets value by value (dataset_comparison.test_columns_print_errors).
+
+The catalog is scaled by replicating its rows (scale 10 is 10 copies of the catalog), so the values, the malformed
+values and the proportions of known values are the ones of the real catalog. For each benchmark and each scale,
+the function is run several times on a fresh copy of its input (the copy is not timed, the output printed
+by the function is discarded), the wall time and the CPU time are the minimum over the runs.
+The memory is the peak of the memory allocated during one more run (traced with tracemalloc),
+and the peak RSS of the process after the runs is recorded too (see pipeline_profiler.py).
+A benchmark is not run at a scale if its time, extrapolated linearly from the previous scale, exceeds the time budget.
+Instead of the replicated catalog, a synthetic catalog of the same size can be benchmarked (see synthetic_catalog.py),
+its events are all different (a replicated catalog has few distinct values, which can make some paths faster than they are).
+
+The results are saved in a JSON file with the versions of the environment, and compared with the results
+of a baseline: a benchmark is a regression if it is slower than the baseline by more than the threshold.
+'''
+
+import contextlib
+import datetime
+import gc
+import json
+import os
+import platform
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from constants import TC_10, TIME_FLARE
+from pipeline_profiler import peak_rss
+
+CATALOG_PATH='Datasets/'
+CATALOG_FILE='GOES_integral_PRIMARY.1986-02-03.2025-09-10_sep_events.csv'
+
+#Sizes of the catalog benchmarked (number of copies of the catalog)
+BENCHMARK_SCALES=(1, 10, 100)
+
+#Maximum number of runs of a benchmark at a scale (the runs stop when their total time exceeds the time budget)
+BENCHMARK_REPEAT=3
+
+#Time budget of a benchmark at a scale (seconds)
+BENCHMARK_TIME_BUDGET=60.0
+
+#A benchmark is a regression if its wall time is more than (1 + REGRESSION_THRESHOLD) times the baseline one
+#and more than REGRESSION_MIN_TIME seconds longer (the shorter differences are noise)
+REGRESSION_THRESHOLD=0.2
+REGRESSION_MIN_TIME=0.01
+
+
+def scale_catalog(df,scale):
+    '''
+    Return the catalog df replicated scale times (with a new index 0..n-1, as a catalog read from a file).
+    '''
+    return pd.concat([df]*scale, ignore_index=True)
+
+
+def write_scaled_catalog(directory,scale,file_path=CATALOG_PATH,file_name=CATALOG_FILE):
+    '''
+    Write the SEP event file replicated scale times in directory, with the same name,
+    and return its directory (to give to work.prepare_dataframe).
+    The last row of the file (removed by prepare_dataframe) is not replicated, it stays the last row.
+    '''
+    df=pd.read_csv(file_path + file_name)
+    df=pd.concat([scale_catalog(df.iloc[:-1], scale), df.iloc[-1:]], ignore_index=True)
+    directory=os.path.join(directory, '')
+    df.to_csv(directory + file_name, index=False)
+    return directory
+
+
+def _failing(function):
+    '''
+    Return a function calling function and returning the assertion raised, if any: the checks of the dataset
+    assert that there is no error, they are benchmarked even if the catalog has errors.
+    '''
+    def run(*args, **kwargs):
+        try:
+            return function(*args, **kwargs)
+        except AssertionError as error:
+            return error
+    run.__name__=function.__name__
+    return run
+
+
+def _perturbed(df,fraction=0.01,seed=0):
+    '''
+    Return a copy of df where a fraction of the known values of the numeric columns are changed,
+    to compare df with a different dataset.
+    '''
+    rng=np.random.default_rng(seed)
+    df=df.copy()
+    for column in df.select_dtypes('number').columns:
+        changed=rng.random(len(df))<fraction
+        df.loc[changed, column]=df.loc[changed, column]*2 + 1
+    return df
+
+
+def hot_path_benchmarks():
+    '''
+    Return the benchmarks of the hot paths: a list of dicts
+        'name' : the name of the benchmark
+        'group' : the group of the benchmark (eg 'delays')
+        'input' : 'file', 'raw' or 'prepared', the input of the benchmark at a scale: the directory of the scaled SEP event file,
+                  the scaled catalog as read from the file, or the scaled prepared catalog
+        'setup' : function(input) returning the arguments of function (called before each run, not timed)
+        'function' : the function benchmarked
+    '''
+    from work import prepare_dataframe, subset_selection
+    from conversion import convert_column_to_numeric, convert_column_to_date
+    from calculate_delays import calculate_CME_to_max_delay, calculate_flare_to_max_delay, calculate_flare_to_peak_delay, calculate_CME_to_peak_delay
+    from calculate_delays import corrects_sep_to_max_delay, corrects_sep_to_peak_delay
+    from dataset_errors_finding import test_rise_time_to_onset, print_errors_in_rise_time_to_onset
+    from dataset_errors_finding import test_rise_time_to_max, print_errors_in_rise_time_to_max, test_longitude_range
+    from dataset_comparison import test_columns_print_errors
+
+    benchmarks=[{'name': 'prepare_dataframe', 'group': 'preparation', 'input': 'file',
+                 'setup': lambda directory: ((), {'file_path': directory}), 'function': prepare_dataframe}]
+
+    for convert, column in [(convert_column_to_numeric, 'Flare Magnitude'), (convert_column_to_date, TIME_FLARE)]:
+        benchmarks.append({'name': f'{convert.__name__} ({column})', 'group': 'conversions', 'input': 'raw',
+                           'setup': lambda df, column=column: ((df.copy(), column), {'notify_changes': True}), 'function': convert})
+
+    for calculate in [calculate_CME_to_max_delay, calculate_flare_to_max_delay, calculate_flare_to_peak_delay, calculate_CME_to_peak_delay,
+                      corrects_sep_to_max_delay, corrects_sep_to_peak_delay]:
+        benchmarks.append({'name': calculate.__name__, 'group': 'delays', 'input': 'prepared',
+                           'setup': lambda df: ((df.copy(),), {}), 'function': calculate})
+
+    for name, criteria in [('subset_selection (event type)', {'event_type': TC_10}),
+                           ('subset_selection (all criteria)', {'event_type': TC_10, 'Event_longitude': (-90, 90), 'Flare_magnitude': 1e-5,
+                                                                'CDAW_speed': 1000, 'DONKI_speed': 1000}),
+                           ('subset_selection (expression)', {'event_type': TC_10, 'expression': 'cdaw_speed >= 1000 or gle'})]:
+        benchmarks.append({'name': name, 'group': 'selection', 'input': 'prepared',
+                           'setup': lambda df, criteria=criteria: ((df,), criteria), 'function': subset_selection})
+
+    for check in [test_rise_time_to_onset, print_errors_in_rise_time_to_onset, test_rise_time_to_max, print_errors_in_rise_time_to_max, test_longitude_range]:
+        benchmarks.append({'name': check.__name__, 'group': 'checks', 'input': 'prepared',
+                           'setup': lambda df: ((df,), {}), 'function': _failing(check)})
+
+    benchmarks.append({'name': 'test_columns_print_errors', 'group': 'comparison', 'input': 'raw',
+                       'setup': lambda df: ((df, 'catalog', _perturbed(df), 'perturbed'), {}), 'function': _failing(test_columns_print_errors)})
+    return benchmarks
+
+
+def time_function(function,setup,repeat=BENCHMARK_REPEAT,time_budget=BENCHMARK_TIME_BUDGET,trace_memory=True):
+    '''
+    Time function(*args, **kwargs), with (args, kwargs)=setup() before each run, the output printed by function is discarded.
+
+    Parameters:
+    -----------
+    repeat : int, default to BENCHMARK_REPEAT
+        The maximum number of runs, the runs stop when their total wall time exceeds time_budget
+    time_budget : float, default to BENCHMARK_TIME_BUDGET
+        The time budget of the runs (seconds)
+    trace_memory : boolean, default to True
+        If True, function is run once more with tracemalloc to measure the peak of the memory allocated during the run
+
+    Returns:
+    --------
+    timing : dict
+        'wall_time', 'cpu_time' : the minimum wall time and CPU time of the runs (seconds),
+        'wall_times' : the wall time of each run, 'peak_memory' : the peak memory allocated during a run (bytes, None if not traced),
+        'peak_rss' : the peak RSS of the process after the runs (bytes)
+    '''
+    wall_times,cpu_times=[],[]
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        while len(wall_times)<max(repeat, 1) and sum(wall_times)<=time_budget:
+            args,kwargs=setup()
+            gc.collect()
+            wall,cpu=time.perf_counter(),time.process_time()
+            function(*args, **kwargs)
+            wall_times.append(time.perf_counter()-wall)
+            cpu_times.append(time.process_time()-cpu)
+            del args,kwargs
+
+        peak_memory=None
+        if trace_memory:
+            args,kwargs=setup()
+            gc.collect()
+            tracemalloc.start()
+            try:
+                function(*args, **kwargs)
+                peak_memory=tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+            del args,kwargs
+
+    return {'wall_time': min(wall_times), 'cpu_time': min(cpu_times), 'wall_times': wall_times,
+            'peak_memory': peak_memory, 'peak_rss': peak_rss()}
+
+
+def benchmark_environment():
+    '''
+    Return the versions of the environment of the benchmark (to know if the timings of 2 runs can be compared).
+    '''
+    return {'date': datetime.datetime.now().isoformat(timespec='seconds'), 'python': platform.python_version(),
+            'numpy': np.__version__, 'pandas': pd.__version__, 'platform': platform.platform(),
+            'processor': platform.processor(), 'cpu_count': os.cpu_count()}
+
+
+def run_benchmarks(scales=BENCHMARK_SCALES,names=None,repeat=BENCHMARK_REPEAT,time_budget=BENCHMARK_TIME_BUDGET,trace_memory=True,
+                   file_path=CATALOG_PATH,file_name=CATALOG_FILE,synthetic_seed=None,verbose=True):
+    '''
+    Run the benchmarks of the hot paths (see hot_path_benchmarks) at each scale of the catalog.
+
+    Parameters:
+    -----------
+    scales : list of int, default to BENCHMARK_SCALES
+        The scales of the catalog (number of copies), in increasing order
+    names : list of string, default to None
+        The names or groups of the benchmarks to run, None for all of them
+    repeat, time_budget, trace_memory :
+        see time_function, a benchmark is not run at a scale if its wall time extrapolated from the previous scale exceeds time_budget
+    file_path, file_name : string, default to the GOES integral PRIMARY catalog
+        The SEP event file scaled
+    synthetic_seed : int, default to None
+        If not None, benchmark at each scale a synthetic catalog generated from this seed (see synthetic_catalog.py),
+        with as many events as the scaled catalog, instead of the scaled catalog
+    verbose : boolean, default to True
+        If True, print the timings as they are measured
+
+    Returns:
+    --------
+    results : dict
+        'environment' : see benchmark_environment, 'scales', 'repeat', 'time_budget', 'synthetic_seed', 'catalog_rows' : {scale: rows of the prepared catalog},
+        'benchmarks' : a list of dicts, one per benchmark and scale, with 'name', 'group', 'scale', 'rows', 'status' ('ok' or 'skipped')
+        and the timing (see time_function)
+    '''
+    from work import prepare_dataframe
+    from synthetic_catalog import write_synthetic_catalog
+
+    benchmarks=[benchmark for benchmark in hot_path_benchmarks() if names is None or benchmark['name'] in names or benchmark['group'] in names]
+    results={'environment': benchmark_environment(), 'scales': list(scales), 'repeat': repeat, 'time_budget': time_budget,
+             'synthetic_seed': synthetic_seed, 'catalog_rows': {}, 'benchmarks': []}
+
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        raw=pd.read_csv(file_path + file_name)
+        prepared=prepare_dataframe(file_path=file_path, file_name=file_name)
+
+    last_times={}
+    previous_scale=None
+    with tempfile.TemporaryDirectory() as directory:
+        for scale in scales:
+            inputs={'raw': lambda: scale_catalog(raw.iloc[:-1], scale), 'prepared': lambda: scale_catalog(prepared, scale),
+                    'file': lambda: write_scaled_catalog(directory, scale, file_path=file_path, file_name=file_name)}
+            if synthetic_seed is not None:
+                #one more event, the last row removed by prepare_dataframe
+                synthetic_path=os.path.join(directory, '')
+                write_synthetic_catalog(synthetic_path + file_name, len(prepared)*scale+1, seed=synthetic_seed)
+                with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                    synthetic_raw=pd.read_csv(synthetic_path + file_name, low_memory=False)
+                    synthetic_prepared=prepare_dataframe(file_path=synthetic_path, file_name=file_name, notify_changes=False)
+                inputs={'raw': lambda: synthetic_raw.iloc[:-1], 'prepared': lambda: synthetic_prepared, 'file': lambda: synthetic_path}
+            built={}
+            results['catalog_rows'][scale]=len(prepared)*scale
+            if verbose:
+                print(f'\nScale {scale} ({len(prepared)*scale} events):')
+
+            for benchmark in benchmarks:
+                record={'name': benchmark['name'], 'group': benchmark['group'], 'scale': scale, 'rows': len(prepared)*scale}
+                name=benchmark['name']
+                if name in last_times and last_times[name]*scale/previous_scale>time_budget:
+                    record['status']='skipped'
+                    results['benchmarks'].append(record)
+                    if verbose:
+                        print(f'\t{name}: skipped (about {last_times[name]*scale/previous_scale:.0f} s expected)')
+                    continue
+
+                if benchmark['input'] not in built:
+                    built[benchmark['input']]=inputs[benchmark['input']]()
+                data=built[benchmark['input']]
+                timing=time_function(benchmark['function'], lambda: benchmark['setup'](data), repeat=repeat,
+                                     time_budget=time_budget, trace_memory=trace_memory)
+                record.update(status='ok', **timing)
+                results['benchmarks'].append(record)
+                last_times[name]=timing['wall_time']
+                if verbose:
+                    memory='' if timing['peak_memory'] is None else f", {timing['peak_memory']/2**20:.1f} MiB"
+                    print(f"\t{name}: {timing['wall_time']:.4f} s{memory}")
+            previous_scale=scale
+            del built
+
+    return results
+
+
+def benchmark_table(results):
+    '''
+    Return the wall times (seconds) of the benchmarks as a DataFrame, one row per benchmark and one column per scale
+    (NaN if the benchmark was skipped).
+    '''
+    records=pd.DataFrame(results['benchmarks'])
+    if 'wall_time' not in records:
+        records['wall_time']=np.nan
+    table=records.pivot_table(index=['group', 'name'], columns='scale', values='wall_time', sort=False, dropna=False)
+    return table.reindex(columns=results['scales'])
+
+
+def save_benchmark_results(results,file_name):
+    '''
+    Save the results of run_benchmarks in a JSON file.
+    '''
+    with open(file_name, 'w') as file:
+        json.dump(results, file, indent=1)
+
+
+def load_benchmark_results(file_name):
+    '''
+    Load the results of run_benchmarks saved in a JSON file.
+    '''
+    with open(file_name) as file:
+        results=json.load(file)
+    results['catalog_rows']={int(scale): rows for scale, rows in results['catalog_rows'].items()}
+    return results
+
+
+def compare_benchmarks(results,baseline,threshold=REGRESSION_THRESHOLD,min_time=REGRESSION_MIN_TIME):
+    '''
+    Compare the wall times of the results of run_benchmarks with the ones of a baseline (the benchmarks run in both).
+
+    Parameters:
+    -----------
+    threshold : float, default to REGRESSION_THRESHOLD
+        A benchmark is a regression if its wall time is more than (1 + threshold) times the baseline one...
+    min_time : float, default to REGRESSION_MIN_TIME
+        ... and more than min_time seconds longer
+
+    Returns:
+    --------
+    comparison : pandas DataFrame
+        one row per benchmark and scale, with the columns 'group', 'name', 'scale', 'baseline', 'wall_time' (seconds),
+        'ratio' (wall_time / baseline) and 'regression' (boolean)
+    '''
+    columns=['group', 'name', 'scale', 'wall_time']
+    current=pd.DataFrame([record for record in results['benchmarks'] if record['status']=='ok'], columns=columns)
+    reference=pd.DataFrame([record for record in baseline['benchmarks'] if record['status']=='ok'], columns=columns)
+    comparison=current.merge(reference[['name', 'scale', 'wall_time']].rename(columns={'wall_time': 'baseline'}), on=['name', 'scale'])
+    comparison=comparison[['group', 'name', 'scale', 'baseline', 'wall_time']]
+    comparison['ratio']=comparison['wall_time']/comparison['baseline']
+    comparison['regression']=(comparison['ratio']>1+threshold) & (comparison['wall_time']-comparison['baseline']>min_time)
+    return comparison
+
+
+def print_comparison(comparison):
+    '''
+    Print the comparison of compare_benchmarks and the regressions, return True if there is no regression.
+    '''
+    print(comparison.to_string(index=False))
+    regressions=comparison[comparison['regression']]
+    if len(regressions)==0:
+        print('\nNo regression!')
+        return True
+    print(f'\n{len(regressions)} regressions:')
+    for _, row in regressions.iterrows():
+        print(f"\t{row['name']} (scale {row['scale']}): {row['baseline']:.4f} s -> {row['wall_time']:.4f} s ({row['ratio']:.2f}x)")
+    return False
+
+
+def test_compare_benchmarks():
+    '''
+    Test compare_benchmarks on results made up: the regressions are the benchmarks slower than the threshold and the minimum time.
+    '''
+    def results(times):
+        return {'benchmarks': [{'name': name, 'group': 'test', 'scale': scale, 'status': 'ok' if time is not None else 'skipped', 'wall_time': time}
+                               for (name, scale), time in times.items()]}
+
+    baseline=results({('a', 1): 1.0, ('a', 10): 10.0, ('b', 1): 0.001, ('c', 1): 1.0, ('c', 10): None})
+    current=results({('a', 1): 1.1, ('a', 10): 13.0, ('b', 1): 0.005, ('c', 1): 0.5, ('c', 10): 2.0})
+    comparison=compare_benchmarks(current, baseline, threshold=0.2, min_time=0.01)
+    assert list(zip(comparison['name'], comparison['scale']))==[('a', 1), ('a', 10), ('b', 1), ('c', 1)]
+    assert list(comparison['regression'])==[False, True, False, False]
+    assert np.allclose(comparison['ratio'], [1.1, 1.3, 5.0, 0.5])
+    print("All tests passed!")
+
+
+if __name__ == '__main__':
+    #Run the benchmarks and compare them with the baseline, if there is one
+    #(the first run is saved as the baseline, remove the file to make a new baseline)
+    RESULTS_PATH='Datasets/benchmark_results.json'
+    BASELINE_PATH='Datasets/benchmark_baseline.json'
+
+    results=run_benchmarks()
+    print()
+    print(benchmark_table(results).to_string())
+    save_benchmark_results(results, RESULTS_PATH)
+    if os.path.exists(BASELINE_PATH):
+        print()
+        print_comparison(compare_benchmarks(results, load_benchmark_results(BASELINE_PATH)))
+    else:
+        save_benchmark_results(results, BASELINE_PATH)
+        print('\nBaseline saved in', BASELINE_PATH)
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+'''
+This code compute bootstrap confidence intervals for the statistics of the delays
+(mean, median, quantiles) of subsets of events, which often contain only 10 to 40 events.
+
+The resampling is done at once with a (n_boot x n) matrix of random indexes,
+and the resamples can be split between the processes of a pool for large sweeps.
+The resamples are always drawn in BOOTSTRAP_CHUNKS chunks, each from its own random stream derived from the seed,
+so the intervals are the same whatever the number of processes.
+'''
+
+import contextlib
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from constants import EVENT_TYPES
+
+from subset_cache import cached_subset_positions
+
+#Default statistics: the mean, the median and the quartiles
+BOOTSTRAP_STATISTICS=('mean', 'median', 0.25, 0.75)
+
+#Number of chunks of resamples (one random stream per chunk), independent of the number of processes
+BOOTSTRAP_CHUNKS=16
+
+
+def _seed_sequence(seed):
+    '''
+    Return the seed as a numpy SeedSequence, from which independent random streams can be derived.
+    '''
+    return seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+
+
+def _sorted_quantile(sorted_values,quantile):
+    '''
+    Return the quantile of each row of a matrix whose rows are sorted (same linear interpolation as np.quantile).
+    '''
+    position=quantile*(sorted_values.shape[1]-1)
+    low=int(np.floor(position))
+    high=min(low+1, sorted_values.shape[1]-1)
+    return sorted_values[:, low] + (sorted_values[:, high]-sorted_values[:, low])*(position-low)
+
+
+def _resampled_statistics(values,n_boot,statistics,seed):
+    '''
+    Compute the statistics of n_boot resamples of the values.
+    Returns a (number of statistics x n_boot) array.
+    '''
+    rng=np.random.default_rng(seed)
+    resamples=values[rng.integers(0, len(values), size=(n_boot, len(values)))]
+
+    #The resamples are sorted once, the median and all the quantiles are then read in the sorted rows
+    if any(statistic!='mean' for statistic in statistics):
+        sorted_resamples=np.sort(resamples, axis=1)
+
+    results=np.empty((len(statistics), n_boot))
+    for k, statistic in enumerate(statistics):
+        if statistic=='mean':
+            results[k]=resamples.mean(axis=1)
+        else:
+            results[k]=_sorted_quantile(sorted_resamples, 0.5 if statistic=='median' else statistic)
+    return results
+
+
+def bootstrap_confidence_intervals(values,statistics=BOOTSTRAP_STATISTICS,n_boot=10000,confidence=0.95,seed=None,n_jobs=1,executor=None):
+    '''
+    Compute the bootstrap (percentile) confidence intervals of statistics of a sample.
+
+    Parameters:
+    -----------
+    values : numpy array of float
+        the sample (eg the delays of a subset of events), NaN values are ignored
+    statistics : list, default to BOOTSTRAP_STATISTICS
+        'mean', 'median' or a quantile (float between 0 and 1)
+    n_boot : int, default to 10000
+        the number of resamples
+    confidence : float, default to 0.95
+        the confidence level of the intervals
+    seed : int, default to None
+        the seed of the random generator, to get reproducible intervals
+    n_jobs : int, default to 1
+        the number of processes the resamples are split between (1 means no process pool),
+        it doesn't change the intervals
+    executor : concurrent.futures executor, default to None
+        a process pool to reuse between calls (see bootstrap_delays), instead of starting one for n_jobs>1
+
+    Returns:
+    --------
+    intervals : dict
+        {statistic: (value of the statistic on the sample, lower bound, upper bound)}
+        the bounds are NaN if the sample is empty
+    '''
+    values=np.asarray(values, dtype=float)
+    values=values[~np.isnan(values)]
+    statistics=list(statistics)
+
+    if len(values)==0:
+        return {statistic: (np.nan, np.nan, np.nan) for statistic in statistics}
+
+    #one independent random stream per chunk, derived from the seed
+    chunks=[(len(chunk), chunk_seed) for chunk, chunk_seed in zip(np.array_split(np.arange(n_boot), BOOTSTRAP_CHUNKS),
+                                                                  _seed_sequence(seed).spawn(BOOTSTRAP_CHUNKS)) if len(chunk)>0]
+    arguments=([values]*len(chunks), [size for size, _ in chunks], [statistics]*len(chunks), [chunk_seed for _, chunk_seed in chunks])
+    if executor is not None:
+        parts=list(executor.map(_resampled_statistics, *arguments))
+    elif n_jobs>1:
+        with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+            parts=list(pool.map(_resampled_statistics, *arguments))
+    else:
+        parts=list(map(_resampled_statistics, *arguments))
+    resampled=np.concatenate(parts, axis=1)
+
+    alpha=(1-confidence)/2
+    bounds=np.quantile(resampled, [alpha, 1-alpha], axis=1)
+
+    intervals={}
+    for k, statistic in enumerate(statistics):
+        if statistic=='mean':
+            sample=values.mean()
+        elif statistic=='median':
+            sample=np.median(values)
+        else:
+            sample=np.quantile(values, statistic)
+        intervals[statistic]=(sample, bounds[0, k], bounds[1, k])
+    return intervals
+
+
+def bootstrap_delays(df,delay,event_types=EVENT_TYPES,Event_longitude=None,Flare_magnitude=None,CDAW_speed=None,DONKI_speed=None,
+                     statistics=BOOTSTRAP_STATISTICS,n_boot=10000,confidence=0.95,seed=None,n_jobs=1,mask_index=None):
+    '''
+    Compute the bootstrap confidence intervals of the statistics of a delay (hours)
+    for the subset of events of each event type selected by the criteria (see subset_selection).
+
+    Parameters:
+    -----------
+    df : panda DataFrame
+        the dataframe containing all event information
+    delay : string
+        the delay (eg CME_TO_MAX)
+    event_types : list of string, default to EVENT_TYPES
+    Event_longitude, Flare_magnitude, CDAW_speed, DONKI_speed :
+        the selection criteria, same as subset_selection
+    statistics, n_boot, confidence, seed, n_jobs :
+        see bootstrap_confidence_intervals. With a seed, each event type gets its own random stream derived from it.
+        With n_jobs>1, one process pool is started for all the event types.
+    mask_index : dict, default to None
+        the mask index of df (see mask_index.build_mask_index)
+
+    Returns:
+    --------
+    intervals : dict
+        {event_type: {statistic: (value, lower bound, upper bound)}}
+    '''
+    seeds=_seed_sequence(seed).spawn(len(event_types))
+
+    intervals={}
+    with (ProcessPoolExecutor(max_workers=n_jobs) if n_jobs>1 else contextlib.nullcontext()) as executor:
+        for event_type, event_type_seed in zip(event_types, seeds):
+            positions=cached_subset_positions(df, event_type=event_type, Event_longitude=Event_longitude, Flare_magnitude=Flare_magnitude,
+                                              CDAW_speed=CDAW_speed, DONKI_speed=DONKI_speed, mask_index=mask_index)
+            values=df[event_type + delay].to_numpy(dtype=float)[positions]/60.0 #in hours
+            intervals[event_type]=bootstrap_confidence_intervals(values, statistics=statistics, n_boot=n_boot, confidence=confidence,
+                                                                 seed=event_type_seed, executor=executor)
+    return intervals
+
+
+def test_bootstrap_confidence_intervals(df=None,n_boot=2000):
+    '''
+    Test that the intervals of the same seed don't depend on the number of processes, nor on the reuse of a pool,
+    and that the interval of the mean of a normal sample is close to the one of the normal approximation.
+    If df is given, the intervals of its delays are tested with 1 and 2 processes too.
+    '''
+    from constants import CME_TO_MAX
+
+    values=np.random.default_rng(0).normal(10, 2, 40)
+    intervals=bootstrap_confidence_intervals(values, n_boot=n_boot, seed=1)
+    assert intervals==bootstrap_confidence_intervals(values, n_boot=n_boot, seed=1, n_jobs=2)
+    with ProcessPoolExecutor(max_workers=2) as executor:
+        assert intervals==bootstrap_confidence_intervals(values, n_boot=n_boot, seed=1, executor=executor)
+    assert intervals!=bootstrap_confidence_intervals(values, n_boot=n_boot, seed=2)
+
+    mean,low,high=intervals['mean']
+    half_width=1.96*values.std()/np.sqrt(len(values))
+    assert low<mean<high and abs((high-low)/2-half_width)<0.2*half_width
+    assert all(np.isnan(bound) for bound in bootstrap_confidence_intervals([np.nan], seed=1)['median'])
+
+    if df is not None:
+        assert bootstrap_delays(df, CME_TO_MAX, n_boot=n_boot, seed=3)==bootstrap_delays(df, CME_TO_MAX, n_boot=n_boot, seed=3, n_jobs=2)
+    print("All tests passed!")
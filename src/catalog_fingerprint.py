@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+'''
+This code build a fingerprint index of a SEP event catalog file (CLEAR dataset),
+so that two versions of the catalog can be compared without loading and diffing both files.
+
+The index is a small Merkle tree:
+    block hashes  : one hash per (column, block of FINGERPRINT_BLOCK_SIZE rows)
+    column hashes : hash of all the block hashes of a column
+    group hashes  : hash of all the column hashes of an event type block (TC_10, ..., AB_100)
+                    or of the other parameters (flare, CME, radio...)
+    root hash     : hash of all the group hashes
+
+Comparing two indexes only goes down the tree where the hashes differ,
+so "did anything change in the AB_100 block" or "which columns changed" is answered with a few hash comparisons.
+
+It also provides the fingerprint of a dataframe already in memory (eg the prepared dataset),
+used to know if a result computed from a dataframe is still valid.
+'''
+
+import hashlib
+import json
+import os
+
+import pandas as pd
+
+from constants import EVENT_TYPES
+
+#Number of rows hashed together in one block
+FINGERPRINT_BLOCK_SIZE=100
+
+#Name of the group containing all the columns that do not depend on the event type
+OTHER_PARAMETERS='Other parameters'
+
+
+def column_group(column):
+    '''
+    Return the group of a column in the fingerprint index:
+    the event type (eg '>10.0 MeV 10.0 pfu ') if the column belongs to an event type block,
+    OTHER_PARAMETERS otherwise.
+
+    Parameters:
+    -----------
+    column : string
+        the name of the column
+
+    Returns:
+    --------
+    group : string
+        the group of the column
+    '''
+    for event_type in EVENT_TYPES:
+        if column.startswith(event_type):
+            return event_type
+    return OTHER_PARAMETERS
+
+
+def _hash_hashes(hashes):
+    '''
+    Combine a list of hexadecimal hashes into one hash (a node of the Merkle tree).
+    '''
+    return hashlib.sha1(''.join(hashes).encode('ascii')).hexdigest()
+
+
+def _hash_block(values):
+    '''
+    Hash a block of raw (string) values of one column.
+    The position of each value in the block is taken into account.
+    '''
+    row_hashes = pd.util.hash_pandas_object(values, index=False).values
+    return hashlib.sha1(row_hashes.tobytes()).hexdigest()
+
+
+def build_fingerprint_index(file_name,block_size=FINGERPRINT_BLOCK_SIZE):
+    '''
+    Build the fingerprint index of a catalog file.
+    The file is read by chunks of block_size rows, so the whole catalog is never held in memory.
+    The values are hashed as raw strings, so a change of formatting is detected as a change.
+
+    Parameters:
+    -----------
+    file_name : string
+        the path of the catalog csv file
+    block_size : int, default to FINGERPRINT_BLOCK_SIZE
+        the number of rows hashed together in one block
+
+    Returns:
+    --------
+    index : dict
+        the fingerprint index, a json-serializable dictionary with the keys
+        'file', 'block_size', 'n_rows', 'columns', 'blocks', 'row_blocks', 'column_hashes', 'group_hashes', 'root'
+    '''
+    columns=None
+    blocks={}
+    row_blocks=[]
+    n_rows=0
+
+    for chunk in pd.read_csv(file_name, chunksize=block_size, dtype=str, keep_default_na=False):
+        if columns is None:
+            columns=list(chunk.columns)
+            blocks={column: [] for column in columns}
+
+        chunk_hashes=[_hash_block(chunk[column]) for column in columns]
+        for column, block_hash in zip(columns, chunk_hashes):
+            blocks[column].append(block_hash)
+
+        #Hash of the block of rows over all columns, to know which rows changed
+        row_blocks.append(_hash_hashes(chunk_hashes))
+        n_rows+=len(chunk)
+
+    if columns is None: #Empty file (header only)
+        columns=list(pd.read_csv(file_name, nrows=0).columns)
+        blocks={column: [] for column in columns}
+
+    column_hashes={column: _hash_hashes(blocks[column]) for column in columns}
+
+    group_hashes={}
+    for group in EVENT_TYPES + [OTHER_PARAMETERS]:
+        group_columns=[column for column in columns if column_group(column)==group]
+        if group_columns:
+            #The column names are part of the hash, so a renamed column changes the group hash
+            group_hashes[group]=_hash_hashes([hashlib.sha1(column.encode('utf-8')).hexdigest() + column_hashes[column]
+                                              for column in group_columns])
+
+    index={
+        'file': os.path.basename(file_name),
+        'block_size': block_size,
+        'n_rows': n_rows,
+        'columns': columns,
+        'blocks': blocks,
+        'row_blocks': row_blocks,
+        'column_hashes': column_hashes,
+        'group_hashes': group_hashes,
+        'root': _hash_hashes([group_hashes[group] for group in group_hashes]),
+    }
+    return index
+
+
+def save_fingerprint_index(index,index_file):
+    '''
+    Save a fingerprint index to a json file.
+    '''
+    with open(index_file, 'w', encoding='utf-8') as file:
+        json.dump(index, file)
+
+
+def load_fingerprint_index(index_file):
+    '''
+    Load a fingerprint index from a json file.
+    '''
+    with open(index_file, 'r', encoding='utf-8') as file:
+        return json.load(file)
+
+
+def load_generate_fingerprint_index(file_name,block_size=FINGERPRINT_BLOCK_SIZE,force=False):
+    '''
+    Load the fingerprint index of a catalog file, or build it if it doesn't exist yet.
+    The index is saved next to the catalog file ('<file_name>.fingerprint.json'),
+    and it is rebuilt if the catalog file is more recent than the index, or if the block size differs.
+
+    Parameters:
+    -----------
+    file_name : string
+        the path of the catalog csv file
+    block_size : int, default to FINGERPRINT_BLOCK_SIZE
+        the number of rows hashed together in one block
+    force : boolean, default to False
+        if True, the index is rebuilt even if it is up to date
+
+    Returns:
+    --------
+    index : dict
+        the fingerprint index of the catalog file
+    '''
+    index_file=file_name + '.fingerprint.json'
+
+    if not force and os.path.exists(index_file) and os.path.getmtime(index_file) >= os.path.getmtime(file_name):
+        index=load_fingerprint_index(index_file)
+        if index['block_size']==block_size:
+            return index
+
+    index=build_fingerprint_index(file_name, block_size=block_size)
+    save_fingerprint_index(index, index_file)
+    return index
+
+
+def compare_fingerprint_indexes(index1,index2):
+    '''
+    Compare two fingerprint indexes, going down the Merkle tree only where the hashes differ.
+
+    Parameters:
+    -----------
+    index1 : dict
+        the fingerprint index of the first catalog
+    index2 : dict
+        the fingerprint index of the second catalog
+
+    Returns:
+    --------
+    differences : dict
+        'identical' : boolean, True if the two catalogs have the same content
+        'changed_groups' : list of the groups (event types or OTHER_PARAMETERS) that changed
+        'changed_columns' : list of the columns present in both catalogs whose content changed
+        'changed_blocks' : dict {column: list of the block numbers that changed}
+        'added_columns' / 'removed_columns' : columns only in the second / first catalog
+        'changed_rows' : list of (first row, last row) of the blocks of rows that changed
+    '''
+    assert index1['block_size']==index2['block_size'], \
+        f"The two indexes must have the same block size ({index1['block_size']} != {index2['block_size']})"
+
+    differences={
+        'identical': index1['root']==index2['root'],
+        'changed_groups': [],
+        'changed_columns': [],
+        'changed_blocks': {},
+        'added_columns': [column for column in index2['columns'] if column not in index1['column_hashes']],
+        'removed_columns': [column for column in index1['columns'] if column not in index2['column_hashes']],
+        'changed_rows': [],
+    }
+    if differences['identical']:
+        return differences
+
+    groups=list(dict.fromkeys(list(index1['group_hashes']) + list(index2['group_hashes'])))
+    differences['changed_groups']=[group for group in groups
+                                   if index1['group_hashes'].get(group)!=index2['group_hashes'].get(group)]
+
+    for column in index1['columns']:
+        if column not in index2['column_hashes'] or column_group(column) not in differences['changed_groups']:
+            continue
+        if index1['column_hashes'][column]==index2['column_hashes'][column]:
+            continue
+
+        differences['changed_columns'].append(column)
+        blocks1=index1['blocks'][column]
+        blocks2=index2['blocks'][column]
+        differences['changed_blocks'][column]=[k for k in range(max(len(blocks1), len(blocks2)))
+                                               if k>=len(blocks1) or k>=len(blocks2) or blocks1[k]!=blocks2[k]]
+
+    block_size=index1['block_size']
+    n_rows=max(index1['n_rows'], index2['n_rows'])
+    row_blocks1=index1['row_blocks']
+    row_blocks2=index2['row_blocks']
+    for k in range(max(len(row_blocks1), len(row_blocks2))):
+        if k>=len(row_blocks1) or k>=len(row_blocks2) or row_blocks1[k]!=row_blocks2[k]:
+            differences['changed_rows'].append((k*block_size, min((k+1)*block_size, n_rows)-1))
+
+    return differences
+
+
+def group_has_changed(index1,index2,group):
+    '''
+    Return True if anything changed in a group of columns between two catalogs,
+    only comparing the group hashes.
+
+    Parameters:
+    -----------
+    index1 : dict
+        the fingerprint index of the first catalog
+    index2 : dict
+        the fingerprint index of the second catalog
+    group : string
+        an event type (eg AB_100) or OTHER_PARAMETERS
+
+    Returns:
+    --------
+    changed : boolean
+    '''
+    return index1['group_hashes'].get(group)!=index2['group_hashes'].get(group)
+
+
+def test_compare_fingerprint_indexes(n_rows=250,block_size=100):
+    '''
+    Compare the fingerprint indexes of a catalog written in a temporary directory and of modified versions of it:
+    one cell changed, one column renamed, rows appended. Check that load_generate_fingerprint_index
+    reuses the saved index, and builds it again when the catalog file is more recent.
+    '''
+    import tempfile
+    import numpy as np
+    from constants import TC_10, AB_10
+
+    columns=['Time Period Start', 'Flare Magnitude', TC_10 + 'SEP Start Time', AB_10 + 'Max Flux (pfu)']
+    df=pd.DataFrame({column: [f'{column[:4]}{k}' for k in range(n_rows)] for column in columns})
+
+    with tempfile.TemporaryDirectory() as directory:
+        file_name=os.path.join(directory, 'catalog.csv')
+        df.to_csv(file_name, index=False)
+        index=build_fingerprint_index(file_name, block_size=block_size)
+        assert index['n_rows']==n_rows and len(index['row_blocks'])==int(np.ceil(n_rows/block_size))
+        assert compare_fingerprint_indexes(index, index)['identical']
+
+        #one cell changed
+        changed=df.copy()
+        changed.loc[150, TC_10 + 'SEP Start Time']='2000-01-01 00:00:00'
+        changed.to_csv(file_name, index=False)
+        differences=compare_fingerprint_indexes(index, build_fingerprint_index(file_name, block_size=block_size))
+        assert not differences['identical']
+        assert differences['changed_groups']==[TC_10]
+        assert differences['changed_columns']==[TC_10 + 'SEP Start Time']
+        assert differences['changed_blocks']=={TC_10 + 'SEP Start Time': [1]}
+        assert differences['changed_rows']==[(100, 199)]
+        assert not differences['added_columns'] and not differences['removed_columns']
+        assert group_has_changed(index, build_fingerprint_index(file_name, block_size=block_size), TC_10)
+        assert not group_has_changed(index, build_fingerprint_index(file_name, block_size=block_size), AB_10)
+
+        #one column renamed: the content is the same, only the other parameters group changed
+        df.rename(columns={'Flare Magnitude': 'Flare Class'}).to_csv(file_name, index=False)
+        differences=compare_fingerprint_indexes(index, build_fingerprint_index(file_name, block_size=block_size))
+        assert differences['changed_groups']==[OTHER_PARAMETERS]
+        assert differences['added_columns']==['Flare Class'] and differences['removed_columns']==['Flare Magnitude']
+        assert differences['changed_columns']==[] and differences['changed_rows']==[]
+
+        #rows appended: the last block of every column changed, and a new block of rows
+        appended=pd.concat([df, df.iloc[:60]], ignore_index=True)
+        appended.to_csv(file_name, index=False)
+        differences=compare_fingerprint_indexes(index, build_fingerprint_index(file_name, block_size=block_size))
+        assert differences['changed_columns']==columns
+        assert all(blocks==[2, 3] for blocks in differences['changed_blocks'].values())
+        assert differences['changed_rows']==[(200, 299), (300, n_rows+59)]
+
+        #the saved index is reused, and built again when the catalog file is more recent
+        df.to_csv(file_name, index=False)
+        index_file=file_name + '.fingerprint.json'
+        saved=load_generate_fingerprint_index(file_name, block_size=block_size)
+        assert saved['root']==index['root'] and os.path.exists(index_file)
+        saved_time=os.stat(index_file).st_mtime_ns
+        assert load_generate_fingerprint_index(file_name, block_size=block_size)['root']==index['root']
+        assert os.stat(index_file).st_mtime_ns==saved_time
+        changed.to_csv(file_name, index=False)
+        os.utime(file_name, ns=(saved_time + 10**9, saved_time + 10**9))
+        rebuilt=load_generate_fingerprint_index(file_name, block_size=block_size)
+        assert rebuilt['root']!=index['root'] and os.stat(index_file).st_mtime_ns!=saved_time
+    print("All tests passed!")
+
+
+def dataframe_fingerprint(df):
+    '''
+    Return the fingerprint of a dataframe in memory: a hash of its column names, its index and its values.
+
+    Parameters:
+    -----------
+    df : panda DataFrame
+        the dataframe to fingerprint
+
+    Returns:
+    --------
+    fingerprint : string
+        the hexadecimal hash of the dataframe
+    '''
+    row_hashes=pd.util.hash_pandas_object(df, index=True).values
+    column_hashes=pd.util.hash_pandas_object(pd.Series([str(column) for column in df.columns]), index=False).values
+    return hashlib.sha1(column_hashes.tobytes() + row_hashes.tobytes()).hexdigest()
@@ -13,6 +13,12 @@ AB_100='>100.0 MeV 1e-06 pfu '
 
 EVENT_TYPES=[TC_10, TC_30, TC_50, TC_100, AB_10, AB_30, AB_50, AB_100]
 
+#Energy channel (MeV) and flux threshold (pfu) of each event type.
+#The TC (Threshold Crossing) thresholds are on the flux, the AB (Above Background) thresholds on the flux above the background
+ENERGY_CHANNELS={TC_10: 10.0, TC_30: 30.0, TC_50: 50.0, TC_100: 100.0, AB_10: 10.0, AB_30: 30.0, AB_50: 50.0, AB_100: 100.0}
+FLUX_THRESHOLDS={TC_10: 10.0, TC_30: 1.0, TC_50: 1.0, TC_100: 1.0, AB_10: 1e-06, AB_30: 1e-06, AB_50: 1e-06, AB_100: 1e-06}
+ABOVE_BACKGROUND=[AB_10, AB_30, AB_50, AB_100]
+
 #Event longitude selection
 #In this configuration, if the longitude is 0°, the event is considered to be Eastern and Western, It is counted twice
 EASTERN=(-180,0)
@@ -34,4 +40,15 @@ SEP_TO_PEAK='Rise Time to Onset (minutes)'
 
 FLARE_TO_MAX='Flare Time to Max (minutes)'
 CME_TO_MAX='CME Time to Max (minutes)'
-SEP_TO_MAX='Rise Time to Max (minutes)'
\ No newline at end of file
+SEP_TO_MAX='Rise Time to Max (minutes)'
+
+#Fixed edges of the bins of the histograms of each delay (hours), shared by all the event types and selections
+#so that the histograms can be compared and summed. The delays out of the edges are not in the histograms.
+DELAY_BIN_EDGES={
+    CME_TO_MAX: [2.0*k for k in range(85)],             #0h to 168h, 2h bins
+    FLARE_TO_MAX: [2.0*k for k in range(85)],
+    SEP_TO_MAX: [2.0*k for k in range(85)],
+    CME_TO_PEAK: [-12.0+2.0*k for k in range(55)],      #-12h to 96h, 2h bins
+    FLARE_TO_PEAK: [-12.0+2.0*k for k in range(55)],
+    SEP_TO_PEAK: [-12.0+1.0*k for k in range(37)],      #-12h to 24h, 1h bins
+}
@@ -90,25 +90,24 @@ import numpy as np
 from constants import TC_10, TC_30, TC_50, TC_100, AB_10, AB_30, AB_50, AB_100, EVENT_TYPES
 from constants import EASTERN, WESTERN, TIME_FLARE, TIME_CME, TIME_PEAK, TIME_MAX, TIME_SEP
 
-plt.style.use('seaborn-darkgrid')
+from catalog_fingerprint import load_generate_fingerprint_index, compare_fingerprint_indexes, column_group
+
+plt.style.use('seaborn-v0_8-darkgrid')
 
 
 #First dataset
 file_name1='GOES-06_integral_enhance_idsep.1986-01-01.1994-11-30_sep_events_CA.csv'
 file_path1='../dataset_comparison/'
-df_CA = pd.read_csv(file_path1+file_name1)
 
 
 #Second dataset
 file_name2='GOES-06_integral_enhance_idsep.1986-01-01.1994-11-30_sep_events_CC.csv'
 file_path2='../dataset_comparison/'
-df_CC = pd.read_csv(file_path2+file_name2)
 
 
 #Second dataset
 file_name3='GOES-06_integral_enhance_idsep.1986-01-01.1994-11-30_sep_events_KW.csv'
 file_path3='../dataset_comparison/'
-df_KW = pd.read_csv(file_path3+file_name3)
 
 def test_dataframe_format(df1,name1,df2,name2):
 
@@ -247,13 +246,76 @@ def test_columns_print_errors(df1,name1,df2,name2):
     print(f'\nThe datasets {name1} and {name2} are the same!')
 
 
-#Test Campaign:
+def test_fingerprints_print_errors(index1,name1,index2,name2):
+    '''
+    This function test if two catalog files have the same data, using their fingerprint indexes
+    (see catalog_fingerprint.py), so that none of the two catalogs has to be loaded in memory.
+    It prints the groups of columns (event types, other parameters), the columns and the rows that changed.
+    At the end, an assertion is raised if the two catalogs are not the same.
+
+    Parameters:
+    -----------
+    index1: dict
+        Fingerprint index of the first catalog
+    name1: str
+        Name of the first catalog (for printing purposes)
+    index2: dict
+        Fingerprint index of the second catalog
+    name2: str
+        Name of the second catalog (for printing purposes)
+    -----------
+    Returns:
+    differences: dict
+        The differences found by compare_fingerprint_indexes
+    '''
+    print(f'\nTesting if the dataset {name1} is the same as the dataset {name2} (fingerprints)...')
+
+    differences=compare_fingerprint_indexes(index1,index2)
+
+    for column in differences['removed_columns']:
+        print(f'\tThe column "{column}" of the dataset {name1} is missing in the dataset {name2}')
+    for column in differences['added_columns']:
+        print(f'\tThe column "{column}" of the dataset {name2} is missing in the dataset {name1}')
+
+    for group in differences['changed_groups']:
+        print(f'\nThe block "{group}" doesn\'t match...')
+        for column in differences['changed_columns']:
+            if column_group(column)==group:
+                block_size=index1['block_size']
+                rows=[f'{k*block_size}-{(k+1)*block_size-1}' for k in differences['changed_blocks'][column]]
+                print(f'\tThe column "{column}" changed in the lines {", ".join(rows)}')
+
+    assert differences['identical'] and not differences['added_columns'] and not differences['removed_columns'], \
+        f'The datasets {name1} and {name2} are not the same. All the differences are listed above'
+    print(f'\nThe datasets {name1} and {name2} are the same!')
+
+    return differences
+
+
+if __name__ == '__main__':
+    #Test Campaign:
+
+    #Quick comparison of the fingerprints, without loading the datasets
+    index_CA = load_generate_fingerprint_index(file_path1+file_name1)
+    index_CC = load_generate_fingerprint_index(file_path2+file_name2)
+    index_KW = load_generate_fingerprint_index(file_path3+file_name3)
+
+    for (index1,name1),(index2,name2) in [((index_CC,'CC'),(index_CA,'CA')),((index_CC,'CC'),(index_KW,'KW')),((index_KW,'KW'),(index_CA,'CA'))]:
+        try:
+            test_fingerprints_print_errors(index1,name1,index2,name2)
+        except AssertionError as error:
+            print(error)
+
+    #Detailed comparison, value by value
+    df_CA = pd.read_csv(file_path1+file_name1)
+    df_CC = pd.read_csv(file_path2+file_name2)
+    df_KW = pd.read_csv(file_path3+file_name3)
 
-test_dataframe_format(df_CC,'CC',df_CA,'CA')
-test_columns_print_errors(df_CC,'CC',df_CA,'CA')
+    test_dataframe_format(df_CC,'CC',df_CA,'CA')
+    test_columns_print_errors(df_CC,'CC',df_CA,'CA')
 
-test_dataframe_format(df_CC,'CC',df_KW,'KW')
-test_columns_print_errors(df_CC,'CC',df_KW,'KW')
+    test_dataframe_format(df_CC,'CC',df_KW,'KW')
+    test_columns_print_errors(df_CC,'CC',df_KW,'KW')
 
-test_dataframe_format(df_KW,'KW',df_CA,'CA')
-test_columns_print_errors(df_KW,'KW',df_CA,'CA')
\ No newline at end of file
+    test_dataframe_format(df_KW,'KW',df_CA,'CA')
+    test_columns_print_errors(df_KW,'KW',df_CA,'CA')
\ No newline at end of file
@@ -511,7 +511,7 @@ def print_differences_btwn_TC_AB(df,column_name):
 
 def test_in_progress(df):
 
-    from work import plot_flux_time_series
+    from plots import plot_flux_grid
     
     #investigation on the falre_to_max and cme_to_max negative delays
     #Why sep_to_max > 0
@@ -524,6 +524,7 @@ def test_in_progress(df):
     #309-357 : GOES-11
     
 
+    events=[]
     for nb, index in enumerate(indexes):
         print(f"Testing index {index}...")
         row=df.iloc[index]
@@ -532,7 +533,9 @@ def test_in_progress(df):
         print(f"\t file {row[flux_type + 'Flux Time Series']}:")
         print(f"\t \t SEP start time: {row[flux_type + TIME_SEP]}")
         print(f"\t \t Onset peak time: {row[flux_type + TIME_PEAK]}")
-        plot_flux_time_series('../output/opsep/GOES-08_integral_enhance_idsep/',row,flux_type)
+        events.append((row, flux_type))
         #print(f"\t \t Max Flux Time: {   row[TC_100 + TIME_MAX]}")
         #print(f"\t \t Flare Xray Peak Time: {row[TIME_FLARE]}")
-        #print(f"\t \t CME CDAW First Look Time: {row[TIME_CME]}")
\ No newline at end of file
+        #print(f"\t \t CME CDAW First Look Time: {row[TIME_CME]}")
+    #All the suspect events in one figure
+    plot_flux_grid('../output/opsep/GOES-08_integral_enhance_idsep/', events, ncols=4)
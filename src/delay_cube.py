@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+'''
+This code compute the statistics of all the delays (count, mean, median, std, quantiles)
+grouped at once over event type x longitude sector x flare class x CME speed bin x spacecraft.
+
+All the delays of all the event types are put in one long-format table (one row per event, event type and delay),
+with the dimensions of each event, and the statistics of every cell of the cube are computed with a single groupby.
+The level 'all' of a dimension means no selection on this dimension (margins of the cube).
+The longitude sectors are closed ranges, as in subset_selection: an event on the bound of two sectors
+(eg at 0 degree for EASTERN and WESTERN) is in both, and it is counted once in the level 'all'.
+The cube is cached on disk next to the cached dataset.
+'''
+
+import itertools
+import os
+import pickle
+
+import numpy as np
+import pandas as pd
+
+from constants import EVENT_TYPES, EASTERN, WESTERN
+
+from catalog_fingerprint import dataframe_fingerprint
+from delay_sweep import DELAYS
+
+#Longitude sectors (degrees), closed ranges as in subset_selection
+LONGITUDE_SECTORS=[EASTERN, WESTERN]
+LONGITUDE_SECTOR_LABELS=['EASTERN', 'WESTERN']
+
+#Edges of the longitude sectors (degrees), the buckets of the histogram cube
+LONGITUDE_SECTOR_EDGES=[EASTERN[0], EASTERN[1], WESTERN[1]]
+
+#Flare classes, from the flare magnitude (W/m^2)
+FLARE_CLASS_EDGES=[0, 1e-7, 1e-6, 1e-5, 1e-4, np.inf]
+FLARE_CLASS_LABELS=['A', 'B', 'C', 'M', 'X']
+
+#Edges of the CDAW CME speed bins (km/s)
+CME_SPEED_EDGES=[0, 500, 1000, 1500, 2000, np.inf]
+
+#Dimensions of the cube (in addition to the event type and the delay)
+CUBE_DIMENSIONS=['longitude_sector', 'flare_class', 'cme_speed', 'spacecraft']
+
+#Level of a dimension for the events whose value is unknown, and level meaning no selection on a dimension
+UNKNOWN='unknown'
+ALL='all'
+
+DELAY_CUBE_PATH="Datasets/my_dataset_delay_cube.pkl"
+
+
+def _bin_labels(edges):
+    '''
+    Return the labels of bins defined by their edges, eg [0, 500, inf] -> ['0-500', '>=500'].
+    '''
+    labels=[]
+    for low, high in zip(edges[:-1], edges[1:]):
+        labels.append(f'>={low:g}' if np.isinf(high) else f'{low:g}-{high:g}')
+    return labels
+
+
+def _bin_column(values,edges,labels):
+    '''
+    Return the label of the bin [edge_k; edge_k+1[ of each value (the last bin includes its right edge),
+    and UNKNOWN for the unknown values or the values out of the edges.
+    '''
+    values=np.asarray(values, dtype=float)
+    bins=np.searchsorted(edges, values, side='right')-1
+    bins[values==edges[-1]]=len(labels)-1
+    known=~np.isnan(values) & (values>=edges[0]) & (values<=edges[-1])
+    return np.where(known, np.asarray(labels, dtype=object)[np.clip(bins, 0, len(labels)-1)], UNKNOWN)
+
+
+def assign_dimensions(df,longitude_sectors=LONGITUDE_SECTORS,longitude_labels=LONGITUDE_SECTOR_LABELS,
+                      flare_edges=FLARE_CLASS_EDGES,flare_labels=FLARE_CLASS_LABELS,speed_edges=CME_SPEED_EDGES):
+    '''
+    Return the level of each dimension of the cube for every event:
+    the longitude sector, the flare class (from the flare magnitude), the CDAW CME speed bin and the spacecraft.
+
+    Parameters:
+    -----------
+    df : panda DataFrame
+        the dataframe containing all event information (with a unique index)
+    longitude_sectors, longitude_labels : list
+        the longitude ranges (closed, as in subset_selection) and labels of the longitude sectors (finer sectors can be given)
+    flare_edges, flare_labels : list
+        the edges and labels of the flare classes
+    speed_edges : list
+        the edges of the CME speed bins
+
+    Returns:
+    --------
+    dimensions : pandas DataFrame
+        indexed by the index of df, with the columns of CUBE_DIMENSIONS: one row per event and longitude sector
+        containing its longitude (an event on the bound of two sectors has 2 rows), UNKNOWN if it is in no sector
+    '''
+    longitude=df['Event Longitude'].to_numpy(dtype=float)
+    in_sector=np.column_stack([(longitude>=low) & (longitude<=high) for low, high in longitude_sectors])
+    in_sector=np.column_stack([in_sector, ~in_sector.any(axis=1)])
+    positions,sectors=np.nonzero(in_sector)
+    sector_labels=np.asarray(list(longitude_labels) + [UNKNOWN], dtype=object)
+
+    return pd.DataFrame({
+        'longitude_sector': sector_labels[sectors],
+        'flare_class': _bin_column(df['Flare Magnitude'], flare_edges, flare_labels)[positions],
+        'cme_speed': _bin_column(df['CDAW CME Speed'], speed_edges, _bin_labels(speed_edges))[positions],
+        'spacecraft': df['Experiment'].fillna(UNKNOWN).to_numpy(dtype=object)[positions],
+    }, index=df.index[positions])
+
+
+def long_format_delays(df,event_types=EVENT_TYPES,delays=DELAYS,dimensions=None):
+    '''
+    Return all the known delays in a long-format table:
+    one row per (event, event type, delay) and per row of the event in the dimensions (see assign_dimensions),
+    with the columns 'event' (position of the event in df), 'event_type', 'delay', 'value' (hours) and the dimensions of the event.
+    '''
+    if dimensions is None:
+        dimensions=assign_dimensions(df)
+
+    columns=[(event_type, delay) for event_type in event_types for delay in delays]
+    values=np.column_stack([df[event_type + delay].to_numpy(dtype=float) for event_type, delay in columns])/60.0 #in hours
+
+    #values is (events x columns), it is flattened event by event
+    known=~np.isnan(values)
+    event_positions,column_positions=np.nonzero(known)
+
+    long_table=pd.DataFrame({
+        'event': event_positions,
+        'event_type': np.array([event_type for event_type, _ in columns], dtype=object)[column_positions],
+        'delay': np.array([delay for _, delay in columns], dtype=object)[column_positions],
+        'value': values[known],
+    })
+    dimensions=dimensions.assign(event=df.index.get_indexer(dimensions.index)).reset_index(drop=True)
+    return long_table.merge(dimensions, on='event', how='inner')
+
+
+def compute_delay_cube(df,event_types=EVENT_TYPES,delays=DELAYS,quantiles=(0.1,0.25,0.75,0.9),margins=True,dimensions=None):
+    '''
+    Compute the statistics of the delays for every cell of the cube
+    event type x delay x longitude sector x flare class x CME speed bin x spacecraft.
+
+    Parameters:
+    -----------
+    df : panda DataFrame
+        the dataframe containing all event information
+    event_types : list of string, default to EVENT_TYPES
+    delays : list of string, default to all the delays (CME_TO_MAX, ...)
+    quantiles : list of float, default to (0.1,0.25,0.75,0.9)
+        the quantiles computed in addition to the median
+    margins : boolean, default to True
+        if True, the cube also contains the level ALL of each dimension (no selection on this dimension)
+    dimensions : pandas DataFrame, default to None
+        the dimensions of the events, see assign_dimensions (to use finer longitude sectors for example)
+
+    Returns:
+    --------
+    cube : pandas DataFrame
+        indexed by ('event_type', 'delay', 'longitude_sector', 'flare_class', 'cme_speed', 'spacecraft'),
+        with the columns 'count', 'mean', 'median', 'std' (same as np.std) and 'q<quantile>' (hours)
+    '''
+    long_table=long_format_delays(df, event_types=event_types, delays=delays, dimensions=dimensions)
+
+    if margins:
+        #one copy of the table for each set of dimensions replaced by ALL
+        tables=[]
+        for replaced in itertools.product([False, True], repeat=len(CUBE_DIMENSIONS)):
+            table=long_table.copy() if any(replaced) else long_table
+            if replaced[CUBE_DIMENSIONS.index('longitude_sector')]:
+                #an event in 2 longitude sectors is counted once without selection on the longitude
+                table=table.drop_duplicates(subset=['event', 'event_type', 'delay'])
+            for dimension, is_replaced in zip(CUBE_DIMENSIONS, replaced):
+                if is_replaced:
+                    table[dimension]=ALL
+            tables.append(table)
+        long_table=pd.concat(tables, ignore_index=True)
+
+    grouped=long_table.groupby(['event_type', 'delay'] + CUBE_DIMENSIONS, sort=True)['value']
+
+    cube=pd.DataFrame({
+        'count': grouped.count(),
+        'mean': grouped.mean(),
+        'median': grouped.median(),
+        'std': grouped.std(ddof=0),
+    })
+    if len(quantiles)>0:
+        quantile_values=grouped.quantile(list(quantiles)).unstack()
+        for quantile in quantiles:
+            cube[f'q{quantile:g}']=quantile_values[quantile]
+
+    return cube
+
+
+def cube_cell(cube,event_type,delay,longitude_sector=ALL,flare_class=ALL,cme_speed=ALL,spacecraft=ALL):
+    '''
+    Return the statistics of one cell of the cube (a pandas Series), ALL meaning no selection on a dimension.
+    '''
+    return cube.loc[(event_type, delay, longitude_sector, flare_class, cme_speed, spacecraft)]
+
+
+def load_generate_delay_cube(df,force=False,cache_file=DELAY_CUBE_PATH,**parameters):
+    '''
+    This function either loads the delay cube from its cache file,
+    or computes it with compute_delay_cube and saves it.
+    The cube is computed again if the dataframe (its fingerprint) or the parameters changed
+    (the parameters are those of compute_delay_cube, the dimensions are compared by their fingerprint).
+    '''
+    fingerprint=dataframe_fingerprint(df)
+    dimensions=parameters.pop('dimensions', None)
+    dimensions_fingerprint=None if dimensions is None else dataframe_fingerprint(dimensions)
+
+    if not force and os.path.exists(cache_file):
+        with open(cache_file, 'rb') as file:
+            cached=pickle.load(file)
+        if cached['fingerprint']==fingerprint and cached['parameters']==parameters \
+                and cached.get('dimensions')==dimensions_fingerprint:
+            return cached['cube']
+
+    cube=compute_delay_cube(df, dimensions=dimensions, **parameters)
+    with open(cache_file, 'wb') as file:
+        pickle.dump({'fingerprint': fingerprint, 'parameters': parameters, 'dimensions': dimensions_fingerprint, 'cube': cube}, file)
+    return cube
+
+
+def test_delay_cube(df):
+    '''
+    Test that the cells of the cube are the statistics of the events selected by subset_selection
+    (an event at 0 degree is in both longitude sectors, and counted once in the level ALL),
+    and that the cache is reused with custom dimensions, and recomputed when they change.
+    '''
+    import tempfile
+    from constants import TC_10, CME_TO_MAX
+
+    cube=compute_delay_cube(df, event_types=[TC_10], delays=[CME_TO_MAX])
+    for sector, label in [(None, ALL)] + list(zip(LONGITUDE_SECTORS, LONGITUDE_SECTOR_LABELS)):
+        selected=df[df[TC_10 + 'SEP Start Time'].notnull()]
+        if sector is not None:
+            selected=selected[selected['Event Longitude'].between(*sector)]
+        delays=selected[TC_10 + CME_TO_MAX].dropna().to_numpy(dtype=float)/60.0
+        cell=cube_cell(cube, TC_10, CME_TO_MAX, longitude_sector=label)
+        assert cell['count']==len(delays) and np.isclose(cell['mean'], delays.mean()) and np.isclose(cell['median'], np.median(delays)), label
+
+    finer=assign_dimensions(df, longitude_sectors=[(-180, -45), (-45, 0), (0, 45), (45, 180)], longitude_labels=['E', 'CE', 'CW', 'W'])
+    with tempfile.TemporaryDirectory() as directory:
+        cache_file=os.path.join(directory, 'delay_cube.pkl')
+        for _ in range(2):
+            cube=load_generate_delay_cube(df, cache_file=cache_file, event_types=[TC_10], delays=[CME_TO_MAX], dimensions=finer)
+            assert set(cube.index.get_level_values('longitude_sector'))<={'E', 'CE', 'CW', 'W', UNKNOWN, ALL}
+        cube=load_generate_delay_cube(df, cache_file=cache_file, event_types=[TC_10], delays=[CME_TO_MAX])
+        assert 'EASTERN' in cube.index.get_level_values('longitude_sector'), "The cube was not recomputed for other dimensions"
+    print("All tests passed!")
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+'''
+This code compute the statistics shown in the histograms of delays (see histogram_of_delays_max / _peak in plots.py),
+without any plot or print, so that they can be computed in batch jobs.
+
+For a selection of events, and for many event types at once, it returns for each delay:
+the delays (hours), their number, mean, std, the number of negative delays and the histogram (counts, bin edges).
+'''
+
+import numpy as np
+
+from constants import EVENT_TYPES
+from constants import FLARE_TO_PEAK, CME_TO_PEAK, SEP_TO_PEAK, FLARE_TO_MAX, CME_TO_MAX, SEP_TO_MAX
+from constants import DELAY_BIN_EDGES
+
+from subset_cache import cached_subset_positions
+
+#Delays shown in the histograms of delays to the max flux and to the onset peak
+MAX_DELAYS=[CME_TO_MAX, FLARE_TO_MAX, SEP_TO_MAX]
+PEAK_DELAYS=[CME_TO_PEAK, FLARE_TO_PEAK, SEP_TO_PEAK]
+
+#TO BE DELETED WHEN ISSUE ON NEGATIVE DELAYS IS FIXED
+#The negative delays of these columns are not taken into account in the histograms of delays to the onset peak
+NEGATIVE_PEAK_DELAYS_DROPPED=[FLARE_TO_PEAK, SEP_TO_PEAK]
+
+
+def compute_delay_statistics(df,event_types=EVENT_TYPES,delays=MAX_DELAYS,Event_longitude=None,Flare_magnitude=None,
+                             CDAW_speed=None,DONKI_speed=None,bins=DELAY_BIN_EDGES,drop_negative=(),mask_index=None):
+    '''
+    Compute the statistics of the delays of the events selected by the criteria, for each event type.
+
+    Parameters:
+    -----------
+    df : panda DataFrame
+        the dataframe containing all event information
+    event_types : list of string, default to EVENT_TYPES
+        the event types (the selection is done for each event type, see subset_selection)
+    delays : list of string, default to MAX_DELAYS
+        the delays (eg CME_TO_MAX)
+    Event_longitude, Flare_magnitude, CDAW_speed, DONKI_speed :
+        the selection criteria, same as subset_selection
+    bins : int or dict, default to DELAY_BIN_EDGES
+        the number of bins of the histograms (np.histogram), or a dictionary {delay: bin edges (hours)}
+    drop_negative : list of string, default to ()
+        the delays whose negative values are removed (they are still counted in 'negative')
+    mask_index : dict, default to None
+        the mask index of df (see mask_index.build_mask_index)
+
+    Returns:
+    --------
+    statistics : dict
+        statistics[event_type]['n_events'] : number of selected events
+        statistics[event_type][delay] : dict with
+            'values' : the known delays of the selected events (hours)
+            'n', 'mean', 'std' : number, mean and std (np.std) of the values
+            'negative' : number of negative delays (before removing them if the delay is in drop_negative)
+            'counts', 'bin_edges' : the histogram of the values
+            'underflow', 'overflow' : number of values below / above the bin edges (not in the histogram)
+    '''
+    #Mask of the selected events of each event type (events x event types)
+    selected=np.zeros((len(df), len(event_types)), dtype=bool)
+    for k, event_type in enumerate(event_types):
+        positions=cached_subset_positions(df, event_type=event_type, Event_longitude=Event_longitude, Flare_magnitude=Flare_magnitude,
+                                          CDAW_speed=CDAW_speed, DONKI_speed=DONKI_speed, mask_index=mask_index)
+        selected[positions, k]=True
+
+    statistics={event_type: {'n_events': int(n_events)} for event_type, n_events in zip(event_types, selected.sum(axis=0))}
+
+    for delay in delays:
+        #Delays of all event types (events x event types), in hours
+        values=np.column_stack([df[event_type + delay].to_numpy(dtype=float) for event_type in event_types])/60.0
+        known=selected & ~np.isnan(values)
+        negative=np.count_nonzero(known & (values<0), axis=0)
+        if delay in drop_negative:
+            known=known & (values>=0)
+
+        n=np.count_nonzero(known, axis=0)
+        masked=np.where(known, values, 0.0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean=masked.sum(axis=0)/n
+            std=np.sqrt(np.where(known, (values-mean)**2, 0.0).sum(axis=0)/n)
+
+        for k, event_type in enumerate(event_types):
+            delay_values=values[known[:, k], k]
+            delay_bins=bins[delay] if isinstance(bins, dict) else bins
+            counts,bin_edges=np.histogram(delay_values, bins=delay_bins)
+            statistics[event_type][delay]={
+                'values': delay_values,
+                'n': int(n[k]),
+                'mean': mean[k],
+                'std': std[k],
+                'negative': int(negative[k]),
+                'counts': counts,
+                'bin_edges': bin_edges,
+                'underflow': int(np.count_nonzero(delay_values<bin_edges[0])),
+                'overflow': int(np.count_nonzero(delay_values>bin_edges[-1])),
+            }
+
+    return statistics
+
+
+def test_compute_delay_statistics(df):
+    '''
+    Test that the statistics computed for all the event types at once are the ones of each selection of subset_selection,
+    with and without the negative delays dropped.
+    '''
+    from work import subset_selection
+    from constants import EASTERN
+
+    for delays, drop_negative in [(MAX_DELAYS, ()), (PEAK_DELAYS, NEGATIVE_PEAK_DELAYS_DROPPED)]:
+        statistics=compute_delay_statistics(df, delays=delays, Event_longitude=EASTERN, Flare_magnitude=1e-5, drop_negative=drop_negative)
+        for event_type in EVENT_TYPES:
+            selected=subset_selection(df, event_type=event_type, Event_longitude=EASTERN, Flare_magnitude=1e-5)
+            assert statistics[event_type]['n_events']==len(selected), event_type
+            for delay in delays:
+                values=selected[event_type + delay].dropna().to_numpy(dtype=float)/60.0
+                result=statistics[event_type][delay]
+                assert result['negative']==np.count_nonzero(values<0), (event_type, delay)
+                if delay in drop_negative:
+                    values=values[values>=0]
+                assert np.array_equal(result['values'], values) and result['n']==len(values), (event_type, delay)
+                if len(values):
+                    assert np.isclose(result['mean'], values.mean()) and np.isclose(result['std'], values.std()), (event_type, delay)
+                assert result['counts'].sum()+result['underflow']+result['overflow']==len(values), (event_type, delay)
+    print("All tests passed!")
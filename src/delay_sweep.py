@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+'''
+This code compute the statistics of the delays (count, mean, std, quantiles, histogram)
+over a grid of selections (event types x longitude ranges x thresholds) in one call,
+instead of calling histogram_of_delays_max / histogram_of_delays_peak one plot at a time.
+
+For a threshold sweep (eg Flare magnitude >= 1e-6 ... 1e-3), the selections are nested:
+the events are sorted once by decreasing value of the threshold column, and the statistics
+of every threshold are read from cumulative sums (number of events, sum, sum of squares, histogram counts).
+'''
+
+import numpy as np
+import pandas as pd
+
+from constants import EVENT_TYPES
+from constants import FLARE_TO_PEAK, CME_TO_PEAK, SEP_TO_PEAK, FLARE_TO_MAX, CME_TO_MAX, SEP_TO_MAX
+from constants import DELAY_BIN_EDGES
+
+from mask_index import selection_mask
+
+#All the delay columns (they are preceded by the event type in the dataframe)
+DELAYS=[CME_TO_MAX, FLARE_TO_MAX, SEP_TO_MAX, CME_TO_PEAK, FLARE_TO_PEAK, SEP_TO_PEAK]
+
+
+def delay_bin_edges(df,delay,event_types=EVENT_TYPES,bins=30):
+    '''
+    Return bin edges (in hours) shared by all the event types for a delay,
+    so that the histograms of the different cells of a sweep can be compared.
+    The edges cover the range of the delay over all the event types.
+
+    Parameters:
+    -----------
+    df : panda DataFrame
+        the dataframe containing all event information
+    delay : string
+        the delay (eg CME_TO_MAX)
+    event_types : list of string, default to EVENT_TYPES
+        the event types whose delays are considered
+    bins : int, default to 30
+        the number of bins
+
+    Returns:
+    --------
+    bin_edges : numpy array of float
+        the bins+1 edges of the histogram (hours)
+    '''
+    values=np.concatenate([df[event_type + delay].to_numpy(dtype=float) for event_type in event_types])/60.0 #in hours
+    values=values[~np.isnan(values)]
+    if len(values)==0:
+        return np.linspace(0.0, 1.0, bins+1)
+    return np.histogram_bin_edges(values, bins=bins)
+
+
+def _bin_numbers(values,bin_edges):
+    '''
+    Return the bin of each value, with the same convention as np.histogram (the last bin includes its right edge).
+    Values outside the edges get the bin -1.
+    '''
+    nb_bins=len(bin_edges)-1
+    bin_numbers=np.searchsorted(bin_edges, values, side='right')-1
+    bin_numbers[values==bin_edges[-1]]=nb_bins-1
+    bin_numbers[(values<bin_edges[0]) | (values>bin_edges[-1])]=-1
+    return bin_numbers
+
+
+def _nested_statistics(delays,sort_values,thresholds,bin_edges,quantiles):
+    '''
+    Compute the statistics of the delays of the events whose sort_values >= threshold, for every threshold.
+    The events are sorted once by decreasing sort_values, so each selection is the first k events,
+    and its statistics are read from cumulative sums.
+    '''
+    order=np.argsort(-sort_values, kind='stable')
+    delays=delays[order]
+    ascending_values=sort_values[order][::-1]
+
+    nb_bins=len(bin_edges)-1
+    bin_numbers=_bin_numbers(delays, bin_edges)
+    one_hot=np.zeros((len(delays)+1, nb_bins+1), dtype=np.int64) #the last column counts the values out of the edges
+    one_hot[np.arange(1, len(delays)+1), bin_numbers]=1
+
+    cumulative_n=np.arange(len(delays)+1)
+    cumulative_sum=np.concatenate([[0.0], np.cumsum(delays)])
+    cumulative_sum2=np.concatenate([[0.0], np.cumsum(delays**2)])
+    cumulative_negative=np.concatenate([[0], np.cumsum(delays<0)])
+    cumulative_counts=np.cumsum(one_hot, axis=0)[:, :nb_bins]
+
+    results=[]
+    for threshold in thresholds:
+        #number of events with a value >= threshold (they are the first k events in decreasing order)
+        k=len(delays) if threshold is None else len(ascending_values) - np.searchsorted(ascending_values, threshold, side='left')
+        results.append(_statistics_from_sums(delays[:k], cumulative_n[k], cumulative_sum[k], cumulative_sum2[k],
+                                             cumulative_negative[k], cumulative_counts[k], quantiles))
+    return results
+
+
+def _statistics_from_sums(delays,n,total,total2,negative,counts,quantiles):
+    '''
+    Build the statistics of one cell from its sums.
+    '''
+    statistics={'count': int(n), 'negative': int(negative)}
+    if n>0:
+        mean=total/n
+        statistics['mean']=mean
+        statistics['std']=np.sqrt(max(total2/n - mean**2, 0.0)) #same as np.std (ddof=0)
+        values=np.quantile(delays, quantiles)
+    else:
+        statistics['mean']=np.nan
+        statistics['std']=np.nan
+        values=[np.nan]*len(quantiles)
+    for quantile, value in zip(quantiles, values):
+        statistics[f'q{quantile:g}']=value
+    statistics['counts']=np.asarray(counts)
+    return statistics
+
+
+def sweep_delay_statistics(df,event_types=EVENT_TYPES,delays=DELAYS,longitudes=(None,),threshold_column=None,thresholds=(None,),
+                           Flare_magnitude=None,CDAW_speed=None,DONKI_speed=None,quantiles=(0.25,0.5,0.75),bins=DELAY_BIN_EDGES,mask_index=None,histogram_cube=None):
+    '''
+    Compute the statistics of the delays for every cell of a grid of selections:
+    event types x longitude ranges x thresholds of one column, for each delay.
+    The delays are given in hours, like in the histograms.
+
+    Parameters:
+    -----------
+    df : panda DataFrame
+        the dataframe containing all event information
+    event_types : list of string, default to EVENT_TYPES
+        the event types of the grid
+    delays : list of string, default to DELAYS
+        the delays whose statistics are computed (eg CME_TO_MAX)
+    longitudes : list of (float,float) or None, default to (None,)
+        the longitude ranges of the grid, None meaning no selection on the longitude
+    threshold_column : string, default to None
+        the column of the threshold sweep ('Flare Magnitude', 'CDAW CME Speed' or 'DONKI CME Speed'),
+        None meaning no threshold sweep
+    thresholds : list of float or None, default to (None,)
+        the minimum values of threshold_column of the grid, None meaning no selection on the threshold
+    Flare_magnitude, CDAW_speed, DONKI_speed : float, default to None
+        fixed selection criteria applied to all the cells (see subset_selection)
+    quantiles : list of float, default to (0.25,0.5,0.75)
+        the quantiles of the delays computed for each cell
+    bins : int or dict, default to DELAY_BIN_EDGES
+        the number of bins of the histograms, or a dictionary {delay: bin edges (hours)}.
+        If it is a number, the edges are shared by all the cells of a delay (see delay_bin_edges)
+    mask_index : dict, default to None
+        the mask index of df (see mask_index.build_mask_index)
+    histogram_cube : dict, default to None
+        the histogram cube of df (see histogram_cube.compute_histogram_cube). If given, the histogram
+        of each cell is a slice of the cube (bins is then ignored), the longitude ranges and the thresholds
+        must be edges of the buckets of the cube
+
+    Returns:
+    --------
+    results : pandas DataFrame
+        one row per cell, with the columns
+        'event_type', 'delay', 'longitude', 'threshold_column', 'threshold',
+        'count', 'negative' (number of negative delays), 'mean', 'std', 'q<quantile>' for each quantile,
+        'counts' (histogram counts) and 'bin_edges' (hours)
+    '''
+    if threshold_column is None:
+        thresholds=(None,)
+
+    if histogram_cube is not None:
+        from histogram_cube import histogram_from_cube
+        bin_edges=histogram_cube['bin_edges']
+    elif isinstance(bins, dict):
+        bin_edges={delay: np.asarray(bins[delay], dtype=float) for delay in delays}
+    else:
+        bin_edges={delay: delay_bin_edges(df, delay, event_types=event_types, bins=bins) for delay in delays}
+
+    if threshold_column is not None:
+        threshold_values=df[threshold_column].to_numpy(dtype=float)
+
+    rows=[]
+    for event_type in event_types:
+        for longitude in longitudes:
+            #Events of the cell without the threshold criteria
+            base_mask=selection_mask(df, event_type=event_type, Event_longitude=longitude, Flare_magnitude=Flare_magnitude,
+                                     CDAW_speed=CDAW_speed, DONKI_speed=DONKI_speed, mask_index=mask_index)
+
+            for delay in delays:
+                delay_values=df[event_type + delay].to_numpy(dtype=float)/60.0 #in hours
+                mask=base_mask & ~np.isnan(delay_values)
+
+                if threshold_column is None:
+                    sort_values=np.zeros(np.count_nonzero(mask))
+                else:
+                    #the events with an unknown value of the threshold column are never selected by a threshold
+                    sort_values=np.nan_to_num(threshold_values[mask], nan=-np.inf)
+
+                cells=_nested_statistics(delay_values[mask], sort_values, thresholds, bin_edges[delay], quantiles)
+
+                for threshold, statistics in zip(thresholds, cells):
+                    row={'event_type': event_type, 'delay': delay, 'longitude': longitude,
+                         'threshold_column': threshold_column, 'threshold': threshold}
+                    row.update(statistics)
+                    if histogram_cube is not None:
+                        criteria={'Flare Magnitude': Flare_magnitude, 'CDAW CME Speed': CDAW_speed, 'DONKI CME Speed': DONKI_speed}
+                        if threshold_column is not None:
+                            criteria[threshold_column]=threshold
+                        row['counts'],_,_=histogram_from_cube(histogram_cube, event_type, delay, Event_longitude=longitude,
+                                                              Flare_magnitude=criteria['Flare Magnitude'], CDAW_speed=criteria['CDAW CME Speed'],
+                                                              DONKI_speed=criteria['DONKI CME Speed'])
+                    row['bin_edges']=bin_edges[delay]
+                    rows.append(row)
+
+    return pd.DataFrame(rows)
+
+
+def test_sweep_delay_statistics(df,thresholds=(None,1e-6,1e-5,1e-4)):
+    '''
+    Test that the statistics of every cell of a threshold sweep, read from the cumulative sums,
+    are the ones computed directly from the delays of the events of the cell.
+    '''
+    from constants import EASTERN, TIME_SEP
+
+    results=sweep_delay_statistics(df, longitudes=(None, EASTERN), threshold_column='Flare Magnitude', thresholds=thresholds, bins=20)
+    assert len(results)==len(EVENT_TYPES)*len(DELAYS)*2*len(thresholds)
+    for _, row in results.iterrows():
+        mask=df[row['event_type'] + TIME_SEP].notnull()
+        if row['longitude'] is not None:
+            mask&=df['Event Longitude'].between(*row['longitude'])
+        if not pd.isna(row['threshold']):
+            mask&=df['Flare Magnitude']>=row['threshold']
+        delays=df.loc[mask, row['event_type'] + row['delay']].dropna().to_numpy(dtype=float)/60.0
+
+        assert row['count']==len(delays) and row['negative']==np.count_nonzero(delays<0), row
+        assert np.array_equal(row['counts'], np.histogram(delays, bins=row['bin_edges'])[0]), row
+        if len(delays):
+            assert np.isclose(row['mean'], delays.mean()) and np.isclose(row['std'], delays.std()), row
+            assert np.isclose(row['q0.5'], np.median(delays)), row
+    print("All tests passed!")
+
+
+if __name__ == '__main__':
+    from constants import EASTERN, WESTERN
+    from work import load_generate_dataset
+
+    #Statistics of a sweep of the flare magnitude threshold for all event types and longitude sectors, in one call
+    df=load_generate_dataset()
+    sweep=sweep_delay_statistics(df,longitudes=(None,EASTERN,WESTERN),threshold_column='Flare Magnitude',thresholds=[1e-6,1e-5,5e-5,1e-4,5e-4,1e-3])
+    print(sweep[['event_type','delay','longitude','threshold','count','mean','std']])
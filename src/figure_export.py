@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+'''
+This code export the figures of the dataset in batch, without showing them:
+the histograms of delays of many selections and the flux time series of many events.
+
+Each figure is described by a plot spec (a dictionary), for example:
+    {'kind': 'delays_max', 'event_type': AB_10, 'Event_longitude': WESTERN, 'Flare_magnitude': 1e-5}
+    {'kind': 'delays_peak', 'event_type': TC_10}
+    {'kind': 'flux', 'event_type': TC_10, 'event': 12, 'file_path': '../output/opsep/GOES-08_integral_enhance_idsep/'}
+The figures are rendered with the Agg backend (no window), in a pool of processes or in the calling process,
+and saved in an output directory (png, pdf...).
+
+A manifest in the output directory keeps the fingerprint of the inputs of each figure
+(the delays of the selected events and the bin edges, or the event and its flux file). A figure is rendered again
+only if its fingerprint changed or one of its files is missing, so regenerating a report is incremental.
+'''
+
+import hashlib
+import json
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import matplotlib
+
+from constants import EVENT_TYPES, TIME_FLARE, TIME_CME, DELAY_BIN_EDGES
+
+from delay_statistics import MAX_DELAYS, PEAK_DELAYS
+from subset_cache import cached_subset_positions
+
+MANIFEST_NAME='manifest.json'
+
+#Delays shown by each kind of histogram
+SPEC_DELAYS={'delays_max': MAX_DELAYS, 'delays_peak': PEAK_DELAYS}
+
+#Selection criteria of the histograms of delays
+SELECTION_CRITERIA=['Event_longitude', 'Flare_magnitude', 'CDAW_speed', 'DONKI_speed']
+
+#Dataframe used by the processes of the pool (given once to each process)
+_WORKER_DF=None
+
+
+def figure_name(spec):
+    '''
+    Return the name of the files of a figure (without extension): spec['name'] if given,
+    else a name built from the kind, the event type and the selection criteria.
+    '''
+    if 'name' in spec:
+        return spec['name']
+    parts=[spec['kind'], spec['event_type']]
+    if spec['kind']=='flux':
+        parts.append(f"event_{spec['event']}")
+    else:
+        parts+=[f'{criteria}_{spec[criteria]}' for criteria in SELECTION_CRITERIA if spec.get(criteria) is not None]
+    return re.sub(r'[^A-Za-z0-9.+-]+', '_', '_'.join(str(part) for part in parts)).strip('_')
+
+
+def spec_fingerprint(df,spec,mask_index=None):
+    '''
+    Return the fingerprint (sha1) of the inputs of a figure:
+    the spec itself, and the delays of the selected events and the bin edges of the delays (histograms)
+    or the columns of the event and the state of its flux file (flux time series).
+    '''
+    digest=hashlib.sha1(json.dumps(spec, sort_keys=True, default=str).encode())
+
+    if spec['kind'] in SPEC_DELAYS:
+        positions=cached_subset_positions(df, event_type=spec['event_type'], mask_index=mask_index,
+                                          **{criteria: spec.get(criteria) for criteria in SELECTION_CRITERIA})
+        columns=[spec['event_type'] + delay for delay in SPEC_DELAYS[spec['kind']]]
+        digest.update(np.ascontiguousarray(df[columns].to_numpy(dtype=float)[positions]).tobytes())
+        digest.update(pd.util.hash_pandas_object(df.index[positions].to_series(), index=False).to_numpy().tobytes())
+        digest.update(json.dumps([list(map(float, DELAY_BIN_EDGES[delay])) for delay in SPEC_DELAYS[spec['kind']]]).encode())
+    elif spec['kind']=='flux':
+        event=df.loc[spec['event']]
+        columns=[column for column in df.columns if column.startswith(spec['event_type'])] + [TIME_FLARE, TIME_CME]
+        digest.update(str(event[columns].tolist()).encode())
+        file_name=spec['file_path'] + event[spec['event_type'] + 'Flux Time Series']
+        if os.path.exists(file_name):
+            status=os.stat(file_name)
+            digest.update(f'{status.st_mtime_ns} {status.st_size}'.encode())
+    else:
+        raise ValueError(f"Unknown kind of plot spec: {spec['kind']}")
+
+    return digest.hexdigest()
+
+
+def delay_histogram_specs(kinds=('delays_max','delays_peak'),event_types=EVENT_TYPES,selections=({},)):
+    '''
+    Return the plot specs of the histograms of delays for every kind x event type x selection.
+    A selection is a dictionary of selection criteria, eg {'Event_longitude': WESTERN, 'Flare_magnitude': 1e-5}.
+    '''
+    return [dict({'kind': kind, 'event_type': event_type}, **selection)
+            for kind in kinds for event_type in event_types for selection in selections]
+
+
+def flux_specs(df,file_path,event_types=EVENT_TYPES):
+    '''
+    Return the plot specs of the flux time series of every event and event type that has a flux time series file.
+    '''
+    return [{'kind': 'flux', 'event_type': event_type, 'event': index, 'file_path': file_path}
+            for event_type in event_types
+            for index in df.index[df[event_type + 'Flux Time Series'].notnull()]]
+
+
+def _init_worker(df):
+    '''
+    Initialize a process of the pool: no window (Agg backend) and the dataframe of the figures.
+    '''
+    global _WORKER_DF
+    matplotlib.use('Agg')
+    _WORKER_DF=df
+
+
+def _use_agg():
+    '''
+    Switch pyplot to the Agg backend if it uses another one (it closes the figures open with the other backend).
+    '''
+    import matplotlib.pyplot as plt
+
+    if matplotlib.get_backend().lower()!='agg':
+        plt.switch_backend('Agg')
+
+
+def _render(spec,file_names,df=None):
+    '''
+    Render the figure of a spec and save it in all the file names.
+    Returns None, or the error message if the figure couldn't be rendered.
+    '''
+    import matplotlib.pyplot as plt
+    from plots import histogram_of_delays_max, histogram_of_delays_peak, plot_flux_time_series
+
+    #no window, whatever the backend of the process rendering the figure
+    _use_agg()
+    df=_WORKER_DF if df is None else df
+    criteria={criteria: spec.get(criteria) for criteria in SELECTION_CRITERIA}
+    try:
+        if spec['kind']=='delays_max':
+            fig,_=histogram_of_delays_max(df, spec['event_type'], show=False, **criteria)
+        elif spec['kind']=='delays_peak':
+            fig,_=histogram_of_delays_peak(df, spec['event_type'], show=False, **criteria)
+        else:
+            fig,_=plot_flux_time_series(spec['file_path'], df.loc[spec['event']], spec['event_type'], show=False)
+    except Exception as error: #one missing flux file must not stop the whole batch
+        return f'{type(error).__name__}: {error}'
+
+    for file_name in file_names:
+        fig.savefig(file_name, bbox_inches='tight')
+    plt.close(fig)
+    return None
+
+
+def load_manifest(output_directory):
+    '''
+    Load the manifest of an output directory: {figure name: {'fingerprint': ..., 'files': [...]}}.
+    '''
+    file_name=os.path.join(output_directory, MANIFEST_NAME)
+    if not os.path.exists(file_name):
+        return {}
+    with open(file_name, 'r', encoding='utf-8') as file:
+        return json.load(file)
+
+
+def save_manifest(manifest,output_directory):
+    '''
+    Save the manifest of an output directory.
+    '''
+    with open(os.path.join(output_directory, MANIFEST_NAME), 'w', encoding='utf-8') as file:
+        json.dump(manifest, file, indent=1, sort_keys=True)
+
+
+def export_figures(df,specs,output_directory,formats=('png',),n_jobs=1,force=False,mask_index=None):
+    '''
+    Render the figures of the plot specs and save them in the output directory, skipping the figures
+    whose inputs didn't change since they were last rendered (see spec_fingerprint).
+
+    Parameters:
+    -----------
+    df : panda DataFrame
+        the dataframe containing all event information
+    specs : list of dict
+        the plot specs (see the description of this module, delay_histogram_specs and flux_specs)
+    output_directory : string
+        the directory of the figures and of the manifest (created if needed)
+    formats : list of string, default to ('png',)
+        the formats of the files of each figure (eg 'png', 'pdf')
+    n_jobs : int, default to 1
+        the number of processes rendering the figures (1 means no process pool, the figures are rendered here
+        with the Agg backend, the previous backend is restored at the end, the figures open before are closed)
+    force : boolean, default to False
+        if True, render all the figures
+    mask_index : dict, default to None
+        the mask index of df (see mask_index.build_mask_index), used to compute the fingerprints
+
+    Returns:
+    --------
+    report : dict
+        'rendered', 'skipped' : the names of the rendered / skipped figures
+        'failed' : {name: error message} of the figures that couldn't be rendered
+    '''
+    os.makedirs(output_directory, exist_ok=True)
+    manifest=load_manifest(output_directory)
+
+    report={'rendered': [], 'skipped': [], 'failed': {}}
+    to_render=[]
+    for spec in specs:
+        name=figure_name(spec)
+        fingerprint=spec_fingerprint(df, spec, mask_index=mask_index)
+        file_names=[os.path.join(output_directory, f'{name}.{extension}') for extension in formats]
+        entry=manifest.get(name)
+        if (not force and entry is not None and entry['fingerprint']==fingerprint
+                and set(entry['files'])>=set(file_names) and all(os.path.exists(file_name) for file_name in file_names)):
+            report['skipped'].append(name)
+        else:
+            to_render.append((name, fingerprint, spec, file_names))
+
+    if n_jobs>1 and len(to_render)>1:
+        with ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_worker, initargs=(df,)) as executor:
+            errors=list(executor.map(_render, [spec for _, _, spec, _ in to_render], [file_names for _, _, _, file_names in to_render],
+                                     chunksize=max(1, len(to_render)//(4*n_jobs))))
+    elif to_render:
+        backend=matplotlib.get_backend()
+        try:
+            errors=[_render(spec, file_names, df=df) for _, _, spec, file_names in to_render]
+        finally:
+            if backend.lower()!='agg':
+                import matplotlib.pyplot as plt
+                plt.switch_backend(backend)
+    else:
+        errors=[]
+
+    for (name, fingerprint, _, file_names), error in zip(to_render, errors):
+        if error is None:
+            manifest[name]={'fingerprint': fingerprint, 'files': file_names}
+            report['rendered'].append(name)
+        else:
+            manifest.pop(name, None)
+            report['failed'][name]=error
+            print(f'Figure {name} not rendered: {error}')
+
+    save_manifest(manifest, output_directory)
+    return report
+
+
+def test_export_figures(df):
+    '''
+    Test that the figures are rendered once, skipped while their inputs don't change,
+    and rendered again when the bin edges of their delays change.
+    '''
+    import tempfile
+    from constants import TC_10, AB_10, CME_TO_MAX
+
+    specs=delay_histogram_specs(kinds=('delays_max',), event_types=[TC_10, AB_10])
+    names=[figure_name(spec) for spec in specs]
+    bin_edges=DELAY_BIN_EDGES[CME_TO_MAX]
+    with tempfile.TemporaryDirectory() as directory:
+        report=export_figures(df, specs, directory)
+        assert report['rendered']==names and not report['failed'], report
+        assert all(os.path.exists(os.path.join(directory, f'{name}.png')) for name in names)
+        assert export_figures(df, specs, directory)['skipped']==names
+
+        try:
+            DELAY_BIN_EDGES[CME_TO_MAX]=bin_edges[::2]
+            assert export_figures(df, specs, directory)['rendered']==names, "The figures must be rendered again with other bin edges"
+        finally:
+            DELAY_BIN_EDGES[CME_TO_MAX]=bin_edges
+    print("All tests passed!")
+
+
+if __name__ == '__main__':
+    from constants import EASTERN, WESTERN
+    from work import load_generate_dataset
+
+    #All the histograms of delays saved without showing them, in parallel, only the figures whose data changed are rendered again
+    df=load_generate_dataset()
+    specs=delay_histogram_specs(selections=[{}, {'Event_longitude': EASTERN}, {'Event_longitude': WESTERN, 'Flare_magnitude': 1e-5}])
+    print(export_figures(df, specs, 'Figures/', formats=('png', 'pdf'), n_jobs=4))
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+'''
+This code compute the fluence of the events from their flux time series (trapezoidal integration),
+to validate the 'Fluence (cm^-2)' of the catalog and to compute fluences over other time windows.
+
+All the (event, event type) of the flux store (see flux_store.py) are integrated in one batch:
+the samples of all the windows are flattened, the trapezoids between consecutive samples of the same window
+are computed at once, and summed per window with np.add.reduceat.
+The integral flux is in pfu (cm^-2 s^-1 sr^-1), the fluence is multiplied by a solid angle (4 pi sr by default,
+as for an isotropic flux) to be in cm^-2.
+'''
+
+import numpy as np
+
+from constants import TIME_SEP
+
+from flux_store import series_times, window_bounds, window_samples
+from subset_cache import forget_fingerprint
+
+#Solid angle of an isotropic flux (sr)
+ISOTROPIC_SOLID_ANGLE=4*np.pi
+
+#Name of the column of the recomputed fluence (preceded by the event type, like 'Fluence (cm^-2)')
+FLUENCE_RECOMPUTED='Fluence Recomputed (cm^-2)'
+
+
+def integrate_flux(store,segments,starts,ends,solid_angle=ISOTROPIC_SOLID_ANGLE):
+    '''
+    Integrate the flux of many series between their start and end times (seconds), with the trapezoidal rule
+    between the samples within each window. The pairs of samples with an unknown flux are not integrated.
+
+    Returns:
+    --------
+    fluences : numpy array of float
+        the fluence of each window (cm^-2 if solid_angle is given, else pfu.s), NaN if the window has less than 2 samples
+    '''
+    first,last=window_bounds(store, segments, starts, ends)
+    n_samples=last-first
+    nonempty=np.flatnonzero(n_samples>0)
+    window,samples,window_starts=window_samples(first[nonempty], last[nonempty])
+
+    time=np.asarray(store['time'])[samples].astype(float)
+    flux=np.asarray(store['flux'])[samples]
+
+    #trapezoid between each sample and the next one of the same window (0 for the last sample of a window)
+    area=np.zeros(len(samples))
+    same_window=window[1:]==window[:-1]
+    area[:-1]=np.where(same_window, 0.5*(flux[1:]+flux[:-1])*(time[1:]-time[:-1]), 0.0)
+    area=np.nan_to_num(area, nan=0.0)
+
+    fluences=np.full(len(segments), np.nan)
+    if len(samples)>0:
+        fluences[nonempty]=np.add.reduceat(area, window_starts[:-1])*solid_angle
+    fluences[n_samples<2]=np.nan
+    return fluences
+
+
+def compute_fluences(df,store,start_column=TIME_SEP,end_column='SEP End Time',start_offset=0.0,end_offset=0.0,solid_angle=ISOTROPIC_SOLID_ANGLE):
+    '''
+    Compute the fluence of every (event, event type) of the flux store between two times.
+
+    Parameters:
+    -----------
+    df : panda DataFrame
+        the dataframe containing all event information (the one the store was built from)
+    store : dict
+        the flux store of df (see flux_store.load_generate_flux_store)
+    start_column, end_column : string, default to the SEP window (TIME_SEP, 'SEP End Time')
+        the columns of the start and end times, preceded by the event type if such a column exists
+        (eg TIME_SEP, TIME_MAX), otherwise a time of the event (eg TIME_FLARE, TIME_CME)
+    start_offset, end_offset : float, default to 0
+        the offsets added to the start and end times (hours), eg end_column=TIME_FLARE, end_offset=24
+    solid_angle : float, default to ISOTROPIC_SOLID_ANGLE
+        the solid angle the flux is multiplied by (sr), 1 to get the fluence in pfu.s
+
+    Returns:
+    --------
+    fluences : dict
+        {event_type: numpy array of the fluence of each event of df (NaN if it can't be computed)}
+    '''
+    starts,known_start=series_times(df, store, start_column, start_offset)
+    ends,known_end=series_times(df, store, end_column, end_offset)
+    fluences=integrate_flux(store, store['series_segment'], starts, ends, solid_angle=solid_angle)
+    fluences[~(known_start & known_end) | (store['series_segment']<0)]=np.nan
+
+    results={}
+    for k, event_type in enumerate(store['event_types']):
+        series=np.flatnonzero(store['series_event_type']==k)
+        results[event_type]=np.full(len(df), np.nan)
+        results[event_type][store['series_position'][series]]=fluences[series]
+    return results
+
+
+def add_fluence_columns(df,store,column_name=FLUENCE_RECOMPUTED,**window):
+    '''
+    Add the fluences computed by compute_fluences (same window parameters) to df,
+    in a column event_type + column_name next to the column event_type + 'Fluence (cm^-2)' of each event type.
+    df is modified in place and returned.
+    '''
+    for event_type, fluences in compute_fluences(df, store, **window).items():
+        column=event_type + column_name
+        if column in df.columns:
+            df[column]=fluences
+        else:
+            df.insert(df.columns.get_loc(event_type + 'Fluence (cm^-2)')+1, column, fluences)
+    forget_fingerprint(df) #the selections cached for df are no longer valid
+    return df
+
+
+def test_compute_fluences(df,file_path,windows=((TIME_SEP, 'SEP End Time', 0.0, 0.0), (TIME_SEP, 'Max Flux Time', -1.0, 2.0))):
+    '''
+    Compare the fluences of compute_fluences with a trapezoidal integration of each flux time series file,
+    for a few windows (start column, end column, start offset, end offset), and check add_fluence_columns.
+    '''
+    import tempfile
+    import pandas as pd
+    from flux_reader import flux_file_name, load_flux_time_series
+    from flux_store import load_generate_flux_store
+
+    with tempfile.TemporaryDirectory() as directory:
+        store=load_generate_flux_store(df, file_path, directory=directory)
+    for start_column, end_column, start_offset, end_offset in windows:
+        fluences=compute_fluences(df, store, start_column=start_column, end_column=end_column, start_offset=start_offset, end_offset=end_offset)
+        for event_type, values in fluences.items():
+            for position, (_, event) in enumerate(df.iterrows()):
+                #the SEP end times are not converted by prepare_dataframe
+                start=pd.to_datetime(event[event_type + start_column])+pd.Timedelta(hours=start_offset)
+                end=pd.to_datetime(event[event_type + end_column])+pd.Timedelta(hours=end_offset)
+                if pd.isnull(event[event_type + 'Flux Time Series']) or pd.isnull(start) or pd.isnull(end):
+                    assert np.isnan(values[position])
+                    continue
+                df_flux=load_flux_time_series(flux_file_name(file_path, event, event_type)).dropna(subset=["Time"]).sort_values("Time", kind='stable')
+                df_flux=df_flux[(df_flux["Time"]>=start) & (df_flux["Time"]<=end)]
+                if len(df_flux)<2:
+                    assert np.isnan(values[position])
+                    continue
+                time=(df_flux["Time"]-df_flux["Time"].iloc[0]).dt.total_seconds().to_numpy()
+                flux=df_flux["Flux"].to_numpy(dtype=float)
+                expected=np.nansum(0.5*(flux[1:]+flux[:-1])*np.diff(time))*ISOTROPIC_SOLID_ANGLE
+                assert np.isclose(values[position], expected, rtol=1e-9), (event_type, position)
+
+    #the recomputed fluences are next to the fluences of the catalog
+    with_fluences=add_fluence_columns(df.copy(), store)
+    for event_type in store['event_types']:
+        column=with_fluences.columns.get_loc(event_type + 'Fluence (cm^-2)')
+        assert with_fluences.columns[column+1]==event_type + FLUENCE_RECOMPUTED
+    print("All tests passed!")
+
+
+if __name__ == '__main__':
+    from constants import TC_10
+    from flux_store import load_generate_flux_store
+    from work import load_generate_dataset
+
+    #Fluences integrated from the flux time series, next to the fluences of the catalog
+    df=load_generate_dataset()
+    flux_store=load_generate_flux_store(df, '../output/opsep/GOES-08_integral_enhance_idsep/')
+    add_fluence_columns(df, flux_store)
+    print(df[[TC_10 + 'Fluence (cm^-2)', TC_10 + FLUENCE_RECOMPUTED]].dropna())
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+'''
+This code parse the fluence spectra of the catalog once, into ragged numeric arrays.
+
+The columns 'Fluence Spectrum (cm^-2)', 'Fluence Spectrum Energy Bins (MeV)' and 'Fluence Spectrum Energy Bin Centers (MeV)'
+of each event type are strings, eg '[87346957.18; 28347847.15; ...]' and '[[5.0; -1]; [10.0; -1]; ...]'.
+They are parsed for all the events and event types at once (the strings of a column are joined and split),
+into flat float arrays (one value per energy bin) and the offsets of the spectrum of each (event type, event):
+the spectrum of the event at the row position p for the event type k is at offsets[k, p]:offsets[k, p+1] of the flat arrays.
+A spectral query is then an array slice. The spectra can be saved in a .npz file next to the cached dataset.
+'''
+
+import numpy as np
+
+from constants import EVENT_TYPES
+
+FLUENCE_SPECTRUM='Fluence Spectrum (cm^-2)'
+ENERGY_BINS='Fluence Spectrum Energy Bins (MeV)'
+ENERGY_BIN_CENTERS='Fluence Spectrum Energy Bin Centers (MeV)'
+
+
+def parse_ragged_column(column):
+    '''
+    Parse a column of strings of numbers separated by ';' (with any brackets, eg '[1.0; 2.0]' or '[[5.0; -1]; [10.0; -1]]').
+
+    Returns:
+    --------
+    values : numpy array of float
+        the numbers of all the strings, concatenated
+    lengths : numpy array of int
+        the number of numbers of each string (0 for the missing values)
+    '''
+    strings=[value.replace('[', '').replace(']', '') if isinstance(value, str) else '' for value in column]
+    lengths=np.array([string.count(';')+1 if string.strip() else 0 for string in strings], dtype=np.int64)
+    joined=';'.join(string for string in strings if string.strip())
+    values=np.array(joined.split(';'), dtype=float) if joined else np.zeros(0)
+    return values, lengths
+
+
+def build_fluence_spectra(df,event_types=EVENT_TYPES):
+    '''
+    Parse the fluence spectra of all the events and event types.
+
+    Parameters:
+    -----------
+    df : panda DataFrame
+        the dataframe containing all event information
+    event_types : list of string, default to EVENT_TYPES
+        the event types whose spectra are parsed
+
+    Returns:
+    --------
+    spectra : dict
+        'event_types' : the event types
+        'n_rows' : the number of rows of df
+        'offsets' : numpy array of int (n_event_types x n_rows+1), the bounds of the spectra in the flat arrays
+        'energy_low', 'energy_high' : the edges of each energy bin (MeV), energy_high is inf for an integral channel (-1 in the catalog)
+        'energy_center' : the center of each energy bin (MeV)
+        'fluence' : the fluence of each energy bin (cm^-2), NaN when the spectrum of the event is not given
+        'has_fluence' : numpy array of bool (n_event_types x n_rows), True if the fluence spectrum of the event is given
+    '''
+    offsets=np.zeros((len(event_types), len(df)+1), dtype=np.int64)
+    has_fluence=np.zeros((len(event_types), len(df)), dtype=bool)
+    energy_low,energy_high,energy_center,fluence=[],[],[],[]
+    start=0
+    for k, event_type in enumerate(event_types):
+        centers,lengths=parse_ragged_column(df[event_type + ENERGY_BIN_CENTERS])
+        edges,edge_lengths=parse_ragged_column(df[event_type + ENERGY_BINS])
+        values,value_lengths=parse_ragged_column(df[event_type + FLUENCE_SPECTRUM])
+        if np.any(edge_lengths!=2*lengths):
+            raise ValueError(f"{event_type}: the energy bins don't match the energy bin centers (row {np.flatnonzero(edge_lengths!=2*lengths)[0]})")
+        given=value_lengths>0
+        if np.any(given & (value_lengths!=lengths)):
+            raise ValueError(f"{event_type}: the fluence spectrum doesn't match the energy bins (row {np.flatnonzero(given & (value_lengths!=lengths))[0]})")
+
+        #the spectra not given are NaN
+        spectrum=np.full(len(centers), np.nan)
+        spectrum[np.repeat(given, lengths)]=values
+
+        offsets[k]=start + np.concatenate([[0], np.cumsum(lengths)])
+        start=offsets[k, -1]
+        has_fluence[k]=given
+        energy_low.append(edges[0::2])
+        energy_high.append(np.where(edges[1::2]==-1, np.inf, edges[1::2]))
+        energy_center.append(centers)
+        fluence.append(spectrum)
+
+    return {'event_types': list(event_types), 'n_rows': len(df), 'offsets': offsets, 'has_fluence': has_fluence,
+            'energy_low': np.concatenate(energy_low), 'energy_high': np.concatenate(energy_high),
+            'energy_center': np.concatenate(energy_center), 'fluence': np.concatenate(fluence)}
+
+
+def event_spectrum(spectra,event_type,position):
+    '''
+    Return the fluence spectrum of an event (its row position, as used by df.iloc) for an event type:
+    a dict of the arrays 'energy_low', 'energy_high', 'energy_center' and 'fluence' (views on the flat arrays, no copy).
+    '''
+    k=spectra['event_types'].index(event_type)
+    bounds=slice(spectra['offsets'][k, position], spectra['offsets'][k, position+1])
+    return {name: spectra[name][bounds] for name in ['energy_low', 'energy_high', 'energy_center', 'fluence']}
+
+
+def fluence_at_energy(spectra,event_type,energy,edge='energy_low'):
+    '''
+    Return the fluence of the energy bin starting at energy (MeV) of all the events for an event type,
+    eg the fluence above 10 MeV with energy=10.
+
+    Parameters:
+    -----------
+    spectra : dict
+        the parsed spectra (see build_fluence_spectra)
+    event_type : string
+        the event type (eg TC_10)
+    energy : float
+        the energy of the bin (MeV)
+    edge : string, default to 'energy_low'
+        the array the energy is compared to ('energy_low', 'energy_high' or 'energy_center')
+
+    Returns:
+    --------
+    fluences : numpy array of float (n_rows)
+        the fluence of each event, NaN if the event has no such energy bin or no spectrum
+    '''
+    k=spectra['event_types'].index(event_type)
+    offsets=spectra['offsets'][k]
+    rows=np.repeat(np.arange(spectra['n_rows']), np.diff(offsets))
+    matches=np.flatnonzero(np.isclose(spectra[edge][offsets[0]:offsets[-1]], energy))
+    fluences=np.full(spectra['n_rows'], np.nan)
+    fluences[rows[matches]]=spectra['fluence'][offsets[0] + matches]
+    return fluences
+
+
+def save_fluence_spectra(spectra,file_name):
+    '''
+    Save parsed fluence spectra in a .npz file.
+    '''
+    arrays={name: value for name, value in spectra.items() if name!='event_types'}
+    np.savez(file_name, event_types=np.array(spectra['event_types']), **arrays)
+
+
+def load_fluence_spectra(file_name):
+    '''
+    Load parsed fluence spectra from a .npz file.
+    '''
+    with np.load(file_name) as arrays:
+        spectra={name: arrays[name] for name in arrays.files}
+    spectra['event_types']=[str(event_type) for event_type in spectra['event_types']]
+    spectra['n_rows']=int(spectra['n_rows'])
+    return spectra
+
+
+def test_build_fluence_spectra(df,event_types=EVENT_TYPES):
+    '''
+    Compare the parsed fluence spectra with the strings of each event parsed one by one,
+    check fluence_at_energy, the save/load round trip and the error on a spectrum that doesn't match its energy bins.
+    '''
+    import os
+    import re
+    import tempfile
+
+    def parse(value):
+        return np.array([number for number in re.split(r'[\s;\[\]]+', value) if number], dtype=float) if isinstance(value, str) else np.zeros(0)
+
+    spectra=build_fluence_spectra(df, event_types=event_types)
+    for event_type in event_types:
+        for position in range(len(df)):
+            spectrum=event_spectrum(spectra, event_type, position)
+            centers=parse(df[event_type + ENERGY_BIN_CENTERS].iloc[position])
+            edges=parse(df[event_type + ENERGY_BINS].iloc[position])
+            values=parse(df[event_type + FLUENCE_SPECTRUM].iloc[position])
+            assert np.array_equal(spectrum['energy_center'], centers)
+            assert np.array_equal(spectrum['energy_low'], edges[0::2])
+            assert np.array_equal(spectrum['energy_high'], np.where(edges[1::2]==-1, np.inf, edges[1::2]))
+            assert np.array_equal(spectrum['fluence'], values if len(values)>0 else np.full(len(centers), np.nan), equal_nan=True)
+            assert spectra['has_fluence'][event_types.index(event_type), position]==(len(values)>0)
+
+        #fluence above 10 MeV of all the events
+        expected=np.full(len(df), np.nan)
+        for position in range(len(df)):
+            spectrum=event_spectrum(spectra, event_type, position)
+            matches=np.flatnonzero(np.isclose(spectrum['energy_low'], 10.0))
+            if len(matches)>0:
+                expected[position]=spectrum['fluence'][matches[0]]
+        assert np.array_equal(fluence_at_energy(spectra, event_type, 10.0), expected, equal_nan=True)
+
+    #save/load round trip
+    with tempfile.TemporaryDirectory() as directory:
+        file_name=os.path.join(directory, 'spectra.npz')
+        save_fluence_spectra(spectra, file_name)
+        loaded=load_fluence_spectra(file_name)
+    assert loaded['event_types']==spectra['event_types'] and loaded['n_rows']==spectra['n_rows']
+    for name in ['offsets', 'has_fluence', 'energy_low', 'energy_high', 'energy_center', 'fluence']:
+        assert np.array_equal(loaded[name], spectra[name], equal_nan=True), name
+
+    #a spectrum with a missing energy bin
+    given=df[event_types[0] + FLUENCE_SPECTRUM].notnull().to_numpy()
+    if given.any():
+        broken=df[[event_types[0] + column for column in [FLUENCE_SPECTRUM, ENERGY_BINS, ENERGY_BIN_CENTERS]]].copy()
+        position=np.flatnonzero(given)[0]
+        broken.iloc[position, 0]=broken.iloc[position, 0].rsplit(';', 1)[0] + ']'
+        try:
+            build_fluence_spectra(broken, event_types=event_types[:1])
+        except ValueError as error:
+            assert 'row ' + str(position) in str(error)
+        else:
+            raise AssertionError("A fluence spectrum not matching its energy bins must raise a ValueError")
+    print("All tests passed!")
+
+
+if __name__ == '__main__':
+    from constants import TC_10
+    from work import load_generate_dataset, load_generate_fluence_spectra
+
+    #Spectral query: the fluence above 10 MeV of all the events, from the parsed fluence spectra
+    df=load_generate_dataset()
+    spectra=load_generate_fluence_spectra(df)
+    print(fluence_at_energy(spectra, TC_10, 10.0))
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+'''
+This code audit the max flux and the onset peak of the catalog against the flux time series of the events.
+
+For every (event, event type) of the flux store (see flux_store.py), in one batch:
+    - the max flux and its time are recomputed within the SEP window [SEP Start Time; SEP End Time]
+    - the onset peak is estimated as the first sample of the SEP window that is a new maximum of the flux
+      and is not exceeded during the next onset_window samples (the flux levels off or decreases)
+The result is a table comparing them with 'Max Flux (pfu)', 'Max Flux Time' and 'Onset Peak Time' of the catalog,
+to find the events whose negative SEP to max or flare to max delays come from a wrong time in the catalog.
+'''
+
+import numpy as np
+import pandas as pd
+
+from constants import TIME_SEP, TIME_MAX, TIME_PEAK
+
+from flux_store import to_seconds, window_bounds, window_samples
+
+#Number of samples after the onset peak that must not exceed it (1 hour at the 5 minutes cadence of GOES)
+ONSET_WINDOW=12
+
+
+def _first_in_windows(condition,window_starts):
+    '''
+    Return the position of the first True of each window of the flat array condition (-1 if there is none),
+    the windows must not be empty.
+    '''
+    positions=np.where(condition, np.arange(len(condition)), len(condition))
+    first=np.minimum.reduceat(positions, window_starts[:-1]) if len(condition)>0 else np.zeros(0, dtype=np.int64)
+    return np.where(first<window_starts[1:], first, -1)
+
+
+def audit_flux_peaks(df,store,onset_window=ONSET_WINDOW):
+    '''
+    Recompute the max flux and estimate the onset peak of every (event, event type) of the flux store
+    within its SEP window, and compare them with the catalog.
+
+    Parameters:
+    -----------
+    df : panda DataFrame
+        the dataframe containing all event information (the one the store was built from)
+    store : dict
+        the flux store of df (see flux_store.load_generate_flux_store)
+    onset_window : int, default to ONSET_WINDOW
+        the number of samples after the onset peak that must not exceed it
+
+    Returns:
+    --------
+    audit : pandas DataFrame
+        one row per (event, event type), with the columns
+        'event' (index of the event in df), 'event_type', 'status' ('ok', 'missing file', 'no SEP window', 'empty window'),
+        'n_samples' (in the SEP window),
+        'Max Flux (pfu)', 'Max Flux (pfu) recomputed', 'Max Flux ratio' (recomputed / catalog),
+        'Max Flux Time', 'Max Flux Time recomputed', 'Max Flux Time difference (minutes)' (recomputed - catalog),
+        'Onset Peak Time', 'Onset Peak Time estimated', 'Onset Peak Time difference (minutes)', 'Onset Peak (pfu) estimated'
+    '''
+    positions=store['series_position']
+    event_types=np.asarray(store['event_types'], dtype=object)[store['series_event_type']]
+    segments=store['series_segment']
+
+    #SEP window of each series (seconds), and the catalog values
+    starts=np.zeros(len(positions), dtype=np.int64)
+    ends=np.zeros(len(positions), dtype=np.int64)
+    has_window=np.zeros(len(positions), dtype=bool)
+    catalog={column: np.empty(len(positions), dtype=object) for column in ['Max Flux (pfu)', TIME_MAX, TIME_PEAK]}
+    for k, event_type in enumerate(store['event_types']):
+        series=np.flatnonzero(store['series_event_type']==k)
+        rows=df.iloc[positions[series]]
+        start,known_start=to_seconds(rows[event_type + TIME_SEP])
+        end,known_end=to_seconds(rows[event_type + 'SEP End Time'])
+        starts[series],ends[series],has_window[series]=start,end,known_start & known_end
+        for column in catalog:
+            catalog[column][series]=rows[event_type + column].to_numpy(dtype=object)
+
+    first,last=window_bounds(store, segments, starts, ends)
+    first,last=np.where(has_window, first, 0),np.where(has_window, last, 0)
+    n_samples=last-first
+    nonempty=np.flatnonzero(n_samples>0)
+
+    #All the samples of the non-empty windows, flattened
+    window,samples,window_starts=window_samples(first[nonempty], last[nonempty])
+    time=np.asarray(store['time'])[samples]
+    flux=np.asarray(store['flux'])[samples]
+    values=np.where(np.isnan(flux), -np.inf, flux)
+
+    #Max flux of each window, and its first time
+    max_flux=np.maximum.reduceat(values, window_starts[:-1]) if len(values)>0 else np.zeros(0)
+    first_max=_first_in_windows(values==max_flux[window], window_starts)
+
+    #Onset peak: a new running maximum of the window (ranks of the values, so that a window offset can be added)
+    ranks=np.empty(len(values), dtype=np.int64)
+    ranks[np.argsort(values, kind='stable')]=np.arange(len(values))
+    running_max=np.maximum.accumulate(window*len(values) + ranks) - window*len(values) if len(values)>0 else ranks
+    is_onset=ranks>=running_max
+    #... not exceeded during the next onset_window samples of the same window
+    for shift in range(1, onset_window+1):
+        later=np.zeros(len(values), dtype=bool)
+        later[:-shift]=(window[shift:]==window[:-shift]) & (values[shift:]>values[:-shift])
+        is_onset&=~later
+    is_onset&=np.isfinite(values)
+    first_onset=_first_in_windows(is_onset, window_starts)
+
+    def scatter(values_of_windows,fill):
+        result=np.full(len(positions), fill, dtype=object)
+        result[nonempty]=values_of_windows
+        return result
+
+    max_time=pd.to_datetime(time[first_max], unit='s').where(np.isfinite(max_flux))
+    onset_time=pd.to_datetime(np.where(first_onset>=0, time[np.maximum(first_onset, 0)], 0), unit='s').where(first_onset>=0)
+    audit=pd.DataFrame({
+        'event': df.index[positions],
+        'event_type': event_types,
+        'status': np.where(segments<0, 'missing file', np.where(~has_window, 'no SEP window', np.where(n_samples==0, 'empty window', 'ok'))),
+        'n_samples': n_samples,
+        'Max Flux (pfu)': pd.to_numeric(pd.Series(catalog['Max Flux (pfu)']), errors='coerce'),
+        'Max Flux (pfu) recomputed': pd.to_numeric(pd.Series(scatter(np.where(np.isfinite(max_flux), max_flux, np.nan), np.nan))),
+        'Max Flux Time': pd.to_datetime(pd.Series(catalog[TIME_MAX]), errors='coerce'),
+        'Max Flux Time recomputed': pd.to_datetime(pd.Series(scatter(max_time, pd.NaT))),
+        'Onset Peak Time': pd.to_datetime(pd.Series(catalog[TIME_PEAK]), errors='coerce'),
+        'Onset Peak Time estimated': pd.to_datetime(pd.Series(scatter(onset_time, pd.NaT))),
+        'Onset Peak (pfu) estimated': pd.to_numeric(pd.Series(scatter(np.where(first_onset>=0, flux[np.maximum(first_onset, 0)], np.nan), np.nan))),
+    })
+    audit['Max Flux ratio']=audit['Max Flux (pfu) recomputed']/audit['Max Flux (pfu)']
+    audit['Max Flux Time difference (minutes)']=(audit['Max Flux Time recomputed']-audit['Max Flux Time']).dt.total_seconds()/60.0
+    audit['Onset Peak Time difference (minutes)']=(audit['Onset Peak Time estimated']-audit['Onset Peak Time']).dt.total_seconds()/60.0
+    return audit
+
+
+def suspicious_events(audit,time_tolerance=5.0,flux_tolerance=0.01):
+    '''
+    Return the rows of the audit whose max flux time differs from the catalog by more than time_tolerance (minutes),
+    or whose max flux differs by more than flux_tolerance (relative), or whose max flux is given without its time.
+    '''
+    checked=audit[audit['status']=='ok']
+    different_time=checked['Max Flux Time difference (minutes)'].abs()>time_tolerance
+    different_flux=(checked['Max Flux ratio']-1).abs()>flux_tolerance
+    no_time=checked['Max Flux Time'].isnull() & checked['Max Flux (pfu)'].notnull()
+    return checked[different_time | different_flux | no_time]
+
+
+def test_audit_flux_peaks(df,file_path,onset_window=ONSET_WINDOW):
+    '''
+    Compare the audit with the max flux and the onset peak computed with a loop on each flux time series file.
+    '''
+    import tempfile
+    from flux_reader import flux_file_name, load_flux_time_series
+    from flux_store import load_generate_flux_store
+
+    with tempfile.TemporaryDirectory() as directory:
+        store=load_generate_flux_store(df, file_path, directory=directory)
+        audit=audit_flux_peaks(df, store, onset_window=onset_window)
+    assert len(audit)==len(store['series_position'])
+
+    for _, row in audit.iterrows():
+        event_type=row['event_type']
+        event=df.loc[row['event']]
+        start,end=event[event_type + TIME_SEP],event[event_type + 'SEP End Time']
+        if pd.isnull(start) or pd.isnull(end):
+            assert row['status']=='no SEP window' and row['n_samples']==0
+            continue
+        df_flux=load_flux_time_series(flux_file_name(file_path, event, event_type)).dropna(subset=["Time"]).sort_values("Time", kind='stable')
+        df_flux=df_flux[(df_flux["Time"]>=start) & (df_flux["Time"]<=end)]
+        assert row['n_samples']==len(df_flux), row['event']
+        if len(df_flux)==0:
+            assert row['status']=='empty window'
+            continue
+        assert row['status']=='ok'
+
+        values=df_flux["Flux"].fillna(-np.inf).to_numpy()
+        times=df_flux["Time"].to_numpy()
+        if np.isfinite(values.max()):
+            assert row['Max Flux (pfu) recomputed']==values.max(), row['event']
+            assert row['Max Flux Time recomputed']==times[np.argmax(values)], row['event']
+        #onset peak: first new running maximum not exceeded during the next onset_window samples
+        onset=None
+        for k in range(len(values)):
+            if np.isfinite(values[k]) and values[k]>=values[:k+1].max() and not (values[k+1:k+1+onset_window]>values[k]).any():
+                onset=k
+                break
+        if onset is None:
+            assert pd.isnull(row['Onset Peak Time estimated']), row['event']
+        else:
+            assert row['Onset Peak Time estimated']==times[onset], row['event']
+            assert row['Onset Peak (pfu) estimated']==values[onset], row['event']
+    print("audited "+str((audit['status']=='ok').sum())+" series, "+str(len(suspicious_events(audit)))+" suspicious")
+    print("All tests passed!")
+
+
+if __name__ == '__main__':
+    from flux_store import load_generate_flux_store
+    from work import load_generate_dataset
+
+    #Audit of the max flux and onset peak of the catalog against the flux time series (all the series in one memory-mapped store)
+    df=load_generate_dataset()
+    flux_store=load_generate_flux_store(df, '../output/opsep/GOES-08_integral_enhance_idsep/')
+    print(suspicious_events(audit_flux_peaks(df, flux_store)))
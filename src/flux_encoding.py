@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+'''
+This code encode the flux time series in a compact binary format, and decode it.
+
+The flux time series files are text with a full timestamp on every row, while the cadence is regular (5 minutes for GOES).
+The binary format only keeps the start time and the cadence, a mask of the times of the grid that have a sample
+(the gaps of the series, packed as bits) and the fluxes as float32:
+
+    header : magic b'FLXB', version (uint8), flags (uint8), compression (uint8), unused (uint8),
+             start (int64, seconds since 1970), cadence (int64, seconds), n_grid (int64), n_samples (int64)
+    payload : the packed mask (n_grid bits), then the n_samples fluxes (float32)
+              if the times are not on a regular grid (flag IRREGULAR), the mask is replaced by the n_samples times (int64)
+              minus the start, and n_grid is 0
+The payload can be compressed with zstd (if the zstandard package is installed) or zlib. With the DELTA flag, the differences
+between the bit patterns of consecutive fluxes are stored instead of the fluxes, and with the SHUFFLE flag the fluxes are stored
+byte plane by byte plane (the 1st bytes of all the fluxes, then the 2nd bytes...). Both are lossless and make the compression better.
+Encoding and decoding are vectorized (no loop over the samples).
+
+A series encoded next to its text file (same name + FLUX_ENCODED_SUFFIX) is read by flux_reader instead of the text file.
+'''
+
+import os
+import struct
+import zlib
+
+import numpy as np
+import pandas as pd
+
+try:
+    import zstandard
+except ImportError:
+    zstandard=None
+
+FLUX_ENCODED_SUFFIX='.flxb'
+
+_MAGIC=b'FLXB'
+_VERSION=1
+_HEADER=struct.Struct('<4sBBBBqqqq')
+
+#Flags
+DELTA=1
+IRREGULAR=2
+SHUFFLE=4
+
+#Compressions
+NO_COMPRESSION=0
+ZLIB=1
+ZSTD=2
+_COMPRESSION_NAMES={None: NO_COMPRESSION, 'zlib': ZLIB, 'zstd': ZSTD}
+
+
+def encoded_file_name(file_name):
+    '''
+    Return the name of the encoded file of a flux time series text file.
+    '''
+    return file_name + FLUX_ENCODED_SUFFIX
+
+
+def series_cadence(times):
+    '''
+    Return the cadence (seconds) of sorted times: the most frequent interval between consecutive times (0 if there is none).
+    '''
+    intervals=np.diff(times)
+    intervals=intervals[intervals>0]
+    if len(intervals)==0:
+        return 0
+    values,counts=np.unique(intervals, return_counts=True)
+    return int(values[np.argmax(counts)])
+
+
+def _compress(payload,compression):
+    if compression==ZSTD:
+        return zstandard.ZstdCompressor(level=9).compress(payload)
+    if compression==ZLIB:
+        return zlib.compress(payload, 9)
+    return payload
+
+
+def _decompress(payload,compression):
+    if compression==ZSTD:
+        if zstandard is None:
+            raise ImportError("the zstandard package is needed to decode this flux time series (zstd compression)")
+        return zstandard.ZstdDecompressor().decompress(payload)
+    if compression==ZLIB:
+        return zlib.decompress(payload)
+    return payload
+
+
+def encode_flux(times,fluxes,compression='zstd',delta=True,shuffle=True):
+    '''
+    Encode a flux time series.
+
+    Parameters:
+    -----------
+    times : numpy array of int
+        the sorted times of the samples (seconds since 1970)
+    fluxes : numpy array of float
+        the fluxes of the samples (pfu), NaN if unknown (stored as float32)
+    compression : string, default to 'zstd'
+        'zstd', 'zlib' or None, 'zstd' falls back on 'zlib' if the zstandard package is not installed
+    delta : boolean, default to True
+        If True, store the differences between the bit patterns of consecutive fluxes
+    shuffle : boolean, default to True
+        If True, store the fluxes by byte planes
+
+    Returns:
+    --------
+    encoded : bytes
+        the encoded series
+    '''
+    times=np.asarray(times, dtype=np.int64)
+    values=np.asarray(fluxes, dtype=np.float32)
+    if compression=='zstd' and zstandard is None:
+        compression='zlib'
+    compression=_COMPRESSION_NAMES[compression]
+
+    start=int(times[0]) if len(times)>0 else 0
+    cadence=series_cadence(times)
+    offsets=times-start
+    regular=cadence>0 and np.all(offsets % cadence==0) and np.all(np.diff(offsets)>0)
+    flags=(DELTA if delta else 0) | (SHUFFLE if shuffle else 0)
+    if regular:
+        n_grid=int(offsets[-1]//cadence)+1
+        mask=np.zeros(n_grid, dtype=bool)
+        mask[offsets//cadence]=True
+        positions=np.packbits(mask).tobytes()
+    else:
+        flags|=IRREGULAR
+        n_grid=0
+        positions=offsets.astype('<i8').tobytes()
+
+    bits=values.astype('<f4').view('<u4')
+    if delta:
+        bits=np.diff(bits, prepend=np.uint32(0)) #the differences wrap around (uint32), so the decoding is exact
+    bits=bits.astype('<u4').view(np.uint8)
+    if shuffle:
+        bits=bits.reshape(-1, 4).T
+    payload=_compress(positions + bits.tobytes(), compression)
+    return _HEADER.pack(_MAGIC, _VERSION, flags, compression, 0, start, cadence, n_grid, len(times)) + payload
+
+
+def decode_flux(encoded):
+    '''
+    Decode a flux time series encoded by encode_flux.
+    Returns the times (int64 seconds since 1970) and the fluxes (float64 pfu) of the samples.
+    '''
+    magic,version,flags,compression,_,start,cadence,n_grid,n_samples=_HEADER.unpack_from(encoded)
+    if magic!=_MAGIC or version!=_VERSION:
+        raise ValueError("not an encoded flux time series (or an unknown version)")
+    payload=_decompress(encoded[_HEADER.size:], compression)
+
+    if flags & IRREGULAR:
+        size=8*n_samples
+        times=start + np.frombuffer(payload, dtype='<i8', count=n_samples)
+    else:
+        size=(n_grid+7)//8
+        mask=np.unpackbits(np.frombuffer(payload, dtype=np.uint8, count=size), count=n_grid).astype(bool)
+        times=start + cadence*np.flatnonzero(mask).astype(np.int64)
+
+    bits=np.frombuffer(payload, dtype=np.uint8, count=4*n_samples, offset=size)
+    if flags & SHUFFLE:
+        bits=bits.reshape(4, -1).T.copy()
+    bits=bits.view('<u4').ravel()
+    if flags & DELTA:
+        bits=np.cumsum(bits, dtype=np.uint32)
+    return times, bits.view('<f4').astype(float)
+
+
+def write_encoded_flux(file_name,times,fluxes,compression='zstd',delta=True,shuffle=True):
+    '''
+    Encode a flux time series (see encode_flux) in a file.
+    '''
+    with open(file_name, 'wb') as file:
+        file.write(encode_flux(times, fluxes, compression=compression, delta=delta, shuffle=shuffle))
+
+
+def read_encoded_flux(file_name):
+    '''
+    Read an encoded flux time series file into a pandas DataFrame with the columns "Time" (datetime) and "Flux",
+    as flux_reader.read_flux_time_series.
+    '''
+    with open(file_name, 'rb') as file:
+        times,fluxes=decode_flux(file.read())
+    return pd.DataFrame({"Time": times.astype('datetime64[s]').astype('datetime64[us]'), "Flux": fluxes})
+
+
+def encode_flux_files(file_path,file_names,compression='zstd',delta=True,shuffle=True,force=False):
+    '''
+    Encode flux time series text files next to them (the encoded file of a text file is written if it is missing
+    or older than the text file, or if force is True). The missing or unreadable files are skipped.
+
+    Returns:
+    --------
+    sizes : dict
+        'files' : the number of files encoded, 'text' and 'encoded' : the total size (bytes) of the text and encoded files
+    '''
+    from flux_reader import read_flux_time_series
+
+    sizes={'files': 0, 'text': 0, 'encoded': 0}
+    for file_name in sorted(set(file_names)):
+        text=file_path + file_name
+        encoded=encoded_file_name(text)
+        if not os.path.exists(text):
+            continue
+        if force or not os.path.exists(encoded) or os.path.getmtime(encoded)<os.path.getmtime(text):
+            try:
+                df_flux=read_flux_time_series(text, encoded=False)
+            except ValueError: #unreadable file
+                continue
+            df_flux=df_flux.dropna(subset=["Time"]).sort_values("Time", kind='stable')
+            write_encoded_flux(encoded, df_flux["Time"].to_numpy().astype('datetime64[s]').astype(np.int64),
+                               df_flux["Flux"].to_numpy(dtype=float), compression=compression, delta=delta, shuffle=shuffle)
+            sizes['files']+=1
+        sizes['text']+=os.path.getsize(text)
+        sizes['encoded']+=os.path.getsize(encoded)
+    return sizes
+
+
+def test_encode_flux(seed=0):
+    '''
+    Encode and decode regular, gapped, irregular, single sample and empty series with each compression, with and without
+    the delta and shuffle filters: the times must be exact and the fluxes exact to float32.
+    Check the flags of the header, the error on a file that is not encoded, and the encoded files read by flux_reader.
+    '''
+    import tempfile
+    from flux_reader import flux_source, read_flux_time_series
+
+    rng=np.random.default_rng(seed)
+    cadence=300
+    start=1_500_000_000
+    regular=start + cadence*np.arange(2000)
+    gapped=np.sort(rng.choice(regular, 1400, replace=False))
+    gapped=np.concatenate([gapped, gapped[-1] + 86400 + cadence*np.arange(100)]) #a gap of one day
+    irregular=start + np.cumsum(rng.integers(1, 600, 2000))
+    series={'regular': regular, 'gapped': gapped, 'irregular': irregular, 'single sample': regular[:1], 'empty': regular[:0]}
+
+    for name, times in series.items():
+        fluxes=10**rng.normal(0, 2, len(times))
+        fluxes[rng.random(len(times))<0.05]=np.nan
+        for compression in [None, 'zlib', 'zstd']:
+            for delta in [False, True]:
+                for shuffle in [False, True]:
+                    encoded=encode_flux(times, fluxes, compression=compression, delta=delta, shuffle=shuffle)
+                    decoded_times,decoded_fluxes=decode_flux(encoded)
+                    assert np.array_equal(decoded_times, times), (name, compression, delta, shuffle)
+                    assert np.array_equal(decoded_fluxes, fluxes.astype(np.float32), equal_nan=True), (name, compression, delta, shuffle)
+
+                    _,_,flags,used,_,_,_,_,n_samples=_HEADER.unpack_from(encoded)
+                    assert n_samples==len(times)
+                    assert bool(flags & IRREGULAR)==(name in ['irregular', 'single sample', 'empty']), name
+                    assert bool(flags & DELTA)==delta and bool(flags & SHUFFLE)==shuffle
+                    #zstd falls back on zlib without the zstandard package
+                    assert used==_COMPRESSION_NAMES['zlib' if compression=='zstd' and zstandard is None else compression]
+        if name=='regular':
+            text_size=sum(len(f'{t} {f}\n') for t, f in zip(pd.to_datetime(times, unit='s').strftime('%Y-%m-%dT%H:%M:%S'), fluxes))
+            assert len(encode_flux(times, fluxes))<text_size/3
+
+    try:
+        decode_flux(b'TEXT' + bytes(_HEADER.size))
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("Decoding a series that is not encoded must raise a ValueError")
+    if zstandard is None:
+        header=_HEADER.pack(_MAGIC, _VERSION, 0, ZSTD, 0, 0, 0, 0, 0)
+        try:
+            decode_flux(header)
+        except ImportError:
+            pass
+        else:
+            raise AssertionError("Decoding a zstd series without the zstandard package must raise an ImportError")
+
+    #the encoded file is read instead of the text file, until the text file is modified
+    with tempfile.TemporaryDirectory() as directory:
+        file_name='flux.txt'
+        text=os.path.join(directory, file_name)
+        fluxes=10**rng.normal(0, 2, len(gapped))
+        with open(text, 'w') as file:
+            for time, flux in zip(pd.to_datetime(gapped, unit='s').strftime('%Y-%m-%dT%H:%M:%S'), fluxes):
+                file.write(time + ' ' + repr(float(flux)) + '\n')
+        sizes=encode_flux_files(os.path.join(directory, ''), [file_name, file_name, 'missing.txt'])
+        assert sizes['files']==1 and sizes['encoded']<sizes['text']
+        assert encode_flux_files(os.path.join(directory, ''), [file_name])['files']==0
+        assert flux_source(text)==encoded_file_name(text)
+        from_text,from_encoded=read_flux_time_series(text, encoded=False),read_flux_time_series(text)
+        assert from_encoded["Time"].equals(from_text["Time"])
+        assert np.array_equal(from_encoded["Flux"].to_numpy(), from_text["Flux"].to_numpy().astype(np.float32))
+        stat=os.stat(encoded_file_name(text))
+        os.utime(text, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        assert flux_source(text)==text
+    print("All tests passed!")
+
+
+if __name__ == '__main__':
+    from constants import EVENT_TYPES
+    from work import load_generate_dataset
+
+    #Compact binary encoding of the flux time series of the catalog, read instead of the text files once encoded
+    df=load_generate_dataset()
+    files=[file_name for event_type in EVENT_TYPES for file_name in df[event_type + 'Flux Time Series'].dropna()]
+    print(encode_flux_files('../output/opsep/GOES-08_integral_enhance_idsep/', files))
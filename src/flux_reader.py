@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+'''
+This code read the flux time series files of the events, with a cache and a prefetch.
+
+The parsed time series are kept in a bounded LRU cache (least recently used series are dropped first),
+keyed on the path and the modification time of the file, so looking again at an event is free
+and a modified file is read again. The number of hits and misses of the cache is counted, see flux_cache_info().
+
+A list of files can be prefetched by a pool of threads, so that their reads overlap instead of being done one after the other,
+eg before plotting the neighbouring events of an anomaly or all the event types of an event.
+The same file is never read twice at the same time: a request for a file being read waits for this read.
+
+The DataFrames returned are shared by all the users of the cache, they must not be modified in place.
+
+A series encoded in the compact binary format next to its text file (see flux_encoding.py) is read from the encoded file,
+unless the text file is more recent.
+'''
+
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import pandas as pd
+
+from flux_encoding import FLUX_ENCODED_SUFFIX, encoded_file_name, read_encoded_flux
+
+#Maximum number of time series kept in the cache
+FLUX_CACHE_SIZE=64
+
+#Number of threads reading the prefetched files
+FLUX_PREFETCH_WORKERS=8
+
+_FLUX_CACHE=OrderedDict()
+_FLUX_CACHE_STATISTICS={'hits': 0, 'misses': 0, 'maxsize': FLUX_CACHE_SIZE}
+
+#Reads in progress: (path, mtime) -> Future of the DataFrame
+_PENDING_READS={}
+_LOCK=threading.Lock()
+_EXECUTOR=None
+
+
+def flux_source(file_name):
+    '''
+    Return the file to read for a flux time series text file: its encoded file if it exists
+    and is not older than the text file (or the text file is missing), else the text file.
+    '''
+    encoded=encoded_file_name(file_name)
+    if os.path.exists(encoded) and (not os.path.exists(file_name) or os.path.getmtime(encoded)>=os.path.getmtime(file_name)):
+        return encoded
+    return file_name
+
+
+def flux_file_mtime(file_name):
+    '''
+    Return the modification time (ns) of the file read for a flux time series (see flux_source), -1 if it is missing.
+    '''
+    source=flux_source(file_name)
+    return os.stat(source).st_mtime_ns if os.path.exists(source) else -1
+
+
+def read_flux_time_series(file_name,encoded=True):
+    '''
+    Read a flux time series file (two columns: Time and Flux, separated by whitespace)
+    into a pandas DataFrame with the columns "Time" (datetime) and "Flux", without the cache.
+    If encoded is True, the encoded file of the series is read instead if it is up to date (see flux_source).
+    '''
+    if encoded:
+        file_name=flux_source(file_name)
+    if file_name.endswith(FLUX_ENCODED_SUFFIX):
+        return read_encoded_flux(file_name)
+    df_flux = pd.read_csv(file_name, sep=r'\s+', names=["Time", "Flux"])
+    df_flux["Time"] = pd.to_datetime(df_flux["Time"])
+    return df_flux
+
+
+def flux_file_name(file_path,event,event_type):
+    '''
+    Return the name of the flux time series file of an event (a row of the dataframe) for an event type.
+    '''
+    return file_path + event[event_type + 'Flux Time Series']
+
+
+def load_flux_time_series(file_name):
+    '''
+    Return the flux time series of a file (see read_flux_time_series),
+    from the cache if the file was already read and didn't change since.
+    '''
+    file_name=flux_source(file_name)
+    key=(os.path.abspath(file_name), os.stat(file_name).st_mtime_ns)
+
+    with _LOCK:
+        if key in _FLUX_CACHE:
+            _FLUX_CACHE_STATISTICS['hits']+=1
+            _FLUX_CACHE.move_to_end(key)
+            return _FLUX_CACHE[key]
+        future=_PENDING_READS.get(key)
+        is_reader=future is None
+        if is_reader:
+            _FLUX_CACHE_STATISTICS['misses']+=1
+            future=Future()
+            _PENDING_READS[key]=future
+        else:
+            _FLUX_CACHE_STATISTICS['hits']+=1
+
+    if not is_reader:
+        #the file is being read by another thread
+        return future.result()
+
+    try:
+        df_flux=read_flux_time_series(file_name)
+    except BaseException as error:
+        with _LOCK:
+            _PENDING_READS.pop(key, None)
+        future.set_exception(error)
+        raise
+
+    with _LOCK:
+        _FLUX_CACHE[key]=df_flux
+        while len(_FLUX_CACHE)>_FLUX_CACHE_STATISTICS['maxsize']:
+            _FLUX_CACHE.popitem(last=False)
+        _PENDING_READS.pop(key, None)
+    future.set_result(df_flux)
+    return df_flux
+
+
+def prefetch_flux_time_series(file_names):
+    '''
+    Start reading the files in the pool of threads (the files already in the cache are not read again).
+    Returns the futures of the DataFrames, in the order of file_names.
+    '''
+    global _EXECUTOR
+    with _LOCK:
+        if _EXECUTOR is None:
+            _EXECUTOR=ThreadPoolExecutor(max_workers=FLUX_PREFETCH_WORKERS, thread_name_prefix='flux_prefetch')
+    return [_EXECUTOR.submit(load_flux_time_series, file_name) for file_name in file_names]
+
+
+def load_flux_time_series_batch(file_path,events):
+    '''
+    Return the flux time series of many events, read concurrently.
+
+    Parameters:
+    -----------
+    file_path : string
+        the path to the directory containing the flux time series files
+    events : list of (panda Series, string)
+        the events (rows of the dataframe) and their event type
+
+    Returns:
+    --------
+    flux_time_series : list of pandas DataFrame
+        the time series of the events, in the order of events
+    '''
+    futures=prefetch_flux_time_series([flux_file_name(file_path, event, event_type) for event, event_type in events])
+    return [future.result() for future in futures]
+
+
+def flux_cache_info():
+    '''
+    Return the statistics of the cache: number of hits, misses, current size and maximum size.
+    '''
+    with _LOCK:
+        return {'hits': _FLUX_CACHE_STATISTICS['hits'], 'misses': _FLUX_CACHE_STATISTICS['misses'],
+                'size': len(_FLUX_CACHE), 'maxsize': _FLUX_CACHE_STATISTICS['maxsize']}
+
+
+def set_flux_cache_size(maxsize):
+    '''
+    Change the maximum number of time series kept in the cache.
+    '''
+    with _LOCK:
+        _FLUX_CACHE_STATISTICS['maxsize']=maxsize
+        while len(_FLUX_CACHE)>maxsize:
+            _FLUX_CACHE.popitem(last=False)
+
+
+def clear_flux_cache():
+    '''
+    Empty the cache and reset its statistics.
+    '''
+    with _LOCK:
+        _FLUX_CACHE.clear()
+        _FLUX_CACHE_STATISTICS['hits']=0
+        _FLUX_CACHE_STATISTICS['misses']=0
+
+
+def test_load_flux_time_series(df,file_path,event_types=None):
+    '''
+    Check the cache and the prefetch of the flux time series against the files read directly:
+    the batch returns the series in order, a second read is a hit, a modified file is read again
+    and the least recently used series are dropped when the cache is full.
+    The files are copied in a temporary directory first, so the files of file_path are not modified.
+    '''
+    import shutil
+    import tempfile
+    from constants import EVENT_TYPES
+
+    event_types=EVENT_TYPES if event_types is None else event_types
+    events=[(event, event_type) for _, event in df.iterrows() for event_type in event_types if pd.notnull(event[event_type + 'Flux Time Series'])]
+    maxsize=_FLUX_CACHE_STATISTICS['maxsize']
+    with tempfile.TemporaryDirectory() as directory:
+        copy_path=os.path.join(directory, '')
+        for file_name in {event[event_type + 'Flux Time Series'] for event, event_type in events}:
+            for source in [file_path + file_name, encoded_file_name(file_path + file_name)]:
+                if os.path.exists(source):
+                    shutil.copy2(source, copy_path + os.path.basename(source))
+        file_names=[flux_file_name(copy_path, event, event_type) for event, event_type in events]
+        n_files=len(set(file_names))
+        try:
+            clear_flux_cache()
+            set_flux_cache_size(n_files)
+            for file_name, df_flux in zip(file_names, load_flux_time_series_batch(copy_path, events)):
+                assert df_flux.equals(read_flux_time_series(file_name)), file_name
+            info=flux_cache_info()
+            assert info['misses']==n_files and info['hits']==len(file_names)-n_files and info['size']==n_files
+
+            #a second read is free and returns the same DataFrame
+            assert load_flux_time_series(file_names[0]) is load_flux_time_series(file_names[0])
+            assert flux_cache_info()['misses']==n_files
+
+            #a modified file is read again
+            stat=os.stat(flux_source(file_names[0]))
+            os.utime(flux_source(file_names[0]), ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+            assert load_flux_time_series(file_names[0]).equals(read_flux_time_series(file_names[0]))
+            assert flux_cache_info()['misses']==n_files+1
+
+            #least recently used series are dropped first
+            set_flux_cache_size(2)
+            assert flux_cache_info()['size']==2
+            load_flux_time_series(file_names[0])
+            assert flux_cache_info()['misses']==n_files+1
+        finally:
+            set_flux_cache_size(maxsize)
+            clear_flux_cache()
+    print("All tests passed!")
@@ -0,0 +1,374 @@
+#!/usr/bin/env python3
+'''
+This code gather the flux time series of all the events in one store, to process them in batch
+(audit of the catalog, fluences, superposed epochs...) without reading and parsing the text files again.
+
+The store is made of:
+    - 'time' : the times of all the samples of all the files (int64, seconds since 1970-01-01), concatenated
+    - 'flux' : the fluxes of all the samples (float64, pfu)
+    - 'offsets' : the samples of the file k are time[offsets[k]:offsets[k+1]] (a segment)
+    - 'files' : the name of the file of each segment (the files are shared by the TC and AB event types),
+      'lengths' : its number of samples (-1 if the file is missing or unreadable), 'mtimes' : its modification time
+    - 'series_position', 'series_event_type', 'series_segment' : for each (event, event type) having a flux time series,
+      the row position of the event in the dataframe, the position of its event type in 'event_types', and its segment
+      (-1 if the file is missing)
+The time and flux arrays are saved as .npy files next to the cached dataset, and are memory-mapped when loaded.
+'''
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from constants import EVENT_TYPES
+
+from flux_reader import prefetch_flux_time_series, flux_file_mtime
+
+FLUX_STORE_PATH="Datasets/my_dataset_flux_store"
+
+#Number of files read at once while building the store
+FLUX_STORE_CHUNK=256
+
+
+def to_seconds(times):
+    '''
+    Convert datetimes (or strings) to int64 seconds since 1970-01-01, and a mask of the known times.
+    '''
+    times=pd.to_datetime(pd.Series(times), errors='coerce')
+    known=times.notnull().to_numpy()
+    seconds=np.zeros(len(times), dtype=np.int64)
+    seconds[known]=times[known].to_numpy().astype('datetime64[s]').astype(np.int64)
+    return seconds, known
+
+
+def series_times(df,store,column,offset=0.0):
+    '''
+    Return the time (seconds) of each series of the store given by a column of df, shifted by offset (hours),
+    and the mask of the known times. The column is preceded by the event type if this column exists (eg 'SEP Start Time'),
+    otherwise it is a time of the event (eg 'Flare Xray Peak Time').
+    '''
+    times=np.zeros(len(store['series_position']), dtype=np.int64)
+    known=np.zeros(len(store['series_position']), dtype=bool)
+    for k, event_type in enumerate(store['event_types']):
+        series=np.flatnonzero(store['series_event_type']==k)
+        name=event_type + column if event_type + column in df.columns else column
+        times[series],known[series]=to_seconds(df[name].iloc[store['series_position'][series]])
+    return times + int(round(offset*3600)), known
+
+
+def _read_segments(files,file_path):
+    '''
+    Read the files (in chunks, each chunk concurrently) and concatenate their samples.
+    Returns the time, flux, offsets arrays, the number of samples of each file (-1 if it is missing or unreadable)
+    and the modification time of each file (-1 if it is missing).
+    '''
+    times,fluxes,lengths,mtimes=[],[],[],[]
+    for start in range(0, len(files), FLUX_STORE_CHUNK):
+        chunk=files[start:start+FLUX_STORE_CHUNK]
+        for file_name, future in zip(chunk, prefetch_flux_time_series([file_path + file_name for file_name in chunk])):
+            try:
+                df_flux=future.result()
+            except (FileNotFoundError, ValueError): #missing or unreadable file
+                df_flux=None
+            mtimes.append(flux_file_mtime(file_path + file_name))
+            if df_flux is None:
+                lengths.append(-1)
+                continue
+            df_flux=df_flux.dropna(subset=["Time"]).sort_values("Time", kind='stable')
+            times.append(df_flux["Time"].to_numpy().astype('datetime64[s]').astype(np.int64))
+            fluxes.append(df_flux["Flux"].to_numpy(dtype=float))
+            lengths.append(len(df_flux))
+
+    #the missing files get an empty segment
+    lengths=np.asarray(lengths, dtype=np.int64)
+    offsets=np.concatenate([[0], np.cumsum(np.maximum(lengths, 0))]).astype(np.int64)
+    time=np.concatenate(times) if times else np.zeros(0, dtype=np.int64)
+    flux=np.concatenate(fluxes) if fluxes else np.zeros(0)
+    return time, flux, offsets, lengths, np.asarray(mtimes, dtype=np.int64)
+
+
+def _flux_files(df,event_types):
+    '''
+    Return the sorted names of the flux time series files of all the events and event types of df.
+    '''
+    return sorted({file_name for event_type in event_types for file_name in df[event_type + 'Flux Time Series'].dropna()})
+
+
+def _series_index(df,files,lengths,event_types):
+    '''
+    Return the row position, the event type (position in event_types) and the segment of each (event, event type)
+    having a flux time series file, the segment is -1 if the file is missing.
+    '''
+    segment_of_file={file_name: k for k, file_name in enumerate(files)}
+    series_position,series_event_type,series_segment=[],[],[]
+    for k, event_type in enumerate(event_types):
+        column=df[event_type + 'Flux Time Series'].to_numpy(dtype=object)
+        positions=np.flatnonzero(pd.notnull(column))
+        segments=np.array([segment_of_file[file_name] for file_name in column[positions]], dtype=np.int64)
+        if len(segments)>0:
+            segments[lengths[segments]<0]=-1
+        series_position.append(positions)
+        series_event_type.append(np.full(len(positions), k, dtype=np.int64))
+        series_segment.append(segments)
+    return np.concatenate(series_position), np.concatenate(series_event_type), np.concatenate(series_segment)
+
+
+def build_flux_store(df,file_path,event_types=EVENT_TYPES):
+    '''
+    Read the flux time series of all the events of df and gather them in a store (see the description of this module).
+
+    Parameters:
+    -----------
+    df : panda DataFrame
+        the dataframe containing all event information
+    file_path : string
+        the path to the directory containing the flux time series files
+    event_types : list of string, default to EVENT_TYPES
+
+    Returns:
+    --------
+    store : dict
+        the flux store
+    '''
+    files=_flux_files(df, event_types)
+    time,flux,offsets,lengths,mtimes=_read_segments(files, file_path)
+    series_position,series_event_type,series_segment=_series_index(df, files, lengths, event_types)
+    return {
+        'time': time,
+        'flux': flux,
+        'offsets': offsets,
+        'files': np.asarray(files, dtype=str),
+        'lengths': lengths,
+        'mtimes': mtimes,
+        'event_types': list(event_types),
+        'series_position': series_position,
+        'series_event_type': series_event_type,
+        'series_segment': series_segment,
+    }
+
+
+def save_flux_store(store,directory):
+    '''
+    Save the flux store in a directory: time.npy and flux.npy (memory-mappable) and index.npz.
+    '''
+    os.makedirs(directory, exist_ok=True)
+    np.save(os.path.join(directory, 'time.npy'), store['time'])
+    np.save(os.path.join(directory, 'flux.npy'), store['flux'])
+    np.savez(os.path.join(directory, 'index.npz'), offsets=store['offsets'], files=store['files'], lengths=store['lengths'],
+             mtimes=store['mtimes'], event_types=np.asarray(store['event_types']), series_position=store['series_position'],
+             series_event_type=store['series_event_type'], series_segment=store['series_segment'])
+
+
+def _load_array(file_name,mmap):
+    if mmap:
+        try:
+            return np.load(file_name, mmap_mode='r')
+        except ValueError: #an empty array can't be memory-mapped
+            pass
+    return np.load(file_name)
+
+
+def load_flux_store(directory,mmap=True):
+    '''
+    Load a flux store saved by save_flux_store, with the time and flux arrays memory-mapped (read-only) if mmap=True.
+    '''
+    store={'time': _load_array(os.path.join(directory, 'time.npy'), mmap),
+           'flux': _load_array(os.path.join(directory, 'flux.npy'), mmap)}
+    with np.load(os.path.join(directory, 'index.npz')) as index:
+        for key in ('offsets', 'files', 'lengths', 'mtimes', 'series_position', 'series_event_type', 'series_segment'):
+            store[key]=index[key]
+        store['event_types']=index['event_types'].tolist()
+    return store
+
+
+def load_generate_flux_store(df,file_path,force=False,directory=FLUX_STORE_PATH,event_types=EVENT_TYPES):
+    '''
+    This function either loads the flux store saved next to the cached dataset (memory-mapped),
+    or builds it with build_flux_store and saves it.
+    The files are read again if the flux time series files of the dataframe changed (names or modification times),
+    the index of the (event, event type) is always computed again from df.
+    '''
+    files=_flux_files(df, event_types)
+
+    if not force and os.path.exists(os.path.join(directory, 'index.npz')):
+        store=load_flux_store(directory)
+        mtimes=np.array([flux_file_mtime(file_path + file_name) for file_name in files],
+                        dtype=np.int64)
+        if store['event_types']==list(event_types) and store['files'].tolist()==files and np.array_equal(mtimes, store['mtimes']):
+            store['series_position'],store['series_event_type'],store['series_segment']=_series_index(df, files, store['lengths'], event_types)
+            return store
+
+    save_flux_store(build_flux_store(df, file_path, event_types=event_types), directory)
+    return load_flux_store(directory)
+
+
+def sample_segments(store):
+    '''
+    Return the segment of each sample of the store (computed once and kept in the store).
+    '''
+    if 'sample_segment' not in store:
+        store['sample_segment']=np.repeat(np.arange(len(store['offsets'])-1), np.diff(store['offsets']))
+    return store['sample_segment']
+
+
+def sample_keys(store):
+    '''
+    Return the key (segment, time) of each sample of the store, sorted since the times are sorted within each segment
+    (computed once and kept in the store). The times are less than 2**32 seconds after 1970.
+    '''
+    if 'keys' not in store:
+        store['keys']=(sample_segments(store).astype(np.int64)<<32) + np.asarray(store['time'])
+    return store['keys']
+
+
+def window_bounds(store,segments,starts,ends):
+    '''
+    Return the samples of each segment within a time window [start; end] (seconds), for many windows at once:
+    the samples of the window k are flux[first[k]:last[k]] (first==last if the window is empty).
+    The windows of the segments -1 (missing files) are empty.
+
+    The samples are sorted by their key (segment, time), so all the windows are found by 2 binary searches.
+    '''
+    keys=sample_keys(store)
+    segments=np.asarray(segments, dtype=np.int64)
+    valid=segments>=0
+    first=np.searchsorted(keys, (segments<<32) + starts, side='left')
+    last=np.searchsorted(keys, (segments<<32) + ends, side='right')
+    last=np.where(valid & (last>first), last, first)
+    return first, last
+
+
+def window_samples(first,last):
+    '''
+    Return the samples of all the windows (see window_bounds) as flat arrays:
+    the window of each sample, and the position of each sample in the store.
+    The samples of the window k are at window_starts[k]:window_starts[k+1] of the flat arrays.
+    '''
+    lengths=last-first
+    window_starts=np.concatenate([[0], np.cumsum(lengths)])
+    window=np.repeat(np.arange(len(first)), lengths)
+    samples=first[window] + np.arange(window_starts[-1]) - window_starts[window]
+    return window, samples, window_starts
+
+
+def test_flux_store(df,file_path,n_windows=2000,seed=0):
+    '''
+    Compare the flux store with the flux time series files read one by one: the segments, the windows found by window_bounds
+    and the fluxes interpolated by interpolate_flux (with np.interp). Check that the saved store is reused
+    while the files don't change, and built again when a file is modified.
+    The files are copied in a temporary directory first, so the files of file_path are not modified.
+    '''
+    import shutil
+    import tempfile
+    from flux_encoding import encoded_file_name
+    from flux_reader import read_flux_time_series
+
+    rng=np.random.default_rng(seed)
+    with tempfile.TemporaryDirectory() as temporary:
+        flux_path=os.path.join(temporary, 'flux', '')
+        directory=os.path.join(temporary, 'store')
+        os.makedirs(flux_path)
+        for file_name in _flux_files(df, EVENT_TYPES):
+            for source in [file_path + file_name, encoded_file_name(file_path + file_name)]:
+                if os.path.exists(source):
+                    shutil.copy2(source, flux_path + os.path.basename(source))
+        store=load_generate_flux_store(df, flux_path, directory=directory)
+
+        #the segments are the samples of the files
+        assert store['files'].tolist()==_flux_files(df, EVENT_TYPES)
+        for k, file_name in enumerate(store['files']):
+            df_flux=read_flux_time_series(flux_path + file_name).dropna(subset=["Time"]).sort_values("Time", kind='stable')
+            segment=slice(store['offsets'][k], store['offsets'][k+1])
+            assert store['lengths'][k]==len(df_flux), file_name
+            assert np.array_equal(store['time'][segment], df_flux["Time"].to_numpy().astype('datetime64[s]').astype(np.int64)), file_name
+            assert np.array_equal(store['flux'][segment], df_flux["Flux"].to_numpy(dtype=float), equal_nan=True), file_name
+        for position, k, segment in zip(store['series_position'], store['series_event_type'], store['series_segment']):
+            assert store['files'][segment]==df[store['event_types'][k] + 'Flux Time Series'].iloc[position]
+
+        #the saved store is reused, and built again when a file is modified
+        index_file=os.path.join(directory, 'index.npz')
+        saved=os.stat(index_file).st_mtime_ns
+        store=load_generate_flux_store(df, flux_path, directory=directory)
+        assert os.stat(index_file).st_mtime_ns==saved
+        modified=flux_path + store['files'][0]
+        os.utime(modified, ns=(os.stat(modified).st_atime_ns, os.stat(modified).st_mtime_ns + 10**9))
+        store=load_generate_flux_store(df, flux_path, directory=directory)
+        assert os.stat(index_file).st_mtime_ns!=saved
+        assert store['mtimes'][0]==os.stat(modified).st_mtime_ns
+
+        #a missing file has no segment
+        missing=df.copy()
+        missing.loc[missing.index[0], EVENT_TYPES[0] + 'Flux Time Series']='missing.txt'
+        missing_store=build_flux_store(missing, flux_path)
+        assert missing_store['lengths'][missing_store['files'].tolist().index('missing.txt')]==-1
+        first=(missing_store['series_position']==0) & (missing_store['series_event_type']==0)
+        assert (missing_store['series_segment'][first]==-1).all()
+
+    #random windows and times, compared with the samples of each segment
+    n_segments=len(store['offsets'])-1
+    segments=rng.integers(-1, n_segments, n_windows)
+    time=np.asarray(store['time'])
+    flux=np.asarray(store['flux'])
+    low,high=time.min()-86400, time.max()+86400
+    starts=rng.integers(low, high, n_windows)
+    ends=starts + rng.integers(0, 10*86400, n_windows)
+    first,last=window_bounds(store, segments, starts, ends)
+    times=rng.integers(low, high, (n_windows, 3))
+    times[:, 2]=time[rng.integers(0, len(time), n_windows)] #exact sample times
+    interpolated=interpolate_flux(store, segments, times, max_gap=np.inf)
+    for k, segment in enumerate(segments):
+        if segment<0:
+            assert first[k]==last[k] and np.isnan(interpolated[k]).all()
+            continue
+        segment_time=time[store['offsets'][segment]:store['offsets'][segment+1]]
+        segment_flux=flux[store['offsets'][segment]:store['offsets'][segment+1]]
+        inside=np.flatnonzero((segment_time>=starts[k]) & (segment_time<=ends[k])) + store['offsets'][segment]
+        assert np.array_equal(np.arange(first[k], last[k]), inside), k
+        expected=np.interp(times[k], segment_time, segment_flux, left=np.nan, right=np.nan) if len(segment_time)>0 else np.full(3, np.nan)
+        assert np.allclose(interpolated[k], expected, equal_nan=True), k
+    print("All tests passed!")
+
+
+def interpolate_flux(store,segments,times,max_gap=3600):
+    '''
+    Interpolate linearly the flux of many series at given times, all at once.
+
+    Parameters:
+    -----------
+    store : dict
+        the flux store
+    segments : numpy array of int (n_series)
+        the segment of each series (-1 for a missing file)
+    times : numpy array of int (n_series x n_times)
+        the times (seconds) where the flux of each series is interpolated
+    max_gap : float, default to 3600
+        the largest interval (seconds) between 2 samples that is interpolated, the flux is unknown in larger data gaps
+
+    Returns:
+    --------
+    flux : numpy array of float (n_series x n_times)
+        the interpolated fluxes, NaN outside of the time range of the series, in the gaps and for the missing files
+    '''
+    segments=np.asarray(segments, dtype=np.int64)[:, None]
+    times=np.asarray(times, dtype=np.int64)
+    time=np.asarray(store['time'])
+    flux=np.asarray(store['flux'])
+    if len(time)==0:
+        return np.full(times.shape, np.nan)
+
+    #the first sample at or after each time (right) and the sample before it (left), within the segment of the series
+    offsets=store['offsets']
+    segment_of=np.maximum(segments, 0)
+    right=np.searchsorted(sample_keys(store), (segment_of<<32) + times, side='left')
+    left=right-1
+    in_segment=(segments>=0) & (right<offsets[segment_of+1])
+    right=np.minimum(right, len(time)-1)
+    exact=in_segment & (time[right]==times)
+    in_segment&=left>=offsets[segment_of]
+    left=np.maximum(left, 0)
+
+    t0,t1=time[left].astype(float),time[right].astype(float)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        interpolated=flux[left] + (flux[right]-flux[left])*(times-t0)/(t1-t0)
+    interpolated=np.where(in_segment & (t1-t0<=max_gap), interpolated, np.nan)
+    return np.where(exact, flux[right], interpolated)
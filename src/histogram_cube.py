@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+'''
+This code precompute the histograms of all the delays with the fixed bin edges of DELAY_BIN_EDGES,
+for every event type x delay x selection bucket, in one array of counts saved next to the cached dataset.
+
+The events are put in selection buckets along the criteria of subset_selection:
+    - the longitude: the sectors between the edges of LONGITUDE_SECTOR_EDGES, and the edges themselves
+      (so that a longitude range like EASTERN or WESTERN, which include 0°, is a contiguous range of buckets)
+    - the flare magnitude, CDAW and DONKI CME speeds: the bins [edge_k; edge_k+1[ of their edges
+      (so that a threshold equal to an edge is a contiguous range of buckets)
+    - the last bucket of each criteria holds the events whose value is unknown
+The histogram of any selection whose criteria are edges of the buckets is then a slice of the counts and a sum,
+instead of a new selection of the events and a new np.histogram.
+'''
+
+import os
+
+import numpy as np
+
+from constants import EVENT_TYPES, DELAY_BIN_EDGES
+
+from catalog_fingerprint import dataframe_fingerprint
+from delay_cube import LONGITUDE_SECTOR_EDGES, CME_SPEED_EDGES
+from delay_sweep import DELAYS, _bin_numbers
+
+#Edges of the buckets of the threshold criteria, the thresholds of the sweeps of work.py are edges
+FLARE_MAGNITUDE_EDGES=[0, 1e-6, 1e-5, 5e-5, 1e-4, 5e-4, 1e-3, np.inf]
+THRESHOLD_EDGES={
+    'Flare Magnitude': FLARE_MAGNITUDE_EDGES,
+    'CDAW CME Speed': CME_SPEED_EDGES,
+    'DONKI CME Speed': CME_SPEED_EDGES,
+}
+
+HISTOGRAM_CUBE_PATH="Datasets/my_dataset_histogram_cube.npz"
+
+
+def longitude_buckets(values,edges=LONGITUDE_SECTOR_EDGES):
+    '''
+    Return the longitude bucket of each value: 2k for the edge k, 2k+1 for ]edge_k; edge_k+1[,
+    and 2*len(edges)-1 for the unknown values or the values out of the edges.
+    '''
+    values=np.asarray(values, dtype=float)
+    edges=np.asarray(edges, dtype=float)
+    left=np.searchsorted(edges, values, side='left')
+    on_edge=(left<len(edges)) & (edges[np.minimum(left, len(edges)-1)]==values)
+    inside=(left>0) & (left<len(edges))
+    return np.where(on_edge, 2*left, np.where(inside, 2*left-1, 2*len(edges)-1))
+
+
+def threshold_buckets(values,edges):
+    '''
+    Return the bucket k of each value in [edge_k; edge_k+1[, and len(edges)-1 for the unknown values
+    or the values out of the edges (the last edge must be np.inf).
+    '''
+    assert np.isinf(edges[-1]), 'the last edge of the buckets of a threshold must be np.inf'
+    values=np.asarray(values, dtype=float)
+    buckets=np.searchsorted(edges, values, side='right')-1
+    unknown=np.isnan(values) | (values<edges[0])
+    return np.where(unknown, len(edges)-1, buckets)
+
+
+def compute_histogram_cube(df,event_types=EVENT_TYPES,delays=DELAYS,bin_edges=DELAY_BIN_EDGES,
+                           longitude_edges=LONGITUDE_SECTOR_EDGES,threshold_edges=THRESHOLD_EDGES):
+    '''
+    Compute the histograms of the delays (hours) for every event type x delay x selection bucket.
+
+    Parameters:
+    -----------
+    df : panda DataFrame
+        the dataframe containing all event information
+    event_types : list of string, default to EVENT_TYPES
+    delays : list of string, default to all the delays (CME_TO_MAX, ...)
+    bin_edges : dict, default to DELAY_BIN_EDGES
+        the edges of the bins of each delay (hours)
+    longitude_edges : list of float, default to LONGITUDE_SECTOR_EDGES
+        the edges of the longitude sectors, the ends of the longitude ranges of the selections
+    threshold_edges : dict, default to THRESHOLD_EDGES
+        the edges of the buckets of the threshold columns, the thresholds of the selections
+
+    Returns:
+    --------
+    cube : dict
+        'counts' : numpy array of int32
+            (event type x delay x longitude bucket x one axis per threshold column x bin),
+            the bin axis is padded to the largest number of bins, and is followed by 2 bins
+            for the delays below / above the edges (underflow, overflow)
+        'event_types', 'delays', 'bin_edges', 'longitude_edges', 'threshold_edges' : the parameters
+    '''
+    threshold_columns=list(threshold_edges)
+    nb_bins=max(len(bin_edges[delay])-1 for delay in delays)
+
+    #Bucket of each event, flattened over all the criteria
+    buckets=[longitude_buckets(df['Event Longitude'], longitude_edges)]
+    shape=[2*len(longitude_edges)]
+    for column in threshold_columns:
+        buckets.append(threshold_buckets(df[column], threshold_edges[column]))
+        shape.append(len(threshold_edges[column]))
+    flat_buckets=np.ravel_multi_index(buckets, shape)
+    nb_buckets=int(np.prod(shape))
+
+    counts=np.zeros((len(event_types), len(delays), nb_buckets, nb_bins+2), dtype=np.int32)
+    for j, delay in enumerate(delays):
+        edges=np.asarray(bin_edges[delay], dtype=float)
+        values=np.column_stack([df[event_type + delay].to_numpy(dtype=float) for event_type in event_types])/60.0 #in hours
+        bins=_bin_numbers(values.ravel(), edges).reshape(values.shape)
+        bins[values<edges[0]]=nb_bins
+        bins[values>edges[-1]]=nb_bins+1
+
+        #one bincount for all the event types: (event type, bucket, bin) flattened
+        known=~np.isnan(values)
+        event_positions,type_positions=np.nonzero(known)
+        flat=(type_positions*nb_buckets + flat_buckets[event_positions])*(nb_bins+2) + bins[known]
+        counts[:, j]=np.bincount(flat, minlength=counts[:, j].size).reshape(counts[:, j].shape)
+
+    return {
+        'counts': counts.reshape([len(event_types), len(delays)] + shape + [nb_bins+2]),
+        'event_types': list(event_types),
+        'delays': list(delays),
+        'bin_edges': {delay: np.asarray(bin_edges[delay], dtype=float) for delay in delays},
+        'longitude_edges': np.asarray(longitude_edges, dtype=float),
+        'threshold_edges': {column: np.asarray(threshold_edges[column], dtype=float) for column in threshold_columns},
+    }
+
+
+def _longitude_slice(cube,Event_longitude):
+    if Event_longitude is None:
+        return slice(None)
+    edges=cube['longitude_edges']
+    ends=[np.flatnonzero(edges==float(end)) for end in Event_longitude]
+    if any(len(end)==0 for end in ends):
+        raise ValueError(f'The longitude range {Event_longitude} is not made of edges of the histogram cube {edges.tolist()}')
+    return slice(2*ends[0][0], 2*ends[1][0]+1)
+
+
+def _threshold_slice(cube,column,threshold):
+    if threshold is None:
+        return slice(None)
+    edges=cube['threshold_edges'][column]
+    position=np.flatnonzero(edges==float(threshold))
+    if len(position)==0:
+        raise ValueError(f'The threshold {threshold} of {column} is not an edge of the histogram cube {edges.tolist()}')
+    #the last bucket (unknown values) is never selected by a threshold
+    return slice(position[0], len(edges)-1)
+
+
+def histogram_from_cube(cube,event_type,delay,Event_longitude=None,Flare_magnitude=None,CDAW_speed=None,DONKI_speed=None):
+    '''
+    Return the histogram of a delay for the events of one event type selected by the criteria (see subset_selection),
+    as a slice of the cube and a sum. The ends of the longitude range and the thresholds must be edges of the buckets
+    of the cube, otherwise a ValueError is raised.
+
+    Returns:
+    --------
+    counts : numpy array of int
+        the counts of the bins of cube['bin_edges'][delay]
+    underflow, overflow : int
+        the number of delays below / above the edges
+    '''
+    criteria={'Flare Magnitude': Flare_magnitude, 'CDAW CME Speed': CDAW_speed, 'DONKI CME Speed': DONKI_speed}
+    for column, threshold in criteria.items():
+        if threshold is not None and column not in cube['threshold_edges']:
+            raise ValueError(f'The histogram cube has no bucket for {column}')
+
+    index=(cube['event_types'].index(event_type), cube['delays'].index(delay), _longitude_slice(cube, Event_longitude))
+    index+=tuple(_threshold_slice(cube, column, criteria[column]) for column in cube['threshold_edges'])
+    selected=cube['counts'][index]
+    total=selected.reshape(-1, selected.shape[-1]).sum(axis=0)
+
+    nb_bins=len(cube['bin_edges'][delay])-1
+    return total[:nb_bins], int(total[-2]), int(total[-1])
+
+
+def save_histogram_cube(cube,file_name,fingerprint=None):
+    '''
+    Save the histogram cube in a compressed npz file (the counts are mostly 0).
+    '''
+    arrays={'counts': cube['counts'],
+            'event_types': np.asarray(cube['event_types']),
+            'delays': np.asarray(cube['delays']),
+            'longitude_edges': cube['longitude_edges'],
+            'threshold_columns': np.asarray(list(cube['threshold_edges'])),
+            'fingerprint': np.asarray('' if fingerprint is None else fingerprint)}
+    for delay, edges in cube['bin_edges'].items():
+        arrays[f'{delay} bin_edges']=edges
+    for column, edges in cube['threshold_edges'].items():
+        arrays[f'{column} edges']=edges
+    np.savez_compressed(file_name, **arrays)
+
+
+def load_histogram_cube(file_name):
+    '''
+    Load a histogram cube saved by save_histogram_cube.
+    Returns the cube and the fingerprint of the dataframe it was computed from.
+    '''
+    with np.load(file_name) as data:
+        delays=data['delays'].tolist()
+        cube={'counts': data['counts'],
+              'event_types': data['event_types'].tolist(),
+              'delays': delays,
+              'bin_edges': {delay: data[f'{delay} bin_edges'] for delay in delays},
+              'longitude_edges': data['longitude_edges'],
+              'threshold_edges': {column: data[f'{column} edges'] for column in data['threshold_columns'].tolist()}}
+        fingerprint=str(data['fingerprint'])
+    return cube, fingerprint
+
+
+def load_generate_histogram_cube(df,force=False,file_name=HISTOGRAM_CUBE_PATH):
+    '''
+    This function either loads the histogram cube from its file, or computes it with the default edges and saves it.
+    The cube is computed again if the dataframe (its fingerprint) or the bin edges (DELAY_BIN_EDGES) changed.
+    '''
+    fingerprint=dataframe_fingerprint(df)
+
+    if not force and os.path.exists(file_name):
+        cube,cached_fingerprint=load_histogram_cube(file_name)
+        same_edges=cube['delays']==list(DELAY_BIN_EDGES) and \
+            all(np.array_equal(cube['bin_edges'][delay], DELAY_BIN_EDGES[delay]) for delay in cube['delays'])
+        if cached_fingerprint==fingerprint and same_edges:
+            return cube
+
+    cube=compute_histogram_cube(df)
+    save_histogram_cube(cube, file_name, fingerprint=fingerprint)
+    return cube
+
+
+def test_histogram_cube(df):
+    '''
+    Test that the histograms sliced from the cube (saved and loaded) are the histograms of the delays
+    of the events selected by subset_selection.
+    '''
+    import tempfile
+    from work import subset_selection
+    from constants import EASTERN, WESTERN
+
+    with tempfile.TemporaryDirectory() as directory:
+        file_name=os.path.join(directory, 'histogram_cube.npz')
+        save_histogram_cube(compute_histogram_cube(df), file_name)
+        cube,_=load_histogram_cube(file_name)
+
+    selections=[{}, {'Event_longitude': EASTERN}, {'Event_longitude': WESTERN, 'Flare_magnitude': 1e-5},
+                {'CDAW_speed': 1000, 'DONKI_speed': 500}]
+    for event_type in EVENT_TYPES:
+        for criteria in selections:
+            selected=subset_selection(df, event_type=event_type, **criteria)
+            for delay in DELAYS:
+                values=selected[event_type + delay].dropna().to_numpy(dtype=float)/60.0
+                edges=DELAY_BIN_EDGES[delay]
+                counts,underflow,overflow=histogram_from_cube(cube, event_type, delay, **criteria)
+                assert np.array_equal(counts, np.histogram(values, bins=edges)[0]), (event_type, delay, criteria)
+                assert underflow==np.count_nonzero(values<edges[0]) and overflow==np.count_nonzero(values>edges[-1])
+    print("All tests passed!")
+
+
+if __name__ == '__main__':
+    from constants import EASTERN, WESTERN
+    from delay_sweep import sweep_delay_statistics
+    from work import load_generate_dataset
+
+    #Sweep of the flare magnitude threshold, the histograms of the sweep are slices of the precomputed histogram cube
+    #(fixed bin edges of DELAY_BIN_EDGES)
+    df=load_generate_dataset()
+    histogram_cube=load_generate_histogram_cube(df)
+    sweep=sweep_delay_statistics(df,longitudes=(None,EASTERN,WESTERN),threshold_column='Flare Magnitude',thresholds=[1e-6,1e-5,5e-5,1e-4,5e-4,1e-3],
+                                 histogram_cube=histogram_cube)
+    print(sweep[['event_type','delay','longitude','threshold','count','mean','std']])
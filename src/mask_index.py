@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+'''
+This code build and cache the boolean masks used to select subsets of SEP events.
+
+Each selection criterion of subset_selection (event type, longitude range, flare magnitude, CDAW and DONKI speeds)
+is turned into a boolean mask over the rows of the dataframe.
+The masks are stored in a mask index (a dictionary) the first time they are computed,
+so a selection is only an AND of cached masks followed by a single take of the dataframe.
+If a threshold index (see threshold_index.py) is given, the threshold masks are built from the sorted
+positions instead of scanning the whole column.
+'''
+
+import numpy as np
+
+from constants import EVENT_TYPES, EASTERN, WESTERN, TIME_SEP
+
+from threshold_index import threshold_positions
+
+
+def build_mask_index(df,event_types=EVENT_TYPES,longitude_sectors=(EASTERN,WESTERN),threshold_index=None):
+    '''
+    Create the mask index of a dataframe, and precompute the masks of the event types and longitude sectors.
+    The masks of the flare magnitude and CME speed thresholds are computed the first time they are used.
+
+    Parameters:
+    -----------
+    df : panda DataFrame
+        the dataframe containing all event information
+    event_types : list of string, default to EVENT_TYPES
+        the event types whose masks are precomputed
+    longitude_sectors : list of (float,float), default to (EASTERN,WESTERN)
+        the longitude ranges whose masks are precomputed
+    threshold_index : dict, default to None
+        the threshold index of df (see threshold_index.build_threshold_index),
+        used to build the threshold masks from the sorted positions
+
+    Returns:
+    --------
+    mask_index : dict
+        the mask index of the dataframe, to be given to selection_mask or subset_selection
+    '''
+    mask_index={
+        'index': df.index,
+        'event_type': {},
+        'Event Longitude': {},
+        'Flare Magnitude': {},
+        'CDAW CME Speed': {},
+        'DONKI CME Speed': {},
+        'expression': {},
+        'threshold_index': threshold_index,
+    }
+    if threshold_index is not None:
+        assert threshold_index['n_rows']==len(df), "The threshold index was not built for this dataframe"
+
+    for event_type in event_types:
+        event_type_mask(df, event_type, mask_index=mask_index)
+    for longitude_sector in longitude_sectors:
+        longitude_mask(df, longitude_sector, mask_index=mask_index)
+
+    return mask_index
+
+
+def _cached_mask(mask_index,criterion,value,compute_mask):
+    '''
+    Return the mask of a criterion value from the mask index, computing and storing it if needed.
+    If mask_index is None, the mask is computed without being cached.
+    '''
+    if mask_index is None:
+        return compute_mask()
+
+    masks=mask_index[criterion]
+    if value not in masks:
+        mask=compute_mask()
+        mask.flags.writeable=False #The cached masks are shared between all the selections
+        masks[value]=mask
+    return masks[value]
+
+
+def _check_mask_index(df,mask_index):
+    '''
+    Verify that the mask index was built for this dataframe (same rows in the same order).
+    '''
+    if mask_index is not None:
+        assert mask_index['index'] is df.index or mask_index['index'].equals(df.index), \
+            "The mask index was not built for this dataframe, use build_mask_index(df)"
+
+
+def event_type_mask(df,event_type,mask_index=None):
+    '''
+    Mask of the events that are real events for this event type (the SEP Start Time is defined).
+    '''
+    return _cached_mask(mask_index, 'event_type', event_type,
+                        lambda: df[event_type + TIME_SEP].notnull().to_numpy())
+
+
+def longitude_mask(df,Event_longitude,mask_index=None):
+    '''
+    Mask of the events with a known longitude within [Event_longitude[0]; Event_longitude[1]].
+    '''
+    Event_longitude=(float(Event_longitude[0]), float(Event_longitude[1]))
+    return _cached_mask(mask_index, 'Event Longitude', Event_longitude,
+                        lambda: ((df['Event Longitude'] >= Event_longitude[0]) & (df['Event Longitude'] <= Event_longitude[1])).to_numpy())
+
+
+def threshold_mask(df,column,threshold,mask_index=None):
+    '''
+    Mask of the events with a known value of the column that is >= threshold.
+    The column must be one of 'Flare Magnitude', 'CDAW CME Speed', 'DONKI CME Speed'.
+    '''
+    threshold=float(threshold)
+
+    def compute_mask():
+        if mask_index is not None and mask_index['threshold_index'] is not None and column in mask_index['threshold_index']:
+            #Only the selected events are visited, found by a binary search in the sorted index
+            mask=np.zeros(len(df), dtype=bool)
+            mask[threshold_positions(mask_index['threshold_index'], column, threshold)]=True
+            return mask
+        #NaN values are not >= threshold, so the events with an unknown value are not selected
+        return (df[column] >= threshold).to_numpy()
+
+    return _cached_mask(mask_index, column, threshold, compute_mask)
+
+
+def selection_mask(df,event_type=None,Event_longitude=None,Flare_magnitude=None,CDAW_speed=None,DONKI_speed=None,mask_index=None):
+    '''
+    Return the boolean mask of the events respecting all the selection criteria (see subset_selection).
+    All the criteria are default to None, meaning no selection on that criteria.
+
+    Parameters:
+    -----------
+    df : panda DataFrame
+        the dataframe containing all event information
+    event_type, Event_longitude, Flare_magnitude, CDAW_speed, DONKI_speed :
+        the selection criteria, same as subset_selection
+    mask_index : dict, default to None
+        the mask index of df (see build_mask_index). If None, the masks are computed without being cached.
+
+    Returns:
+    --------
+    mask : numpy array of boolean
+        True for the events respecting all the selection criteria
+    '''
+    _check_mask_index(df, mask_index)
+
+    masks=[]
+    if event_type is not None:
+        masks.append(event_type_mask(df, event_type, mask_index=mask_index))
+    if Event_longitude is not None:
+        masks.append(longitude_mask(df, Event_longitude, mask_index=mask_index))
+    if Flare_magnitude is not None:
+        masks.append(threshold_mask(df, 'Flare Magnitude', Flare_magnitude, mask_index=mask_index))
+    if CDAW_speed is not None:
+        masks.append(threshold_mask(df, 'CDAW CME Speed', CDAW_speed, mask_index=mask_index))
+    if DONKI_speed is not None:
+        masks.append(threshold_mask(df, 'DONKI CME Speed', DONKI_speed, mask_index=mask_index))
+
+    if not masks:
+        return np.ones(len(df), dtype=bool)
+    if len(masks)==1:
+        return masks[0]
+    return np.logical_and.reduce(masks)
+
+
+def test_selection_mask(df):
+    '''
+    Test that the cached masks (with and without a threshold index) select the same events as filtering df directly,
+    and that a selection repeated with the mask index reuses the cached masks.
+    '''
+    from threshold_index import build_threshold_index
+
+    selections=[{'event_type': EVENT_TYPES[0]},
+                {'Event_longitude': EASTERN, 'Flare_magnitude': 1e-5},
+                {'event_type': EVENT_TYPES[-1], 'Event_longitude': WESTERN, 'CDAW_speed': 1000, 'DONKI_speed': 800}]
+    mask_indexes=[build_mask_index(df), build_mask_index(df, threshold_index=build_threshold_index(df))]
+    for criteria in selections:
+        expected=np.ones(len(df), dtype=bool)
+        if 'event_type' in criteria:
+            expected&=df[criteria['event_type'] + TIME_SEP].notnull().to_numpy()
+        if 'Event_longitude' in criteria:
+            expected&=df['Event Longitude'].between(*criteria['Event_longitude']).to_numpy()
+        for column, criterion in [('Flare Magnitude', 'Flare_magnitude'), ('CDAW CME Speed', 'CDAW_speed'), ('DONKI CME Speed', 'DONKI_speed')]:
+            if criterion in criteria:
+                expected&=(df[column]>=criteria[criterion]).to_numpy()
+
+        assert np.array_equal(selection_mask(df, **criteria), expected), criteria
+        for mask_index in mask_indexes:
+            assert np.array_equal(selection_mask(df, mask_index=mask_index, **criteria), expected), criteria
+            assert np.array_equal(selection_mask(df, mask_index=mask_index, **criteria), expected), criteria
+    assert len(mask_indexes[0]['Flare Magnitude'])==1 and len(mask_indexes[0]['CDAW CME Speed'])==1
+    print("All tests passed!")
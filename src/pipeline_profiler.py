@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+'''
+This code instrument the stages of the preparation of the dataframe (see work.prepare_dataframe):
+for each stage, the wall time, the CPU time, the peak RSS (resident memory) of the process at its end and its increase
+during the stage, and the memory of the dataframe returned by the stage are recorded.
+
+The stages are function calls run by the profiler (profiler.run), grouped (eg the conversions, one stage per column).
+A disabled profiler only calls the functions, so the instrumentation costs nothing when it is not wanted.
+The records can be summarized by group, printed, and dumped to a JSON file to compare the load times between versions.
+'''
+
+import json
+import sys
+import time
+
+import pandas as pd
+
+try:
+    import resource
+except ImportError: #not available on Windows
+    resource=None
+
+
+def peak_rss():
+    '''
+    Return the peak RSS of the process since its start (bytes), None if it is not available.
+    '''
+    if resource is None:
+        return None
+    peak=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    #kilobytes on Linux, bytes on macOS
+    return peak if sys.platform=='darwin' else peak*1024
+
+
+def frame_memory(df):
+    '''
+    Return the memory used by a dataframe (bytes, including the strings of the object columns), None if it is not a dataframe.
+    '''
+    if not isinstance(df, pd.DataFrame):
+        return None
+    return int(df.memory_usage(deep=True).sum())
+
+
+class PipelineProfiler:
+    '''
+    Record the wall time, CPU time, peak RSS and dataframe memory of the stages of a pipeline.
+
+    Parameters:
+    -----------
+    enabled : boolean, default to True
+        If False, the stages are only run, nothing is recorded
+    frame_memory : boolean, default to True
+        If True, record the memory of the dataframe returned by each stage (it takes some time for the object columns)
+    '''
+    def __init__(self,enabled=True,frame_memory=True):
+        self.enabled=enabled
+        self.frame_memory=frame_memory
+        self.records=[]
+
+    def run(self,name,function,*args,group=None,**kwargs):
+        '''
+        Run a stage: call function(*args, **kwargs), record it under name (and group) and return its result.
+        '''
+        if not self.enabled:
+            return function(*args, **kwargs)
+
+        peak_before=peak_rss()
+        wall,cpu=time.perf_counter(),time.process_time()
+        result=function(*args, **kwargs)
+        wall,cpu=time.perf_counter()-wall,time.process_time()-cpu
+        peak_after=peak_rss()
+
+        self.records.append({
+            'stage': name,
+            'group': name if group is None else group,
+            'wall_time': wall,
+            'cpu_time': cpu,
+            'peak_rss': peak_after,
+            'peak_rss_increase': None if peak_after is None else peak_after-peak_before,
+            'dataframe_memory': frame_memory(result) if self.frame_memory else None,
+        })
+        return result
+
+    def total(self):
+        '''
+        Return the total wall time and CPU time of the recorded stages (seconds).
+        '''
+        return sum(record['wall_time'] for record in self.records), sum(record['cpu_time'] for record in self.records)
+
+    def summary(self,by_group=True):
+        '''
+        Return the records as a DataFrame, summed by group if by_group is True
+        (the peak RSS and the dataframe memory of a group are the ones at the end of its last stage).
+        '''
+        records=pd.DataFrame(self.records, columns=['stage', 'group', 'wall_time', 'cpu_time', 'peak_rss', 'peak_rss_increase', 'dataframe_memory'])
+        if not by_group:
+            return records
+        return records.groupby('group', sort=False).agg(stages=('stage', 'size'), wall_time=('wall_time', 'sum'), cpu_time=('cpu_time', 'sum'),
+                                                         peak_rss=('peak_rss', 'last'), peak_rss_increase=('peak_rss_increase', 'sum'),
+                                                         dataframe_memory=('dataframe_memory', 'last'))
+
+    def print_summary(self,slowest=5):
+        '''
+        Print the summary by group, and the slowest stages.
+        '''
+        wall,cpu=self.total()
+        print(f'Total: {wall:.3f} s wall time, {cpu:.3f} s CPU time')
+        print(self.summary().to_string())
+        print(f'\n{slowest} slowest stages:')
+        print(self.summary(by_group=False).nlargest(slowest, 'wall_time').to_string())
+
+    def to_dict(self):
+        '''
+        Return the records and the totals as a dict (JSON serializable).
+        '''
+        wall,cpu=self.total()
+        return {'wall_time': wall, 'cpu_time': cpu, 'peak_rss': peak_rss(), 'stages': self.records}
+
+    def save(self,file_name):
+        '''
+        Dump the records and the totals to a JSON file.
+        '''
+        with open(file_name, 'w') as file:
+            json.dump(self.to_dict(), file, indent=1)
+
+
+def test_pipeline_profiler(file_path='Datasets/'):
+    '''
+    Profile stages of known durations, check the records, the summary by group and the JSON dump,
+    check that a disabled profiler records nothing, then profile work.prepare_dataframe on the catalog of file_path.
+    '''
+    import os
+    import tempfile
+    import numpy as np
+
+    def busy(seconds):
+        end=time.process_time()+seconds
+        while time.process_time()<end:
+            pass
+        return seconds
+
+    profiler=PipelineProfiler()
+    df=profiler.run('frame', pd.DataFrame, {'a': range(1000), 'b': ['x']*1000})
+    assert profiler.run('sleep', time.sleep, 0.05, group='waits') is None
+    assert profiler.run('busy', busy, 0.05, group='waits')==0.05
+    records=profiler.summary(by_group=False)
+    assert records['stage'].tolist()==['frame', 'sleep', 'busy'] and records['group'].tolist()==['frame', 'waits', 'waits']
+    assert records.loc[1, 'wall_time']>=0.05 and records.loc[1, 'cpu_time']<0.04
+    assert records.loc[2, 'cpu_time']>=0.05
+    assert records.loc[0, 'dataframe_memory']==frame_memory(df) and pd.isnull(records.loc[1, 'dataframe_memory'])
+    if resource is not None:
+        assert records['peak_rss'].is_monotonic_increasing and (records['peak_rss_increase']>=0).all()
+    summary=profiler.summary()
+    assert summary.index.tolist()==['frame', 'waits'] and summary['stages'].tolist()==[1, 2]
+    assert np.isclose(summary.loc['waits', 'wall_time'], records['wall_time'][1:].sum())
+    assert np.isclose(profiler.total()[0], records['wall_time'].sum())
+    profiler.print_summary(slowest=2)
+
+    with tempfile.TemporaryDirectory() as directory:
+        file_name=os.path.join(directory, 'profile.json')
+        profiler.save(file_name)
+        with open(file_name) as file:
+            saved=json.load(file)
+    assert [stage['stage'] for stage in saved['stages']]==['frame', 'sleep', 'busy'] and np.isclose(saved['wall_time'], profiler.total()[0])
+
+    disabled=PipelineProfiler(enabled=False)
+    assert disabled.run('busy', busy, 0.01)==0.01 and disabled.records==[] and len(disabled.summary())==0
+
+    #the stages of the preparation of the dataframe
+    from work import prepare_dataframe
+    profiler=PipelineProfiler()
+    prepare_dataframe(profiler=profiler, file_path=file_path, notify_changes=False)
+    summary=profiler.summary()
+    assert summary.index.tolist()==['read', 'drop last row', 'conversions', 'delays', 'corrections', 'patch event 410']
+    assert summary['stages'].tolist()==[1, 1, 31, 4, 2, 1]
+    assert summary['dataframe_memory'].notnull().all()
+    print("All tests passed!")
+
+
+if __name__ == '__main__':
+    from work import load_generate_dataset
+
+    #Profile of the generation of the dataset: time and memory of each stage, saved in Datasets/my_dataset_profile.json
+    load_generate_dataset(force=True, profile=True)
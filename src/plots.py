@@ -0,0 +1,396 @@
+#!/usr/bin/env python3
+'''
+This code contains the plots of the dataset: the flux time series of an event (alone or in a grid of events),
+the histograms of delays and the superposed epoch analysis of the flux profiles.
+
+The plots can be shown (the default, plt.show() blocks until the window is closed) or only returned,
+with show=False, to be saved by a batch job (see figure_export.py).
+'''
+
+import numpy as np
+import pandas as pd
+import matplotlib.pyplot as plt
+
+from constants import TIME_FLARE, TIME_CME
+
+from delay_statistics import compute_delay_statistics, MAX_DELAYS, PEAK_DELAYS, NEGATIVE_PEAK_DELAYS_DROPPED
+from flux_reader import load_flux_time_series, load_flux_time_series_batch
+plt.style.use('seaborn-v0_8-darkgrid')
+
+
+def plot_event_markers(ax,event,event_type,markersize=10):
+    '''
+    Plot the times of an event on a flux time series: the max flux and the onset peak (vertical line and point),
+    the SEP start time, the flare X-ray peak time and the CME first look time (vertical lines).
+    '''
+    if pd.notnull(event[event_type + 'Max Flux Time']):
+        Max_flux_time=pd.to_datetime(event[event_type + 'Max Flux Time'])
+        Max_flux=(event[event_type + 'Max Flux (pfu)'])
+        ax.axvline(Max_flux_time, color='red', linestyle='--', label='Max Flux Time')
+        ax.plot(Max_flux_time, Max_flux, 'ro',markersize=markersize)  # Mark the max flux point
+
+    if pd.notnull(event[event_type + 'Onset Peak Time']):
+        Onset_peak_time=pd.to_datetime(event[event_type + 'Onset Peak Time'])
+        Onset_peak_flux=(event[event_type + 'Onset Peak (pfu)'])
+        ax.axvline(Onset_peak_time, color='orange', linestyle='--', label='Onset Peak Time')
+        ax.plot(Onset_peak_time, Onset_peak_flux, 'o', color='orange', markersize=markersize)  # Mark the onset peak point
+        
+    if pd.notnull(event[event_type + 'SEP Start Time']):
+        SEP_start_time=pd.to_datetime(event[event_type + 'SEP Start Time'])
+        ax.axvline(SEP_start_time, color='green', linestyle='--', label='SEP Start Time')
+
+    if pd.notnull(event[TIME_FLARE]):
+        Flare_time=pd.to_datetime(event[TIME_FLARE])
+        ax.axvline(Flare_time, color='yellow', linestyle='--', label='Flare Xray Peak Time')
+    
+    if pd.notnull(event[TIME_CME]):
+        CME_time=pd.to_datetime(event[TIME_CME])
+        ax.axvline(CME_time, color='purple', linestyle='--', label='CME CDAW First Look Time')
+
+
+def plot_flux_time_series(file_path,event,event_type,show=True):
+    '''
+    Plot the flux time series from a given file path.
+    The file is expected to have two columns: Time and Value, separated by whitespace. 
+    It will be imported into a pandas DataFrame.
+    The Time column is converted to datetime format, and the Value column is plotted on a logarithmic scale.
+
+    Parameters:
+    -----------
+    file_path : string
+        the path to the directory containing the flux time series file
+    event : panda Series
+        a row from the dataframe containing all event information
+    event_type : string
+        the type of differential flux to plot for this event (eg '>10.0 MeV 10.0 pfu')
+    show : boolean, default to True
+        If True, show the plot (blocking), else only return it
+
+    Returns:
+    --------
+    fig,ax : the figure and axis object of the plot
+    '''
+
+    #Define which file to open to get the flux time series of the event
+    name_flux_time_series=file_path + event[event_type + 'Flux Time Series']
+
+    #Read the file into a pandas DataFrame, the Time column is converted to datetime format
+    #(from the cache of flux_reader if it was already read)
+    df_plot = load_flux_time_series(name_flux_time_series)
+
+    #Plot the flux versus time on a logarithmic scale for the flux
+    fig,ax=plt.subplots(1,1,figsize=(10,6))
+    ax.plot(df_plot["Time"], df_plot["Flux"], marker='o', linestyle='-')
+    ax.set_yscale('log')
+    ax.set_xlabel('Time (Date)')
+    ax.set_ylabel('Flux (pfu)')
+    ax.set_title(f'Event nb {event.name} \nDifferential Flux:\n{event_type}')
+    ax.grid(True, which="both", ls="--")
+
+    #Plot the max peak, the onset peak, the SEP start, the flare and the CME
+    plot_event_markers(ax, event, event_type)
+
+    ax.legend()
+    if show:
+        plt.show()
+
+    return fig,ax
+
+
+def decimate_min_max(time,flux,nb_columns):
+    '''
+    Decimate a time series for plotting while keeping its shape: the time range is divided in nb_columns
+    columns of equal duration (eg the pixel columns of the axis), and only the points with the minimum and the
+    maximum flux of each column are kept, so the peaks are still visible.
+
+    Parameters:
+    -----------
+    time : numpy array of datetime64 (sorted)
+    flux : numpy array of float
+    nb_columns : int
+        the number of columns (at most 2*nb_columns points are kept)
+
+    Returns:
+    --------
+    positions : numpy array of int
+        the positions of the kept points, in time order
+    '''
+    known=np.flatnonzero(~np.isnan(flux))
+    if len(known)<=2*nb_columns:
+        return known
+
+    elapsed=(time[known]-time[known[0]]).astype('timedelta64[ns]').astype(np.int64)
+    duration=max(int(elapsed[-1]), 1)
+    column=np.minimum(elapsed*nb_columns//duration, nb_columns-1)
+
+    #sorted by column, then by flux: the first and last point of each column are its min and max
+    order=np.lexsort((flux[known], column))
+    starts=np.flatnonzero(np.r_[True, np.diff(column[order])!=0])
+    ends=np.r_[starts[1:], len(order)]-1
+    return known[np.unique(np.concatenate([order[starts], order[ends]]))]
+
+
+def plot_flux_grid(file_path,events,ncols=3,panel_size=(6,4),decimate=True,show=True):
+    '''
+    Plot the flux time series of many events in one figure, one panel per (event, event type),
+    with the max flux, the onset peak, the SEP start, the flare and the CME times of each event.
+    The series are decimated to the number of pixel columns of their panel (see decimate_min_max).
+
+    Parameters:
+    -----------
+    file_path : string
+        the path to the directory containing the flux time series files
+    events : list of (panda Series, string)
+        the events (rows of the dataframe) and the type of differential flux to plot for each of them
+    ncols : int, default to 3
+        the number of panels per row
+    panel_size : (float,float), default to (6,4)
+        the size of each panel (inches)
+    decimate : boolean, default to True
+        If False, all the points of the series are plotted
+    show : boolean, default to True
+        If True, show the plot (blocking), else only return it
+
+    Returns:
+    --------
+    fig,axes : the figure and the array of axis objects of the panels
+    '''
+    nrows=max(1, -(-len(events)//ncols))
+    fig,axes=plt.subplots(nrows, ncols, figsize=(panel_size[0]*ncols, panel_size[1]*nrows), squeeze=False)
+    nb_columns=int(panel_size[0]*fig.dpi)
+
+    #All the files are read concurrently
+    flux_time_series=load_flux_time_series_batch(file_path, events)
+
+    for ax, (event, event_type), df_plot in zip(axes.flat, events, flux_time_series):
+        time=df_plot["Time"].to_numpy()
+        flux=df_plot["Flux"].to_numpy(dtype=float)
+        if decimate:
+            positions=decimate_min_max(time, flux, nb_columns)
+            time,flux=time[positions],flux[positions]
+
+        ax.plot(time, flux, linestyle='-', linewidth=0.8)
+        ax.set_yscale('log')
+        ax.set_title(f'Event nb {event.name}, {event_type}', fontsize=9)
+        ax.grid(True, which="both", ls="--")
+        plot_event_markers(ax, event, event_type, markersize=5)
+        ax.tick_params(axis='x', labelrotation=30, labelsize=7)
+
+    #Empty panels of the last row
+    for ax in axes.flat[len(events):]:
+        ax.set_visible(False)
+
+    #One legend for all the panels (the markers of the events can differ)
+    legend={}
+    for ax in axes.flat[:len(events)]:
+        for handle, label in zip(*ax.get_legend_handles_labels()):
+            legend.setdefault(label, handle)
+    if legend:
+        fig.legend(list(legend.values()), list(legend), loc='upper center', ncol=len(legend))
+    fig.supylabel('Flux (pfu)')
+    #fixed spacing: tight_layout measures all the log ticks of all the panels, which is slow for large grids
+    fig.subplots_adjust(left=0.06, right=0.98, bottom=0.08, top=0.92, hspace=0.5, wspace=0.25)
+    if show:
+        plt.show()
+
+    return fig,axes
+
+
+def plot_delay_histograms(statistics,event_type,delays,names,Event_longitude=None,Flare_magnitude=None,CDAW_speed=None,DONKI_speed=None,debug=False,show=True):
+    '''
+    This function plot the histograms of delays of one event type, from the statistics computed by
+    delay_statistics.compute_delay_statistics (it doesn't compute anything).
+    Parameters:
+    -----------
+    statistics : dict
+        the statistics of the delays (see delay_statistics.compute_delay_statistics).
+        The number of delays below / above the bin edges is shown in the legend
+    event_type : string
+        The type of event (eg TC_10, AB_10...)
+    delays : list of string
+        The delays to plot (eg CME_TO_MAX)
+    names : list of string
+        The name of each delay in the legend (eg 'CME to Max')
+    Event_longitude, Flare_magnitude, CDAW_speed, DONKI_speed :
+        The selection criteria used to compute the statistics (for the title)
+    debug : boolean, default to False
+        If True, print the negative delays
+    show : boolean, default to True
+        If True, show the plot (blocking), else only return it
+
+    Returns:
+    --------
+    fig,ax : the figure and axis object of the plot
+    '''
+    fig,ax=plt.subplots(1,1,figsize=(10,6))
+
+    for delay, name in zip(delays, names):
+        delay_statistics=statistics[event_type][delay]
+        print(f'Mean {name} Delay: {delay_statistics["mean"]:.2f} hours, Std: {delay_statistics["std"]:.2f} hours')
+        label=f' {name} Delay, $\mu$={delay_statistics["mean"]:.2f} h, $\sigma$={delay_statistics["std"]:.2f} h'
+        #The delays out of the bin edges are not in the histogram (but are in the mean and std): show how many
+        out_of_range=[f'{delay_statistics[side]} {side}' for side in ('underflow', 'overflow') if delay_statistics[side]]
+        if out_of_range:
+            label+=f' ({", ".join(out_of_range)} not shown)'
+        ax.stairs(delay_statistics['counts'], delay_statistics['bin_edges'], label=label)
+
+    #Create the title based on the selection criteria
+    title=f'Histogram of Delays for {event_type}, '
+    if Event_longitude is not None:
+        title+=f'longitude {Event_longitude}, '
+    if Flare_magnitude is not None:
+        title+=f'Flare magnitude >= {Flare_magnitude}, '
+    if CDAW_speed is not None:
+        title+=f'CDAW speed >= {CDAW_speed} km/s, '
+    if DONKI_speed is not None:
+        title+=f'DONKI speed >= {DONKI_speed} km/s, '
+    
+    ax.set_xlabel('Delay (hours)')
+    ax.set_ylabel('Number of Events')
+    ax.set_title(title)
+    ax.legend()
+    if show:
+        plt.show()
+
+    if debug:
+        for delay, name in zip(delays, names):
+            values=statistics[event_type][delay]['values']
+            print(f"{name} delays < 0: ({statistics[event_type][delay]['negative']} negative delays in the subset)")
+            print(values[values<0])
+
+    return fig,ax
+
+
+def histogram_of_delays_max(df,event_type,Event_longitude=None,Flare_magnitude=None,CDAW_speed=None,DONKI_speed=None,debug=False,mask_index=None,show=True):
+    '''
+    This function plot the histogram of the delays (CME to Max, Flare to Max, SEP to Max)
+    for a subset of events selected according to the selection criteria.
+    Parameters:
+    -----------
+    df : panda DataFrame
+        the dataframe containing all event information
+    event_type : string
+        The type of event (Threshold Crossing, Above Background, and the differential flux studied).
+        Use the constants defined above (eg TC_10, AB_10...)
+    Event_longitude : (float,float), default to None
+        The minimum and maximum longitude of the events to consider (in degrees)
+    Flare_magnitude : string, default to None
+        The minimum flare magnitude of the SEP. M-class : flare magnitude >= 1e-5 (W/m^2)
+    CDAW_speed : float, default to None
+        The minimum speed of the CME from the CDAW catalog (km/s)
+    DONKI_speed : float, default to None
+        The minimum speed of the CME from the DONKI catalog (km/s)
+    mask_index : dict, default to None
+        The mask index of df (see mask_index.build_mask_index), to reuse the selection masks between calls
+    show : boolean, default to True
+        If True, show the plot (blocking), else only return it
+    '''
+    #Computing the statistics of the delays (in hours) of the subset of events selected according to the selection criteria
+    statistics=compute_delay_statistics(df, event_types=[event_type], delays=MAX_DELAYS, Event_longitude=Event_longitude, Flare_magnitude=Flare_magnitude,
+                                        CDAW_speed=CDAW_speed, DONKI_speed=DONKI_speed, mask_index=mask_index)
+    print(f"{statistics[event_type]['n_events']} events in the subset") #to see if there is enough data
+
+    return plot_delay_histograms(statistics, event_type, MAX_DELAYS, ['CME to Max', 'Flare to Max', 'SEP to Max'],
+                                 Event_longitude=Event_longitude, Flare_magnitude=Flare_magnitude, CDAW_speed=CDAW_speed, DONKI_speed=DONKI_speed, debug=debug, show=show)
+
+
+def histogram_of_delays_peak(df,event_type,Event_longitude=None,Flare_magnitude=None,CDAW_speed=None,DONKI_speed=None,debug=False,mask_index=None,show=True):
+    '''
+    This function plot the histogram of the delays (CME to Peak, Flare to Peak, SEP to Peak)
+    for a subset of events selected according to the selection criteria.
+    Parameters:
+    -----------
+    df : panda DataFrame
+        the dataframe containing all event information
+    event_type : string
+        The type of event (Threshold Crossing, Above Background, and the differential flux studied).
+        Use the constants defined above (eg TC_10, AB_10...)
+    Event_longitude : (float,float), default to None
+        The minimum and maximum longitude of the events to consider (in degrees)
+    Flare_magnitude : string, default to None
+        The minimum flare magnitude of the SEP. M-class : flare magnitude >= 1e-5 (W/m^2)
+    CDAW_speed : float, default to None
+        The minimum speed of the CME from the CDAW catalog (km/s)
+    DONKI_speed : float, default to None
+        The minimum speed of the CME from the DONKI catalog (km/s)
+    mask_index : dict, default to None
+        The mask index of df (see mask_index.build_mask_index), to reuse the selection masks between calls
+    show : boolean, default to True
+        If True, show the plot (blocking), else only return it
+    '''
+    #Computing the statistics of the delays (in hours) of the subset of events selected according to the selection criteria
+    #TO BE DELETED WHEN ISSUE ON NEGATIVE DELAYS IS FIXED : the negative Flare to Peak and SEP to Peak delays are removed
+    statistics=compute_delay_statistics(df, event_types=[event_type], delays=PEAK_DELAYS, Event_longitude=Event_longitude, Flare_magnitude=Flare_magnitude,
+                                        CDAW_speed=CDAW_speed, DONKI_speed=DONKI_speed, drop_negative=NEGATIVE_PEAK_DELAYS_DROPPED, mask_index=mask_index)
+    print(f"{statistics[event_type]['n_events']} events in the subset") #to see if there is enough data
+
+    return plot_delay_histograms(statistics, event_type, PEAK_DELAYS, ['CME to Peak', 'Flare to Peak', 'SEP to Peak'],
+                                 Event_longitude=Event_longitude, Flare_magnitude=Flare_magnitude, CDAW_speed=CDAW_speed, DONKI_speed=DONKI_speed, debug=debug, show=show)
+
+
+def test_decimate_min_max(nb_points=20000,nb_columns=300):
+    '''
+    Test that the decimated series keeps, for each column of time, the points with the min and max flux of the column,
+    in time order, and never keeps the unknown fluxes.
+    '''
+    rng=np.random.default_rng(0)
+    time=np.datetime64('2020-01-01T00:00')+np.cumsum(rng.integers(1, 10, nb_points)).astype('timedelta64[m]')
+    flux=rng.lognormal(0, 2, nb_points)
+    flux[rng.random(nb_points)<0.05]=np.nan
+
+    positions=decimate_min_max(time, flux, nb_columns)
+    assert len(positions)<=2*nb_columns and np.all(np.diff(positions)>0) and not np.isnan(flux[positions]).any()
+
+    known=np.flatnonzero(~np.isnan(flux))
+    elapsed=(time[known]-time[known[0]]).astype(np.int64)
+    columns=np.minimum(elapsed*nb_columns//elapsed[-1], nb_columns-1)
+    for column in np.unique(columns):
+        values=flux[known[columns==column]]
+        kept=flux[positions][np.isin(positions, known[columns==column])]
+        assert kept.min()==values.min() and kept.max()==values.max(), column
+
+    assert np.array_equal(decimate_min_max(time[:100], flux[:100], nb_columns), np.flatnonzero(~np.isnan(flux[:100])))
+    print("All tests passed!")
+
+
+def plot_superposed_epoch(epochs,event_types=None,alignment=TIME_FLARE,show=True):
+    '''
+    This function plot the superposed epoch analysis of the flux profiles (see superposed_epoch.superposed_epoch):
+    the median profile of each event type, and the envelopes between the symmetric percentiles (eg 10-90 and 25-75).
+    Parameters:
+    -----------
+    epochs : dict
+        the superposed epochs (see superposed_epoch.superposed_epoch)
+    event_types : list of string, default to None
+        the event types to plot, all the event types of epochs if None
+    alignment : string, default to TIME_FLARE
+        the alignment time of the epochs (for the axis label)
+    show : boolean, default to True
+        If True, show the plot (blocking), else only return it
+
+    Returns:
+    --------
+    fig,ax : the figure and axis object of the plot
+    '''
+    if event_types is None:
+        event_types=list(epochs)
+    fig,ax=plt.subplots(1,1,figsize=(10,6))
+
+    for event_type in event_types:
+        epoch=epochs[event_type]
+        line,=ax.plot(epoch['grid'], epoch['median'], label=f'{event_type} median ({len(epoch["events"])} events)')
+        percentiles=sorted(epoch['percentiles'])
+        for k in range(len(percentiles)//2):
+            low,high=percentiles[k],percentiles[-k-1]
+            ax.fill_between(epoch['grid'], epoch['percentiles'][low], epoch['percentiles'][high], color=line.get_color(), alpha=0.15, linewidth=0)
+
+    ax.axvline(0, color='black', linestyle='--')
+    ax.set_yscale('log')
+    ax.set_xlabel(f'Time from {alignment} (hours)')
+    ax.set_ylabel('Flux (pfu)')
+    ax.set_title('Superposed epoch analysis of the flux profiles')
+    ax.legend()
+    if show:
+        plt.show()
+
+    return fig,ax
@@ -0,0 +1,362 @@
+#!/usr/bin/env python3
+'''
+This code allow to select SEP events with a selection expression, written as a python boolean expression:
+
+    "event(TC_10) and longitude in WESTERN and flare_magnitude >= 1e-5"
+    "event(AB_100) and -30 <= latitude <= 30 and (cdaw_speed >= 1000 or donki_speed >= 1000)"
+    "event(TC_30) and gle and spacecraft in ['GOES-08', 'GOES-11'] and not known(active_region)"
+
+Supported:
+    - comparisons (<, <=, >, >=, ==, !=), also chained (a <= x <= b) for ranges and upper bounds
+    - 'x in [...]' / 'x not in [...]' to compare to a list of values
+    - 'x in EASTERN' / 'x in WESTERN' for the longitude sectors
+    - and, or, not (or &, |, ~) and parenthesis
+    - event(TC_10...AB_100) : the SEP Start Time of this event type is defined (a real event)
+    - known(x) or a name alone (eg gle) : the value is defined
+    - between(x, a, b) : a <= x <= b
+The names are the aliases of COLUMN_ALIASES, or any column written as col('Column Name').
+A comparison with an unknown value (NaN) is always False, like in subset_selection, and so is its negation:
+"not cdaw_speed >= 1000" doesn't select the events without a CDAW speed (the unknown values follow a three-valued logic
+through and, or and not, an unknown comparison is only decided by the other operands, eg "x >= 1 or gle").
+
+Each expression is compiled once into a function evaluating the mask with vectorized numpy operations,
+and the compiled functions are cached by the normalized text of the expression
+(a bounded LRU cache, the least recently used expressions are compiled again).
+'''
+
+import ast
+import functools
+import operator
+
+import numpy as np
+import pandas as pd
+
+from constants import TC_10, TC_30, TC_50, TC_100, AB_10, AB_30, AB_50, AB_100
+from constants import EASTERN, WESTERN, TIME_SEP
+
+#Names that can be used in the expressions, and the column they refer to
+COLUMN_ALIASES={
+    'longitude': 'Event Longitude',
+    'latitude': 'Event Latitude',
+    'flare_magnitude': 'Flare Magnitude',
+    'flare_class': 'Flare Class',
+    'cdaw_speed': 'CDAW CME Speed',
+    'donki_speed': 'DONKI CME Speed',
+    'cme_width': 'CME Width',
+    'active_region': 'Active Region',
+    'gle': 'GLE Event Number',
+    'spacecraft': 'Experiment',
+}
+
+EVENT_TYPE_NAMES={'TC_10': TC_10, 'TC_30': TC_30, 'TC_50': TC_50, 'TC_100': TC_100,
+                  'AB_10': AB_10, 'AB_30': AB_30, 'AB_50': AB_50, 'AB_100': AB_100}
+
+SECTOR_NAMES={'EASTERN': EASTERN, 'WESTERN': WESTERN}
+
+_COMPARISONS={ast.Lt: operator.lt, ast.LtE: operator.le, ast.Gt: operator.gt, ast.GtE: operator.ge,
+              ast.Eq: operator.eq, ast.NotEq: operator.ne}
+
+#Maximum number of compiled expressions kept in the cache
+COMPILED_EXPRESSIONS_SIZE=256
+
+
+def normalize_expression(expression):
+    '''
+    Return the normalized text of an expression (same spacing, parenthesis and quotes),
+    so that two writings of the same expression share the same compiled function.
+    '''
+    return ast.unparse(ast.parse(expression.strip(), mode='eval'))
+
+
+def compile_expression(expression):
+    '''
+    Compile a selection expression into a function returning the boolean mask of the selected events.
+    The compiled functions are cached by the normalized text of the expression.
+
+    Parameters:
+    -----------
+    expression : string
+        the selection expression (see the description of the module)
+
+    Returns:
+    --------
+    evaluate : function
+        evaluate(df) returns a numpy array of boolean, True for the selected events of df
+    '''
+    return _compile_normalized(normalize_expression(expression))
+
+
+@functools.lru_cache(maxsize=COMPILED_EXPRESSIONS_SIZE)
+def _compile_normalized(key):
+    tree=ast.parse(key, mode='eval')
+    predicate=_compile_predicate(tree.body)
+    #the events whose selection is unknown are not selected
+    return lambda df: predicate(df)[0]
+
+
+def expression_mask(df,expression,mask_index=None):
+    '''
+    Return the boolean mask of the events of df selected by the expression.
+    If the mask index of df is given (see mask_index.build_mask_index), the mask is cached in it.
+    '''
+    key=normalize_expression(expression)
+    if mask_index is None:
+        return compile_expression(key)(df)
+
+    masks=mask_index.setdefault('expression', {})
+    if key not in masks:
+        mask=compile_expression(key)(df)
+        mask.flags.writeable=False
+        masks[key]=mask
+    return masks[key]
+
+
+def select_events(df,expression,mask_index=None):
+    '''
+    Return the subset of the events of df selected by the expression (a single take of the dataframe).
+    '''
+    return df.loc[expression_mask(df, expression, mask_index=mask_index)]
+
+
+def _syntax_error(node,message):
+    return ValueError(f"{message} in the selection expression: '{ast.unparse(node)}'")
+
+
+def _column_name(node):
+    '''
+    Return the column referred to by a name (alias) or by col('Column Name').
+    '''
+    if isinstance(node, ast.Name) and node.id in COLUMN_ALIASES:
+        return COLUMN_ALIASES[node.id]
+    if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id=='col' \
+            and len(node.args)==1 and isinstance(node.args[0], ast.Constant) and isinstance(node.args[0].value, str):
+        return node.args[0].value
+    return None
+
+
+def _constant(node):
+    '''
+    Return the value of a constant (number, string, or list/tuple of constants), and if it is a constant.
+    '''
+    if isinstance(node, ast.Constant):
+        return node.value, True
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.USub, ast.UAdd)) and isinstance(node.operand, ast.Constant):
+        value=node.operand.value
+        return (-value if isinstance(node.op, ast.USub) else value), True
+    if isinstance(node, (ast.List, ast.Tuple)):
+        values=[_constant(element) for element in node.elts]
+        if all(is_constant for _, is_constant in values):
+            return [value for value, _ in values], True
+    return None, False
+
+
+def _column_values(df,column,numeric):
+    '''
+    Return the values of a column as a numpy array, converted to numbers if they are compared to numbers.
+    '''
+    if numeric:
+        return pd.to_numeric(df[column], errors='coerce').to_numpy(dtype=float)
+    return df[column].to_numpy()
+
+
+def _known(mask):
+    '''
+    Return a mask with all its values known (eg event(...) or known(...), which are never unknown).
+    '''
+    return mask, np.ones(len(mask), dtype=bool)
+
+
+def _logical_and(results):
+    '''
+    AND of (mask, known) results: it is known if all the operands are known, or if one of them is known to be False.
+    '''
+    masks=np.logical_and.reduce([mask for mask, _ in results])
+    knowns=np.logical_and.reduce([known for _, known in results])
+    false=np.logical_or.reduce([known & ~mask for mask, known in results])
+    return masks, knowns | false
+
+
+def _logical_or(results):
+    '''
+    OR of (mask, known) results: it is known if all the operands are known, or if one of them is True.
+    '''
+    masks=np.logical_or.reduce([mask for mask, _ in results])
+    knowns=np.logical_and.reduce([known for _, known in results])
+    return masks, knowns | masks
+
+
+def _compile_comparison(node):
+    '''
+    Compile a (possibly chained) comparison: each (left, operator, right) is a mask, and they are ANDed.
+    '''
+    masks=[]
+    operands=[node.left] + node.comparators
+    for left, op, right in zip(operands[:-1], node.ops, operands[1:]):
+        masks.append(_compile_single_comparison(node, left, op, right))
+    return lambda df: _logical_and([mask(df) for mask in masks])
+
+
+def _compile_single_comparison(node,left,op,right):
+    '''
+    Compile the comparison of a column with a constant into a function returning (mask, known),
+    known being False for the events whose value is unknown (the comparison is then False, and so is its negation).
+    '''
+    #Sector of longitude: x in EASTERN / x in WESTERN
+    if isinstance(op, (ast.In, ast.NotIn)) and isinstance(right, ast.Name) and right.id in SECTOR_NAMES:
+        column=_column_name(left)
+        if column is None:
+            raise _syntax_error(node, "A longitude sector must be compared to a column")
+        low,high=SECTOR_NAMES[right.id]
+        negate=isinstance(op, ast.NotIn)
+
+        def sector_mask(df):
+            values=_column_values(df, column, numeric=True)
+            known=~np.isnan(values)
+            mask=(values>=low) & (values<=high)
+            return ((~mask & known) if negate else mask), known
+        return sector_mask
+
+    column=_column_name(left)
+    value,is_constant=_constant(right)
+    if column is None:
+        #constant on the left side (eg 500 <= cdaw_speed), the comparison is reversed
+        column=_column_name(right)
+        value,is_constant=_constant(left)
+        reversed_ops={ast.Lt: ast.Gt, ast.LtE: ast.GtE, ast.Gt: ast.Lt, ast.GtE: ast.LtE}
+        if type(op) in reversed_ops:
+            op=reversed_ops[type(op)]()
+    if column is None or not is_constant:
+        raise _syntax_error(node, "A comparison must be between a column and a constant")
+
+    #Membership in a list of values
+    if isinstance(op, (ast.In, ast.NotIn)):
+        if not isinstance(value, list):
+            raise _syntax_error(node, "'in' must be followed by a list of values or a longitude sector")
+        numeric=all(isinstance(element, (int, float)) for element in value)
+        negate=isinstance(op, ast.NotIn)
+
+        def membership_mask(df):
+            values=_column_values(df, column, numeric)
+            known=pd.notnull(values)
+            mask=np.isin(values, value)
+            return ((~mask & known) if negate else mask), known
+        return membership_mask
+
+    if type(op) not in _COMPARISONS:
+        raise _syntax_error(node, f"Unsupported comparison {type(op).__name__}")
+    compare=_COMPARISONS[type(op)]
+    numeric=isinstance(value, (int, float)) and not isinstance(value, bool)
+
+    def comparison_mask(df):
+        values=_column_values(df, column, numeric)
+        known=pd.notnull(values)
+        mask=np.zeros(len(values), dtype=bool)
+        #an unknown value never respects a criteria
+        mask[known]=compare(values[known], value)
+        return mask, known
+    return comparison_mask
+
+
+def _compile_call(node):
+    '''
+    Compile the functions event(...), known(...), between(...).
+    '''
+    name=node.func.id if isinstance(node.func, ast.Name) else None
+
+    if name=='event' and len(node.args)==1:
+        argument=node.args[0]
+        if isinstance(argument, ast.Name) and argument.id in EVENT_TYPE_NAMES:
+            event_type=EVENT_TYPE_NAMES[argument.id]
+        elif isinstance(argument, ast.Constant) and argument.value in EVENT_TYPE_NAMES.values():
+            event_type=argument.value
+        else:
+            raise _syntax_error(node, "Unknown event type")
+        return lambda df: _known(df[event_type + TIME_SEP].notnull().to_numpy())
+
+    if name=='known' and len(node.args)==1 and _column_name(node.args[0]) is not None:
+        column=_column_name(node.args[0])
+        return lambda df: _known(df[column].notnull().to_numpy())
+
+    if name=='between' and len(node.args)==3 and _column_name(node.args[0]) is not None:
+        comparison=ast.Compare(left=node.args[1], ops=[ast.LtE(), ast.LtE()], comparators=[node.args[0], node.args[2]])
+        return _compile_comparison(comparison)
+
+    if _column_name(node) is not None: #col('Column Name') alone
+        column=_column_name(node)
+        return lambda df: _known(df[column].notnull().to_numpy())
+
+    raise _syntax_error(node, "Unsupported function")
+
+
+def _compile_predicate(node):
+    '''
+    Compile a node of the expression into a function returning (mask, known):
+    the boolean mask of the events respecting the node, and the mask of the events for which it is known.
+    '''
+    if isinstance(node, ast.BoolOp) or (isinstance(node, ast.BinOp) and isinstance(node.op, (ast.BitAnd, ast.BitOr))):
+        if isinstance(node, ast.BoolOp):
+            operands=[_compile_predicate(value) for value in node.values]
+            combine=_logical_and if isinstance(node.op, ast.And) else _logical_or
+        else:
+            operands=[_compile_predicate(node.left), _compile_predicate(node.right)]
+            combine=_logical_and if isinstance(node.op, ast.BitAnd) else _logical_or
+        return lambda df: combine([operand(df) for operand in operands])
+
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.Not, ast.Invert)):
+        operand=_compile_predicate(node.operand)
+
+        def negation(df):
+            #the negation of an unknown comparison is still unknown, so not selected
+            mask,known=operand(df)
+            return ~mask & known, known
+        return negation
+
+    if isinstance(node, ast.Compare):
+        return _compile_comparison(node)
+
+    if isinstance(node, ast.Call):
+        return _compile_call(node)
+
+    if isinstance(node, ast.Name) and node.id in COLUMN_ALIASES: #a name alone means the value is known (eg gle)
+        column=COLUMN_ALIASES[node.id]
+        return lambda df: _known(df[column].notnull().to_numpy())
+
+    if isinstance(node, ast.Name) and node.id in EVENT_TYPE_NAMES: #an event type alone means event(...)
+        event_type=EVENT_TYPE_NAMES[node.id]
+        return lambda df: _known(df[event_type + TIME_SEP].notnull().to_numpy())
+
+    raise _syntax_error(node, "Unsupported expression")
+
+
+def test_expression_mask(df):
+    '''
+    Test the selection expressions against the equivalent pandas filters of df,
+    in particular that a negation never selects the events whose value is unknown.
+    '''
+    cdaw=df['CDAW CME Speed']
+    longitude=df['Event Longitude']
+    gle=df['GLE Event Number'].notnull()
+    tests={
+        'cdaw_speed >= 1000': cdaw>=1000,
+        'not cdaw_speed >= 1000': cdaw<1000,
+        '~(cdaw_speed >= 1000)': cdaw<1000,
+        'not not cdaw_speed >= 1000': cdaw>=1000,
+        'not (cdaw_speed >= 1000 and longitude in WESTERN)': (cdaw<1000) | (longitude<0),
+        'not (cdaw_speed >= 1000 or gle)': (cdaw<1000) & ~gle,
+        'cdaw_speed >= 1000 or gle': (cdaw>=1000) | gle,
+        'not (cdaw_speed >= 1000 or known(cdaw_speed))': pd.Series(False, index=df.index),
+        'not longitude in EASTERN': longitude>0,
+        'longitude not in EASTERN': longitude>0,
+        '-30 <= longitude <= 30': longitude.between(-30, 30),
+        'not -30 <= longitude <= 30': (longitude<-30) | (longitude>30),
+        'event(TC_10) and not event(AB_100)': df[TC_10 + TIME_SEP].notnull() & df[AB_100 + TIME_SEP].isnull(),
+    }
+    for expression, expected in tests.items():
+        assert np.array_equal(expression_mask(df, expression), expected.to_numpy()), expression
+
+    #the compiled expressions are shared by the writings of the same expression, and their number is bounded
+    assert compile_expression('cdaw_speed>=1000') is compile_expression('( cdaw_speed >= 1000 )')
+    for speed in range(COMPILED_EXPRESSIONS_SIZE+10):
+        compile_expression(f'cdaw_speed >= {speed}')
+    assert _compile_normalized.cache_info().currsize==COMPILED_EXPRESSIONS_SIZE
+    print("All tests passed!")
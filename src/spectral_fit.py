@@ -0,0 +1,352 @@
+#!/usr/bin/env python3
+'''
+This code fit the fluence spectra of all the events and event types (see fluence_spectrum.py) in one batch,
+with 2 models in log space (x=log10(E), y=log10(fluence)):
+    - a power law: y = a - gamma*x
+    - a double power law, continuous at the break energy Eb (xb=log10(Eb)):
+      y = a - gamma_low*min(x-xb, 0) - gamma_high*max(x-xb, 0)
+
+The power law is a linear least squares fit, solved for all the spectra at once from the sums of x, y, x^2 and x*y of each spectrum.
+For a given break, the double power law is also linear (3 parameters): the normal equations of all the spectra
+and all the breaks of a grid are built at once (cumulative sums over the flat arrays) and solved as a stack of 3x3 systems,
+and the break of least residual is kept. The break is then refined between the neighbouring breaks of the grid
+(a nonlinear fit: golden section search, vectorized over the spectra), optionally in a pool of processes.
+
+The residuals are in dex (log10), the points with a fluence <= 0 or unknown are not fitted.
+'''
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from catalog_fingerprint import dataframe_fingerprint
+from fluence_spectrum import ENERGY_BIN_CENTERS
+from subset_cache import forget_fingerprint
+
+SPECTRAL_FITS_PATH="Datasets/my_dataset_spectral_fits.npz"
+
+#Breaks of the double power law tried (MeV), between the energy bins of the GOES spectra (1 to 700 MeV)
+BREAK_GRID=np.geomspace(3, 400, 43)
+
+#Minimum number of points on each side of the break of a double power law
+MIN_POINTS_PER_SIDE=2
+
+#Iterations of the golden section search of the break (the bracket shrinks by 0.618 each time)
+BREAK_REFINE_ITERATIONS=30
+
+#Names of the columns of the results (preceded by the event type)
+SPECTRAL_INDEX='Spectral Index'
+SPECTRAL_INDEX_LOW='Spectral Index Low'
+SPECTRAL_INDEX_HIGH='Spectral Index High'
+SPECTRAL_BREAK='Spectral Break (MeV)'
+POWER_LAW_RMS='Power Law rms (dex)'
+DOUBLE_POWER_LAW_RMS='Double Power Law rms (dex)'
+SPECTRAL_FIT_POINTS='Spectral Fit Points'
+SPECTRAL_FIT_COLUMNS=[SPECTRAL_INDEX, POWER_LAW_RMS, SPECTRAL_INDEX_LOW, SPECTRAL_INDEX_HIGH, SPECTRAL_BREAK, DOUBLE_POWER_LAW_RMS, SPECTRAL_FIT_POINTS]
+
+
+def _fit_points(spectra):
+    '''
+    Return the points of all the spectra that can be fitted, as flat arrays:
+    the spectrum of each point (k*n_rows + row position), x=log10(energy), y=log10(fluence), and the number of spectra.
+    '''
+    offsets=spectra['offsets']
+    n_spectra=offsets.shape[0]*(offsets.shape[1]-1)
+    lengths=(offsets[:, 1:]-offsets[:, :-1]).ravel()
+    spectrum=np.repeat(np.arange(n_spectra), lengths)
+    energy=np.concatenate([spectra['energy_center'][offsets[k, 0]:offsets[k, -1]] for k in range(offsets.shape[0])])
+    fluence=np.concatenate([spectra['fluence'][offsets[k, 0]:offsets[k, -1]] for k in range(offsets.shape[0])])
+    valid=(fluence>0) & (energy>0)
+    return spectrum[valid], np.log10(energy[valid]), np.log10(fluence[valid]), n_spectra
+
+
+def _segment_sums(values,bounds):
+    '''
+    Sum the rows of values (points x ...) within each segment [bounds[s]; bounds[s+1]) of the sorted points.
+    '''
+    cumulative=np.concatenate([np.zeros((1,) + values.shape[1:]), np.cumsum(values, axis=0)])
+    return cumulative[bounds[1:]] - cumulative[bounds[:-1]]
+
+
+def fit_power_law(spectrum,x,y,n_spectra):
+    '''
+    Fit a power law to all the spectra at once (linear least squares in log space).
+    Returns the index gamma, the intercept a, the rms of the residuals (dex) and the number of points of each spectrum
+    (NaN if the spectrum has less than 2 points).
+    '''
+    bounds=np.searchsorted(spectrum, np.arange(n_spectra+1))
+    n,sx,sy,sxx,sxy=_segment_sums(np.stack([np.ones_like(x), x, y, x*x, x*y], axis=1), bounds).T
+    with np.errstate(invalid='ignore', divide='ignore'):
+        slope=(n*sxy-sx*sy)/(n*sxx-sx*sx)
+        intercept=(sy-slope*sx)/n
+    fitted=n>=2
+    slope,intercept=np.where(fitted, slope, np.nan),np.where(fitted, intercept, np.nan)
+    #the residuals of the spectra not fitted are NaN, they would spread to the next spectra through the cumulative sums
+    residuals=np.where(fitted[spectrum], y-intercept[spectrum]-slope[spectrum]*x, 0.0)
+    with np.errstate(invalid='ignore'):
+        rms=np.sqrt(_segment_sums(residuals**2, bounds)/n)
+    return -slope, intercept, np.where(fitted, rms, np.nan), n.astype(np.int64)
+
+
+def _double_power_law_residuals(spectrum,x,y,bounds,breaks):
+    '''
+    Fit the double power law of each spectrum for given breaks (log10(MeV)), breaks being (n_spectra x n_breaks).
+    Returns the sum of the squared residuals (inf if there are not enough points on each side of the break)
+    and the parameters (n_spectra x n_breaks x 3: a, -gamma_low, -gamma_high).
+    '''
+    offset=x[:, None]-breaks[spectrum]
+    u,v=np.minimum(offset, 0.0),np.maximum(offset, 0.0)
+    #u*v is always 0
+    sums=_segment_sums(np.stack([np.ones_like(u), u, v, u*u, v*v, y[:, None]*np.ones_like(u), u*y[:, None], v*y[:, None],
+                                 (offset<0).astype(float), (offset>0).astype(float)], axis=-1), bounds)
+    n,su,sv,suu,svv,sy,suy,svy,n_low,n_high=np.moveaxis(sums, -1, 0)
+    matrix=np.stack([np.stack([n, su, sv], axis=-1), np.stack([su, suu, np.zeros_like(n)], axis=-1), np.stack([sv, np.zeros_like(n), svv], axis=-1)], axis=-2)
+    vector=np.stack([sy, suy, svy], axis=-1)
+
+    valid=(n_low>=MIN_POINTS_PER_SIDE) & (n_high>=MIN_POINTS_PER_SIDE)
+    matrix[~valid]=np.eye(3)
+    parameters=np.linalg.solve(matrix, vector[..., None])[..., 0]
+    parameters[~valid]=np.nan
+
+    a,b_low,b_high=np.moveaxis(parameters, -1, 0)
+    residuals=np.where(valid[spectrum], y[:, None]-a[spectrum]-b_low[spectrum]*u-b_high[spectrum]*v, 0.0)
+    rss=_segment_sums(residuals**2, bounds)
+    return np.where(valid, rss, np.inf), parameters
+
+
+def _refine_breaks(spectrum,x,y,n_spectra,lower,upper,iterations=BREAK_REFINE_ITERATIONS):
+    '''
+    Refine the break of each spectrum between lower and upper (log10(MeV)) by a golden section search of the least residual,
+    all the spectra at once. Returns the breaks.
+    '''
+    bounds=np.searchsorted(spectrum, np.arange(n_spectra+1))
+    ratio=(np.sqrt(5)-1)/2
+
+    def rss(breaks):
+        return _double_power_law_residuals(spectrum, x, y, bounds, breaks[:, None])[0][:, 0]
+
+    c,d=upper-ratio*(upper-lower),lower+ratio*(upper-lower)
+    rss_c,rss_d=rss(c),rss(d)
+    for _ in range(iterations):
+        left=rss_c<=rss_d
+        #the minimum is in [lower; d] if rss(c)<=rss(d), else in [c; upper]
+        upper,lower=np.where(left, d, upper),np.where(left, lower, c)
+        c,d=np.where(left, upper-ratio*(upper-lower), d),np.where(left, c, lower+ratio*(upper-lower))
+        new=rss(np.where(left, c, d))
+        rss_c,rss_d=np.where(left, new, rss_d),np.where(left, rss_c, new)
+    return (lower+upper)/2
+
+
+def _refine_chunk(arguments):
+    '''
+    Refine the breaks of a chunk of spectra (run in a process of the pool).
+    '''
+    return _refine_breaks(*arguments)
+
+
+def fit_double_power_law(spectrum,x,y,n_spectra,break_grid=BREAK_GRID,refine=True,n_jobs=1):
+    '''
+    Fit a double power law to all the spectra at once: the best break of the grid, refined if refine is True.
+    Returns the low and high energy indices, the break (MeV) and the rms of the residuals (dex) of each spectrum
+    (NaN if no break of the grid has MIN_POINTS_PER_SIDE points on each side).
+    '''
+    bounds=np.searchsorted(spectrum, np.arange(n_spectra+1))
+    grid=np.log10(np.asarray(break_grid, dtype=float))
+    rss,_=_double_power_law_residuals(spectrum, x, y, bounds, np.broadcast_to(grid, (n_spectra, len(grid))))
+    best=np.argmin(rss, axis=1)
+    fitted=np.isfinite(rss[np.arange(n_spectra), best])
+    breaks=grid[best]
+
+    if refine and np.any(fitted):
+        lower,upper=grid[np.maximum(best-1, 0)],grid[np.minimum(best+1, len(grid)-1)]
+        chunks=np.array_split(np.flatnonzero(fitted), max(1, n_jobs))
+        tasks=[]
+        for chunk in chunks:
+            points=np.isin(spectrum, chunk)
+            #renumber the spectra of the chunk from 0
+            tasks.append((np.searchsorted(chunk, spectrum[points]), x[points], y[points], len(chunk), lower[chunk], upper[chunk]))
+        if n_jobs>1:
+            with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+                refined=list(executor.map(_refine_chunk, tasks))
+        else:
+            refined=[_refine_chunk(task) for task in tasks]
+        for chunk, chunk_breaks in zip(chunks, refined):
+            breaks[chunk]=chunk_breaks
+        #keep the break of the grid if the refined one is worse (the residual is not unimodal between the bounds)
+        refined_rss,_=_double_power_law_residuals(spectrum, x, y, bounds, breaks[:, None])
+        worse=refined_rss[:, 0]>rss[np.arange(n_spectra), best]
+        breaks=np.where(worse, grid[best], breaks)
+
+    final_rss,parameters=_double_power_law_residuals(spectrum, x, y, bounds, breaks[:, None])
+    n=np.bincount(spectrum, minlength=n_spectra)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        rms=np.sqrt(final_rss[:, 0]/n)
+    parameters=parameters[:, 0]
+    return (np.where(fitted, -parameters[:, 1], np.nan), np.where(fitted, -parameters[:, 2], np.nan),
+            np.where(fitted, 10**breaks, np.nan), np.where(fitted, rms, np.nan))
+
+
+def fit_spectra(spectra,break_grid=BREAK_GRID,refine=True,n_jobs=1):
+    '''
+    Fit the power law and the double power law to the fluence spectra of all the events and event types.
+
+    Parameters:
+    -----------
+    spectra : dict
+        the parsed fluence spectra (see fluence_spectrum.build_fluence_spectra)
+    break_grid : numpy array of float, default to BREAK_GRID
+        the breaks (MeV) of the double power law tried
+    refine : boolean, default to True
+        If True, refine the break between the neighbouring breaks of the grid
+    n_jobs : int, default to 1
+        the number of processes refining the breaks (1 to refine in this process)
+
+    Returns:
+    --------
+    fits : dict
+        'event_types' : the event types of the spectra
+        column : numpy array (n_event_types x n_rows) for each column of SPECTRAL_FIT_COLUMNS
+    '''
+    shape=(len(spectra['event_types']), spectra['n_rows'])
+    spectrum,x,y,n_spectra=_fit_points(spectra)
+    gamma,_,power_law_rms,n_points=fit_power_law(spectrum, x, y, n_spectra)
+    gamma_low,gamma_high,break_energy,double_power_law_rms=fit_double_power_law(spectrum, x, y, n_spectra, break_grid=break_grid, refine=refine, n_jobs=n_jobs)
+    results={SPECTRAL_INDEX: gamma, POWER_LAW_RMS: power_law_rms,
+             SPECTRAL_INDEX_LOW: gamma_low, SPECTRAL_INDEX_HIGH: gamma_high, SPECTRAL_BREAK: break_energy,
+             DOUBLE_POWER_LAW_RMS: double_power_law_rms, SPECTRAL_FIT_POINTS: n_points}
+    fits={'event_types': list(spectra['event_types'])}
+    for column in SPECTRAL_FIT_COLUMNS:
+        fits[column]=results[column].reshape(shape)
+    return fits
+
+
+def add_spectral_fit_columns(df,fits):
+    '''
+    Add the results of the spectral fits to df, in columns event_type + column
+    after the column event_type + 'Fluence Spectrum Energy Bin Centers (MeV)' of each event type.
+    df is modified in place and returned.
+    '''
+    for k, event_type in enumerate(fits['event_types']):
+        position=df.columns.get_loc(event_type + ENERGY_BIN_CENTERS)
+        for column in SPECTRAL_FIT_COLUMNS:
+            position+=1
+            if event_type + column in df.columns:
+                df[event_type + column]=fits[column][k]
+            else:
+                df.insert(position, event_type + column, fits[column][k])
+    forget_fingerprint(df) #the selections cached for df are no longer valid
+    return df
+
+
+def save_spectral_fits(fits,file_name,fingerprint=None,break_grid=BREAK_GRID,refine=True):
+    '''
+    Save the spectral fits in a .npz file, with the fingerprint of the dataframe and the parameters of the fits.
+    '''
+    arrays={column: fits[column] for column in SPECTRAL_FIT_COLUMNS}
+    np.savez(file_name, event_types=np.array(fits['event_types']), fingerprint=np.asarray('' if fingerprint is None else fingerprint),
+             break_grid=np.asarray(break_grid, dtype=float), refine=np.asarray(refine), **arrays)
+
+
+def load_spectral_fits(file_name):
+    '''
+    Load the spectral fits saved by save_spectral_fits.
+    Returns the fits, the fingerprint of the dataframe and the parameters (break_grid, refine).
+    '''
+    with np.load(file_name) as data:
+        fits={'event_types': data['event_types'].tolist()}
+        for column in SPECTRAL_FIT_COLUMNS:
+            fits[column]=data[column]
+        return fits, str(data['fingerprint']), data['break_grid'], bool(data['refine'])
+
+
+def load_generate_spectral_fits(df,spectra,force=False,file_name=SPECTRAL_FITS_PATH,break_grid=BREAK_GRID,refine=True,n_jobs=1):
+    '''
+    This function either loads the spectral fits from their file, or computes them with fit_spectra and saves them.
+    The fits are computed again if the dataframe (its fingerprint) or the parameters changed.
+    '''
+    fingerprint=dataframe_fingerprint(df)
+
+    if not force and os.path.exists(file_name):
+        fits,cached_fingerprint,cached_grid,cached_refine=load_spectral_fits(file_name)
+        if cached_fingerprint==fingerprint and cached_refine==refine and np.array_equal(cached_grid, np.asarray(break_grid, dtype=float)):
+            return fits
+
+    fits=fit_spectra(spectra, break_grid=break_grid, refine=refine, n_jobs=n_jobs)
+    save_spectral_fits(fits, file_name, fingerprint=fingerprint, break_grid=break_grid, refine=refine)
+    return fits
+
+
+def test_fit_spectra(n_rows=50,seed=0):
+    '''
+    Fit synthetic spectra of known power laws and double power laws (without noise), and check that their parameters are recovered,
+    that the power laws match np.polyfit, that the refinement in a pool of processes gives the same breaks,
+    and that the spectra with too few points are not fitted.
+    '''
+    import tempfile
+    import pandas as pd
+
+    rng=np.random.default_rng(seed)
+    energy=np.geomspace(1, 700, 14)
+    gamma=rng.uniform(1, 4, n_rows)
+    gamma_low,gamma_high=rng.uniform(0.5, 2, n_rows),rng.uniform(2.5, 5, n_rows)
+    break_energy=10**rng.uniform(np.log10(5), np.log10(150), n_rows)
+    amplitude=10**rng.uniform(5, 9, n_rows)
+    log_ratio=np.log10(energy[None, :]/break_energy[:, None])
+    power_law=amplitude[:, None]*energy[None, :]**-gamma[:, None]
+    double_power_law=amplitude[:, None]*10**(-gamma_low[:, None]*np.minimum(log_ratio, 0)-gamma_high[:, None]*np.maximum(log_ratio, 0))
+
+    #the last row of each event type has a single point, and the first row of the power laws has a negative fluence
+    lengths=np.full(n_rows, len(energy))
+    lengths[-1]=1
+    fluence=[power_law, double_power_law]
+    fluence[0][0, 3]=-1.0
+    offsets=np.stack([np.concatenate([[0], np.cumsum(lengths)]), np.cumsum(lengths)[-1] + np.concatenate([[0], np.cumsum(lengths)])])
+    spectra={'event_types': ['power law', 'double power law'], 'n_rows': n_rows, 'offsets': offsets,
+             'energy_center': np.concatenate([energy[:length] for _ in range(2) for length in lengths]),
+             'fluence': np.concatenate([fluence[k][row, :lengths[row]] for k in range(2) for row in range(n_rows)])}
+
+    fits=fit_spectra(spectra)
+    fitted=slice(1, n_rows-1)
+    assert np.allclose(fits[SPECTRAL_INDEX][0, fitted], gamma[fitted])
+    assert np.all(fits[POWER_LAW_RMS][0, fitted]<1e-9)
+    assert fits[SPECTRAL_FIT_POINTS][0, 0]==len(energy)-1
+    x=np.log10(np.delete(energy, 3))
+    y=np.log10(np.delete(power_law[0], 3))
+    assert np.isclose(fits[SPECTRAL_INDEX][0, 0], -np.polyfit(x, y, 1)[0])
+    assert np.isnan(fits[SPECTRAL_INDEX][:, -1]).all() and np.isnan(fits[SPECTRAL_BREAK][:, -1]).all()
+
+    assert np.allclose(fits[SPECTRAL_INDEX_LOW][1, :-1], gamma_low[:-1], atol=1e-3)
+    assert np.allclose(fits[SPECTRAL_INDEX_HIGH][1, :-1], gamma_high[:-1], atol=1e-3)
+    assert np.allclose(fits[SPECTRAL_BREAK][1, :-1], break_energy[:-1], rtol=1e-3)
+    assert np.all(fits[DOUBLE_POWER_LAW_RMS][1, :-1]<1e-3)
+    #the double power law is at least as good as the power law
+    assert np.all(fits[DOUBLE_POWER_LAW_RMS][:, :-1]<=fits[POWER_LAW_RMS][:, :-1]+1e-9)
+
+    parallel=fit_spectra(spectra, n_jobs=2)
+    for column in SPECTRAL_FIT_COLUMNS:
+        assert np.array_equal(parallel[column], fits[column], equal_nan=True), column
+
+    #the fits are saved with the fingerprint of the dataframe and computed again when it changes
+    df=pd.DataFrame({'Fluence Spectrum': np.arange(n_rows)})
+    with tempfile.TemporaryDirectory() as directory:
+        file_name=os.path.join(directory, 'fits.npz')
+        load_generate_spectral_fits(df, spectra, file_name=file_name, refine=False)
+        saved=os.stat(file_name).st_mtime_ns
+        load_generate_spectral_fits(df, spectra, file_name=file_name, refine=False)
+        assert os.stat(file_name).st_mtime_ns==saved
+        df.iloc[0, 0]=-1
+        load_generate_spectral_fits(df, spectra, file_name=file_name, refine=False)
+        assert os.stat(file_name).st_mtime_ns!=saved
+    print("All tests passed!")
+
+
+if __name__ == '__main__':
+    from constants import TC_10
+    from work import load_generate_dataset, load_generate_fluence_spectra
+
+    #Batch fits of the fluence spectra (power law and double power law), added as columns
+    df=load_generate_dataset()
+    spectral_fits=load_generate_spectral_fits(df, load_generate_fluence_spectra(df))
+    add_spectral_fit_columns(df, spectral_fits)
+    print(df[[TC_10 + SPECTRAL_INDEX, TC_10 + SPECTRAL_INDEX_LOW, TC_10 + SPECTRAL_INDEX_HIGH, TC_10 + SPECTRAL_BREAK]].dropna())
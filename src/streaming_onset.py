@@ -0,0 +1,402 @@
+#!/usr/bin/env python3
+'''
+This code detect the SEP events in flux time series as a stream: the samples are consumed one at a time
+(or by chunks read from a file or from the memmapped flux store), in O(1) time and memory per sample,
+for all the event types (thresholds of constants.FLUX_THRESHOLDS) at once, so decades of data can be scanned
+without loading whole series, and the SEP start times of the catalog can be derived again or checked.
+
+The thresholds of the same energy channel (eg TC_10 and AB_10) are all updated by a sample of this channel.
+For each threshold, the detector emits events (dicts):
+    - 'start' : the first sample of the first persistence consecutive samples >= the threshold (the SEP start)
+    - 'max' : each new maximum of the flux since the start (max so far)
+    - 'onset_peak' : the first maximum so far that is not exceeded during the next onset_window samples (see flux_audit.py)
+    - 'end' : the last sample >= the threshold, once persistence consecutive samples are below it
+The AB thresholds are on the flux above the background: the background is the exponential moving average
+of the flux outside of the events (and its standard deviation), the threshold is background + max(threshold, n_sigma*sigma).
+'''
+
+import math
+
+import numpy as np
+import pandas as pd
+
+from constants import TC_10, AB_10, EVENT_TYPES, ENERGY_CHANNELS, FLUX_THRESHOLDS, ABOVE_BACKGROUND, TIME_SEP
+
+from flux_audit import ONSET_WINDOW
+from flux_store import to_seconds
+
+#Number of consecutive samples above (below) the threshold starting (ending) an event (15 minutes at the 5 minutes cadence of GOES)
+PERSISTENCE=3
+
+#Time constant of the moving average of the background (seconds), number of samples before the background is used
+BACKGROUND_TIME_CONSTANT=24*3600
+BACKGROUND_WARMUP=12
+
+#Number of standard deviations of the background above it for the AB thresholds
+BACKGROUND_SIGMA=3.0
+
+#Number of samples of the chunks read from a file or from the flux store
+STREAM_CHUNK_SIZE=100000
+
+
+class ThresholdTracker:
+    '''
+    State of the detection of the events of one threshold (see the module docstring), updated by each sample in O(1).
+    '''
+    __slots__=('event_type', 'threshold', 'above_background', 'persistence', 'onset_window', 'n_sigma', 'time_constant',
+               'run_start', 'run_flux', 'run_length', 'in_event', 'below_count', 'last_above', 'last_above_flux',
+               'max_time', 'max_flux', 'candidate_time', 'candidate_flux', 'candidate_age', 'onset_done',
+               'background', 'background_variance', 'background_samples', 'last_time')
+
+    def __init__(self,event_type,threshold,above_background=False,persistence=PERSISTENCE,onset_window=ONSET_WINDOW,
+                 n_sigma=BACKGROUND_SIGMA,time_constant=BACKGROUND_TIME_CONSTANT):
+        self.event_type=event_type
+        self.threshold=threshold
+        self.above_background=above_background
+        self.persistence=persistence
+        self.onset_window=onset_window
+        self.n_sigma=n_sigma
+        self.time_constant=time_constant
+        self.background=None
+        self.background_variance=0.0
+        self.background_samples=0
+        self.last_time=None
+        self._reset()
+
+    def _reset(self):
+        self.run_start=None
+        self.run_flux=None
+        self.run_length=0
+        self.in_event=False
+        self.below_count=0
+        self.last_above=None
+        self.last_above_flux=None
+        self.max_time=None
+        self.max_flux=-math.inf
+        self.candidate_time=None
+        self.candidate_flux=None
+        self.candidate_age=0
+        self.onset_done=False
+
+    def level(self):
+        '''
+        Return the current threshold on the flux (inf for an AB threshold while the background is not known).
+        '''
+        if not self.above_background:
+            return self.threshold
+        if self.background_samples<BACKGROUND_WARMUP:
+            return math.inf
+        return self.background + max(self.threshold, self.n_sigma*math.sqrt(self.background_variance))
+
+    def _emit(self,events,kind,time,flux):
+        events.append({'event_type': self.event_type, 'kind': kind, 'time': time, 'flux': flux})
+
+    def _update_peaks(self,events,time,flux):
+        #new maximum so far, and the candidate onset peak
+        if flux>self.max_flux:
+            self.max_flux,self.max_time=flux,time
+            if self.in_event:
+                self._emit(events, 'max', time, flux)
+            if not self.onset_done:
+                self.candidate_time,self.candidate_flux,self.candidate_age=time,flux,0
+        elif not self.onset_done:
+            self.candidate_age+=1
+            if self.candidate_age>=self.onset_window:
+                self.onset_done=True
+                if self.in_event:
+                    self._emit(events, 'onset_peak', self.candidate_time, self.candidate_flux)
+
+    def _update_background(self,time,flux):
+        if self.background is None:
+            self.background=flux
+        else:
+            weight=1.0-math.exp(-max(time-self.last_time, 0)/self.time_constant)
+            deviation=flux-self.background
+            self.background+=weight*deviation
+            self.background_variance=(1.0-weight)*(self.background_variance + weight*deviation*deviation)
+        self.background_samples+=1
+
+    def update(self,time,flux,events):
+        '''
+        Update the state with a sample (time in seconds, flux in pfu), and append the events emitted to events.
+        The samples with an unknown flux are ignored.
+        '''
+        if flux!=flux: #NaN
+            return
+        above=flux>=self.level()
+
+        if self.in_event:
+            self._update_peaks(events, time, flux)
+            if above:
+                self.below_count=0
+                self.last_above,self.last_above_flux=time,flux
+            else:
+                self.below_count+=1
+                if self.below_count>=self.persistence:
+                    self._end(events)
+        elif above:
+            if self.run_length==0:
+                self.run_start,self.run_flux=time,flux
+            self.run_length+=1
+            self._update_peaks(events, time, flux)
+            self.last_above,self.last_above_flux=time,flux
+            if self.run_length>=self.persistence:
+                #the event is confirmed: its start, the max so far and the onset peak if it is already known
+                self.in_event=True
+                self._emit(events, 'start', self.run_start, self.run_flux)
+                self._emit(events, 'max', self.max_time, self.max_flux)
+                if self.onset_done:
+                    self._emit(events, 'onset_peak', self.candidate_time, self.candidate_flux)
+        else:
+            if self.run_length>0:
+                self._reset()
+            if self.above_background:
+                self._update_background(time, flux)
+        self.last_time=time
+
+    def _end(self,events):
+        if not self.onset_done:
+            self._emit(events, 'onset_peak', self.candidate_time, self.candidate_flux)
+        self._emit(events, 'end', self.last_above, self.last_above_flux)
+        self._reset()
+
+    def flush(self,events):
+        '''
+        End the event in progress at the end of the stream (if any).
+        '''
+        if self.in_event:
+            self._end(events)
+        else:
+            self._reset()
+
+
+class OnsetDetector:
+    '''
+    Streaming detection of the SEP events of several thresholds at once (see the module docstring).
+
+    Parameters:
+    -----------
+    event_types : list of string, default to EVENT_TYPES
+        the event types whose thresholds are detected (constants.FLUX_THRESHOLDS, on the channels constants.ENERGY_CHANNELS)
+    persistence, onset_window, n_sigma, time_constant :
+        see PERSISTENCE, ONSET_WINDOW, BACKGROUND_SIGMA, BACKGROUND_TIME_CONSTANT
+    '''
+    def __init__(self,event_types=EVENT_TYPES,persistence=PERSISTENCE,onset_window=ONSET_WINDOW,n_sigma=BACKGROUND_SIGMA,
+                 time_constant=BACKGROUND_TIME_CONSTANT):
+        self.trackers={}
+        for event_type in event_types:
+            tracker=ThresholdTracker(event_type, FLUX_THRESHOLDS[event_type], above_background=event_type in ABOVE_BACKGROUND,
+                                     persistence=persistence, onset_window=onset_window, n_sigma=n_sigma, time_constant=time_constant)
+            self.trackers.setdefault(ENERGY_CHANNELS[event_type], []).append(tracker)
+
+    def channels(self):
+        '''
+        Return the energy channels (MeV) of the thresholds.
+        '''
+        return list(self.trackers)
+
+    def update(self,channel,time,flux):
+        '''
+        Update the thresholds of an energy channel (MeV) with a sample (time in seconds, flux in pfu).
+        Returns the list of the events emitted.
+        '''
+        events=[]
+        for tracker in self.trackers.get(channel, []):
+            tracker.update(time, flux, events)
+        return events
+
+    def update_chunk(self,channel,times,fluxes):
+        '''
+        Update the thresholds of an energy channel with a chunk of samples (arrays of times in seconds and fluxes in pfu).
+        Returns the list of the events emitted, in the order of the samples for each threshold.
+        '''
+        events=[]
+        times,fluxes=np.asarray(times).tolist(),np.asarray(fluxes, dtype=float).tolist()
+        for tracker in self.trackers.get(channel, []):
+            update=tracker.update
+            for time, flux in zip(times, fluxes):
+                update(time, flux, events)
+        return events
+
+    def run(self,channel,chunks,flush=True):
+        '''
+        Update the thresholds of an energy channel with all the chunks (times, fluxes) of a stream
+        (eg read_flux_chunks or store_chunks), and end the events in progress at the end if flush is True.
+        Returns the list of the events emitted.
+        '''
+        events=[]
+        for times, fluxes in chunks:
+            events+=self.update_chunk(channel, times, fluxes)
+        if flush:
+            events+=self.flush(channel)
+        return events
+
+    def flush(self,channel=None):
+        '''
+        End the events in progress of an energy channel (all the channels if None), returns the list of the events emitted.
+        '''
+        events=[]
+        for energy, trackers in self.trackers.items():
+            if channel is None or energy==channel:
+                for tracker in trackers:
+                    tracker.flush(events)
+        return events
+
+
+def read_flux_chunks(file_name,chunk_size=STREAM_CHUNK_SIZE):
+    '''
+    Read a flux time series file by chunks, without loading it whole.
+    Yields the times (seconds) and the fluxes (pfu) of each chunk, the samples without a valid time are dropped.
+    '''
+    for chunk in pd.read_csv(file_name, sep=r'\s+', names=["Time", "Flux"], chunksize=chunk_size):
+        times,known=to_seconds(chunk["Time"])
+        yield times[known], pd.to_numeric(chunk["Flux"], errors='coerce').to_numpy(dtype=float)[known]
+
+
+def store_chunks(store,segment,chunk_size=STREAM_CHUNK_SIZE):
+    '''
+    Yield the times (seconds) and the fluxes (pfu) of a segment of the flux store by chunks
+    (slices of the memmapped arrays, only the chunk is read from the disk).
+    '''
+    start,end=store['offsets'][segment],store['offsets'][segment+1]
+    for first in range(start, end, chunk_size):
+        last=min(first+chunk_size, end)
+        yield np.asarray(store['time'][first:last]), np.asarray(store['flux'][first:last])
+
+
+def events_to_dataframe(events):
+    '''
+    Convert the events emitted by a detector to a DataFrame, with the times as datetimes.
+    '''
+    events=pd.DataFrame(events, columns=['event_type', 'kind', 'time', 'flux'])
+    events['time']=pd.to_datetime(events['time'], unit='s')
+    return events
+
+
+def check_catalog_starts(df,store,event_type,**parameters):
+    '''
+    Detect the events of a threshold in the flux time series of the store, and compare their start
+    with the SEP start time of the catalog.
+
+    Parameters:
+    -----------
+    df : panda DataFrame
+        the dataframe containing all event information (the one the store was built from)
+    store : dict
+        the flux store of df (see flux_store.load_generate_flux_store)
+    event_type : string
+        the event type (eg TC_10)
+    parameters :
+        the parameters of the detector (see OnsetDetector)
+
+    Returns:
+    --------
+    starts : pandas DataFrame
+        one row per event of the catalog with a flux time series: 'event' (index in df), 'SEP Start Time' (catalog),
+        'SEP Start Time detected' (the detected start closest to the catalog start, or the first one if the catalog has none),
+        'difference (minutes)'
+    '''
+    k=list(store['event_types']).index(event_type)
+    series=np.flatnonzero((store['series_event_type']==k) & (store['series_segment']>=0))
+    catalog,known=to_seconds(df[event_type + TIME_SEP].iloc[store['series_position'][series]])
+    channel=ENERGY_CHANNELS[event_type]
+
+    detected=np.full(len(series), np.nan)
+    for n, segment in enumerate(store['series_segment'][series]):
+        detector=OnsetDetector(event_types=[event_type], **parameters)
+        starts=np.array([event['time'] for event in detector.run(channel, store_chunks(store, segment)) if event['kind']=='start'])
+        if len(starts)>0:
+            detected[n]=starts[np.argmin(np.abs(starts-catalog[n]))] if known[n] else starts[0]
+
+    result=pd.DataFrame({'event': df.index[store['series_position'][series]],
+                         TIME_SEP: pd.to_datetime(np.where(known, catalog, 0), unit='s').where(known),
+                         TIME_SEP + ' detected': pd.to_datetime(np.nan_to_num(detected), unit='s').where(~np.isnan(detected))})
+    result['difference (minutes)']=(result[TIME_SEP + ' detected']-result[TIME_SEP]).dt.total_seconds()/60.0
+    return result
+
+
+def test_onset_detector(cadence=300):
+    '''
+    Detect the events of a synthetic >10 MeV series with a known start, onset peak, max and end, for the TC and AB thresholds:
+    a background of 1 pfu, a spike shorter than the persistence, an enhancement to 5 pfu (below the TC threshold), a ramp to an onset peak of 100 pfu, a plateau at 80 pfu,
+    a second rise to a max of 200 pfu and a decay. Check the onset peak emitted at the confirmation of the start
+    (persistence longer than the onset window), the warm-up of the background, and the chunked streams.
+    '''
+    import os
+    import tempfile
+
+    background=1.0 + 0.01*(-1)**np.arange(288) #1 day
+    spike=[50.0, 50.0] + [1.0]*10 + [5.0]*6 + [1.0]*10
+    ramp=np.linspace(20, 100, 9)
+    plateau=np.full(20, 80.0)
+    rise=np.linspace(100, 200, 5)[1:]
+    decay=200*0.8**np.arange(1, 30)
+    flux=np.concatenate([background, spike, ramp, plateau, rise, decay, np.ones(50)])
+    times=1_500_000_000 + cadence*np.arange(len(flux))
+
+    start=len(background) + len(spike)
+    onset_peak=start + len(ramp)-1
+    max_flux=onset_peak + len(plateau) + len(rise)
+    end=max_flux + np.flatnonzero(decay>=FLUX_THRESHOLDS[TC_10])[-1] + 1
+
+    def events_of(detector,event_type):
+        events=[]
+        for time, value in zip(times, flux):
+            events+=detector.update(ENERGY_CHANNELS[event_type], int(time), float(value))
+        events+=detector.flush()
+        return [(event['kind'], event['time']) for event in events if event['event_type']==event_type]
+
+    #the TC threshold: a single event, the spike being shorter than the persistence
+    expected=[('start', times[start]), ('max', times[start+PERSISTENCE-1])]
+    expected+=[('max', times[k]) for k in range(start+PERSISTENCE, onset_peak+1)]
+    expected+=[('onset_peak', times[onset_peak])]
+    expected+=[('max', times[k]) for k in range(onset_peak+len(plateau)+1, max_flux+1)]
+    expected+=[('end', times[end])]
+    detector=OnsetDetector(event_types=[TC_10, AB_10])
+    events=events_of(detector, TC_10)
+    assert events==expected, events
+
+    #the AB threshold: above the background of the first day, the enhancement to 5 pfu is an event too
+    detector=OnsetDetector(event_types=[TC_10, AB_10])
+    starts=[time for kind, time in events_of(detector, AB_10) if kind=='start']
+    assert starts==[times[len(background)+12], times[start]], starts
+
+    #onset peak known before the start is confirmed: emitted right after the start and the max so far
+    detector=OnsetDetector(event_types=[TC_10], persistence=len(ramp)+ONSET_WINDOW+1)
+    events=events_of(detector, TC_10)
+    assert events[:3]==[('start', times[start]), ('max', times[onset_peak]), ('onset_peak', times[onset_peak])], events[:3]
+
+    #no AB event during the warm-up of the background
+    detector=OnsetDetector(event_types=[AB_10])
+    events=detector.run(ENERGY_CHANNELS[AB_10], [(times[start:], flux[start:])])
+    assert all(event['time']>=times[start + BACKGROUND_WARMUP] for event in events)
+
+    #the same events sample by sample, by chunks and from a file read by chunks
+    detector=OnsetDetector()
+    by_sample=[]
+    for time, value in zip(times, flux):
+        by_sample+=detector.update(10.0, int(time), float(value))
+    by_sample+=detector.flush()
+    by_sample=sorted(by_sample, key=lambda event: (event['event_type'], event['time'], event['kind']))
+    chunks=[(times[first:first+37], flux[first:first+37]) for first in range(0, len(flux), 37)]
+    by_chunk=sorted(OnsetDetector().run(10.0, chunks), key=lambda event: (event['event_type'], event['time'], event['kind']))
+    assert by_chunk==by_sample
+    with tempfile.TemporaryDirectory() as directory:
+        file_name=os.path.join(directory, 'flux.txt')
+        with open(file_name, 'w') as file:
+            for time, value in zip(pd.to_datetime(times, unit='s'), flux):
+                file.write(time.strftime('%Y-%m-%dT%H:%M:%S') + ' ' + repr(float(value)) + '\n')
+        from_file=OnsetDetector().run(10.0, read_flux_chunks(file_name, chunk_size=50))
+    assert sorted(from_file, key=lambda event: (event['event_type'], event['time'], event['kind']))==by_sample
+    print("All tests passed!")
+
+
+if __name__ == '__main__':
+    from flux_store import load_generate_flux_store
+    from work import load_generate_dataset
+
+    #The SEP start times of the catalog detected again in the flux store, the starts more than 5 minutes away are printed
+    df=load_generate_dataset()
+    flux_store=load_generate_flux_store(df, '../output/opsep/GOES-08_integral_enhance_idsep/')
+    starts=check_catalog_starts(df, flux_store, TC_10)
+    print(starts[starts['difference (minutes)'].abs()>5])
@@ -0,0 +1,369 @@
+#!/usr/bin/env python3
+'''
+This code keep the statistics of the delays up to date while the catalog grows, without reading the whole dataframe again.
+
+For every delay and event type, an accumulator is updated in O(1) for each new event:
+    - the number of delays, their mean and variance (Welford's algorithm)
+    - a histogram with the fixed bins of DELAY_BIN_EDGES (hours)
+    - estimates of quantiles (P-square algorithm, 5 markers per quantile, no storage of the delays)
+The accumulators can be saved in a json file next to the cached dataset, and updated with the events appended since.
+The fingerprint of the delays of the events already taken into account and the bin edges are saved with them,
+so they are computed again from scratch if these events were edited, or if DELAY_BIN_EDGES changed.
+Updating the statistics is O(1) per appended event, but checking the fingerprint hashes the delays of all the events
+already taken into account: each load is O(n) (vectorized, about 0.5 s per million events).
+'''
+
+import json
+import os
+
+import numpy as np
+
+from constants import EVENT_TYPES, DELAY_BIN_EDGES
+
+from catalog_fingerprint import dataframe_fingerprint
+from delay_sweep import DELAYS
+
+#Quantiles estimated for every delay
+STREAMING_QUANTILES=(0.1, 0.25, 0.5, 0.75, 0.9)
+
+STREAMING_STATISTICS_PATH="Datasets/my_dataset_streaming_statistics.json"
+
+
+class WelfordAccumulator:
+    '''
+    Number, mean and variance of a stream of values (Welford's algorithm).
+    '''
+    def __init__(self):
+        self.n=0
+        self.mean=0.0
+        self.m2=0.0
+
+    def update(self,value):
+        self.n+=1
+        delta=value-self.mean
+        self.mean+=delta/self.n
+        self.m2+=delta*(value-self.mean)
+
+    @property
+    def variance(self):
+        '''
+        Variance of the values (same as np.var, ddof=0)
+        '''
+        return self.m2/self.n if self.n>0 else np.nan
+
+    @property
+    def std(self):
+        return np.sqrt(self.variance)
+
+    def to_dict(self):
+        return {'n': self.n, 'mean': self.mean, 'm2': self.m2}
+
+    @classmethod
+    def from_dict(cls,state):
+        accumulator=cls()
+        accumulator.n,accumulator.mean,accumulator.m2=state['n'],state['mean'],state['m2']
+        return accumulator
+
+
+class FixedBinHistogram:
+    '''
+    Histogram of a stream of values with fixed bins (same convention as np.histogram, the last bin includes its right edge).
+    The values out of the edges are counted in underflow / overflow.
+    '''
+    def __init__(self,bin_edges):
+        self.bin_edges=np.asarray(bin_edges, dtype=float)
+        self.counts=np.zeros(len(self.bin_edges)-1, dtype=np.int64)
+        self.underflow=0
+        self.overflow=0
+
+    def update(self,value):
+        if value<self.bin_edges[0]:
+            self.underflow+=1
+        elif value>self.bin_edges[-1]:
+            self.overflow+=1
+        else:
+            #binary search in the edges, O(log(number of bins)) which doesn't depend on the number of events
+            self.counts[min(np.searchsorted(self.bin_edges, value, side='right')-1, len(self.counts)-1)]+=1
+
+    def to_dict(self):
+        return {'bin_edges': self.bin_edges.tolist(), 'counts': self.counts.tolist(),
+                'underflow': self.underflow, 'overflow': self.overflow}
+
+    @classmethod
+    def from_dict(cls,state):
+        histogram=cls(state['bin_edges'])
+        histogram.counts=np.asarray(state['counts'], dtype=np.int64)
+        histogram.underflow,histogram.overflow=state['underflow'],state['overflow']
+        return histogram
+
+
+class P2Quantile:
+    '''
+    Estimate of a quantile of a stream of values with the P-square algorithm (Jain & Chlamtac, 1985):
+    5 markers are kept and adjusted for each new value, the values themselves are not stored.
+    '''
+    def __init__(self,quantile):
+        self.quantile=quantile
+        self.heights=[]                         #heights of the 5 markers (the first 5 values until they are known)
+        self.positions=[1, 2, 3, 4, 5]          #actual positions of the markers
+        self.desired=[1, 1+2*quantile, 1+4*quantile, 3+2*quantile, 5]
+        self.increments=[0, quantile/2, quantile, (1+quantile)/2, 1]
+
+    def update(self,value):
+        heights=self.heights
+        if len(heights)<5:
+            heights.append(value)
+            heights.sort()
+            return
+
+        #Cell of the new value, and update of the extreme markers
+        if value<heights[0]:
+            heights[0]=value
+            cell=0
+        elif value>=heights[4]:
+            heights[4]=value
+            cell=3
+        else:
+            cell=next(k for k in range(4) if heights[k]<=value<heights[k+1])
+
+        for k in range(cell+1, 5):
+            self.positions[k]+=1
+        for k in range(5):
+            self.desired[k]+=self.increments[k]
+
+        #Adjustment of the 3 middle markers
+        for k in range(1, 4):
+            offset=self.desired[k]-self.positions[k]
+            if (offset>=1 and self.positions[k+1]-self.positions[k]>1) or (offset<=-1 and self.positions[k-1]-self.positions[k]<-1):
+                step=1 if offset>0 else -1
+                height=self._parabolic(k, step)
+                if not heights[k-1]<height<heights[k+1]:
+                    height=self._linear(k, step)
+                heights[k]=height
+                self.positions[k]+=step
+
+    def _parabolic(self,k,step):
+        h,n=self.heights,self.positions
+        return h[k] + step/(n[k+1]-n[k-1]) * ((n[k]-n[k-1]+step)*(h[k+1]-h[k])/(n[k+1]-n[k])
+                                             + (n[k+1]-n[k]-step)*(h[k]-h[k-1])/(n[k]-n[k-1]))
+
+    def _linear(self,k,step):
+        h,n=self.heights,self.positions
+        return h[k] + step*(h[k+step]-h[k])/(n[k+step]-n[k])
+
+    @property
+    def value(self):
+        '''
+        Current estimate of the quantile (exact while there are less than 5 values)
+        '''
+        if not self.heights:
+            return np.nan
+        if len(self.heights)<5:
+            return float(np.quantile(self.heights, self.quantile))
+        return self.heights[2]
+
+    def to_dict(self):
+        return {'quantile': self.quantile, 'heights': list(self.heights), 'positions': list(self.positions),
+                'desired': list(self.desired)}
+
+    @classmethod
+    def from_dict(cls,state):
+        estimator=cls(state['quantile'])
+        estimator.heights,estimator.positions,estimator.desired=list(state['heights']),list(state['positions']),list(state['desired'])
+        return estimator
+
+
+class DelayAccumulator:
+    '''
+    All the streaming statistics of one delay of one event type: Welford mean/variance, histogram and quantiles.
+    '''
+    def __init__(self,bin_edges,quantiles=STREAMING_QUANTILES):
+        self.moments=WelfordAccumulator()
+        self.histogram=FixedBinHistogram(bin_edges)
+        self.quantiles=[P2Quantile(quantile) for quantile in quantiles]
+
+    def update(self,value):
+        self.moments.update(value)
+        self.histogram.update(value)
+        for estimator in self.quantiles:
+            estimator.update(value)
+
+    def summary(self):
+        '''
+        Return the current statistics as a dictionary
+        '''
+        summary={'n': self.moments.n, 'mean': self.moments.mean if self.moments.n>0 else np.nan, 'std': self.moments.std}
+        for estimator in self.quantiles:
+            summary[f'q{estimator.quantile:g}']=estimator.value
+        return summary
+
+    def to_dict(self):
+        return {'moments': self.moments.to_dict(), 'histogram': self.histogram.to_dict(),
+                'quantiles': [estimator.to_dict() for estimator in self.quantiles]}
+
+    @classmethod
+    def from_dict(cls,state):
+        accumulator=cls(state['histogram']['bin_edges'])
+        accumulator.moments=WelfordAccumulator.from_dict(state['moments'])
+        accumulator.histogram=FixedBinHistogram.from_dict(state['histogram'])
+        accumulator.quantiles=[P2Quantile.from_dict(estimator) for estimator in state['quantiles']]
+        return accumulator
+
+
+def new_streaming_statistics(event_types=EVENT_TYPES,delays=DELAYS,bin_edges=DELAY_BIN_EDGES,quantiles=STREAMING_QUANTILES):
+    '''
+    Create empty streaming statistics for every delay x event type,
+    with the bin edges of each delay (hours) given by bin_edges.
+
+    Returns:
+    --------
+    streaming_statistics : dict
+        'n_events' : the number of events already taken into account
+        'fingerprint' : the fingerprint of the delays of these events (see events_fingerprint)
+        'bin_edges' : {delay: bin edges (hours)}
+        'accumulators' : {(event_type, delay): DelayAccumulator}
+    '''
+    return {'n_events': 0,
+            'fingerprint': None,
+            'bin_edges': {delay: [float(edge) for edge in bin_edges[delay]] for delay in delays},
+            'accumulators': {(event_type, delay): DelayAccumulator(bin_edges[delay], quantiles)
+                             for event_type in event_types for delay in delays}}
+
+
+def events_fingerprint(streaming_statistics,df):
+    '''
+    Return the fingerprint of the delays of the first streaming_statistics['n_events'] events of df,
+    the events taken into account by the streaming statistics.
+    All these events are hashed again, so it is O(n_events) (unlike the update, which only reads the appended events).
+    '''
+    columns=[event_type + delay for event_type, delay in streaming_statistics['accumulators']]
+    return dataframe_fingerprint(df[columns].iloc[:streaming_statistics['n_events']])
+
+
+def update_with_event(streaming_statistics,event):
+    '''
+    Update the streaming statistics with one new event (a row of the dataframe), in O(1).
+    The delays are converted to hours.
+    '''
+    for (event_type, delay), accumulator in streaming_statistics['accumulators'].items():
+        value=event[event_type + delay]
+        if value==value: #not NaN
+            accumulator.update(value/60.0)
+    streaming_statistics['n_events']+=1
+
+
+def update_streaming_statistics(streaming_statistics,df):
+    '''
+    Update the streaming statistics with the events of df that were not taken into account yet,
+    ie the events appended to the catalog since the last update (the first events of df are assumed unchanged).
+    '''
+    columns=[event_type + delay for event_type, delay in streaming_statistics['accumulators']]
+    new_events=df[columns].iloc[streaming_statistics['n_events']:]
+    for _, event in new_events.iterrows():
+        update_with_event(streaming_statistics, event)
+    streaming_statistics['fingerprint']=events_fingerprint(streaming_statistics, df)
+    return streaming_statistics
+
+
+def save_streaming_statistics(streaming_statistics,file_name):
+    '''
+    Save the streaming statistics in a json file.
+    '''
+    state={'n_events': streaming_statistics['n_events'],
+           'fingerprint': streaming_statistics['fingerprint'],
+           'bin_edges': streaming_statistics['bin_edges'],
+           'accumulators': [{'event_type': event_type, 'delay': delay, 'state': accumulator.to_dict()}
+                            for (event_type, delay), accumulator in streaming_statistics['accumulators'].items()]}
+    with open(file_name, 'w', encoding='utf-8') as file:
+        json.dump(state, file)
+
+
+def load_streaming_statistics(file_name):
+    '''
+    Load the streaming statistics from a json file.
+    '''
+    with open(file_name, 'r', encoding='utf-8') as file:
+        state=json.load(file)
+    return {'n_events': state['n_events'],
+            'fingerprint': state.get('fingerprint'),
+            'bin_edges': state.get('bin_edges'),
+            'accumulators': {(accumulator['event_type'], accumulator['delay']): DelayAccumulator.from_dict(accumulator['state'])
+                             for accumulator in state['accumulators']}}
+
+
+def load_generate_streaming_statistics(df,force=False,file_name=STREAMING_STATISTICS_PATH):
+    '''
+    This function either loads the streaming statistics saved next to the cached dataset
+    and updates them with the events appended to the catalog since they were saved,
+    or computes them from all the events of df (if they don't exist or force=True).
+    They are computed from all the events too if the events taken into account in the saved statistics are not
+    the first events of df anymore (different or edited catalog), or if the bin edges changed.
+    The updated statistics are saved.
+    Checking the saved statistics hashes the delays of the events already taken into account (see events_fingerprint),
+    so a load is O(n) even when no event was appended.
+    '''
+    streaming_statistics=new_streaming_statistics()
+    if not force and os.path.exists(file_name):
+        saved=load_streaming_statistics(file_name)
+        if saved['n_events']<=len(df) and saved['bin_edges']==streaming_statistics['bin_edges'] \
+                and saved['accumulators'].keys()==streaming_statistics['accumulators'].keys() \
+                and saved['fingerprint']==events_fingerprint(saved, df):
+            streaming_statistics=saved
+
+    if streaming_statistics['n_events']<len(df):
+        update_streaming_statistics(streaming_statistics, df)
+        save_streaming_statistics(streaming_statistics, file_name)
+    return streaming_statistics
+
+
+def test_load_generate_streaming_statistics(df):
+    '''
+    Test that the statistics updated with the appended events are the ones computed from all the events,
+    and that the saved statistics are computed again when the events already taken into account were edited
+    or when the bin edges changed.
+    '''
+    import tempfile
+    from constants import AB_10, CME_TO_MAX
+
+    def n_delays(streaming_statistics):
+        return streaming_statistics['accumulators'][(AB_10, CME_TO_MAX)].moments.n
+
+    column=AB_10 + CME_TO_MAX
+    with tempfile.TemporaryDirectory() as directory:
+        file_name=os.path.join(directory, 'streaming_statistics.json')
+        load_generate_streaming_statistics(df.iloc[:len(df)//2], file_name=file_name)
+        streaming_statistics=load_generate_streaming_statistics(df, file_name=file_name)
+        delays=df[column].dropna().to_numpy(dtype=float)/60.0
+        summary=streaming_statistics['accumulators'][(AB_10, CME_TO_MAX)].summary()
+        assert summary['n']==len(delays) and np.isclose(summary['mean'], delays.mean()) and np.isclose(summary['std'], delays.std())
+        assert np.array_equal(streaming_statistics['accumulators'][(AB_10, CME_TO_MAX)].histogram.counts,
+                              np.histogram(delays, bins=DELAY_BIN_EDGES[CME_TO_MAX])[0])
+
+        #an edited event already taken into account: the statistics are computed again
+        edited=df.copy()
+        position=np.flatnonzero(edited[column].notna().to_numpy())[0]
+        edited.iloc[position, edited.columns.get_loc(column)]=np.nan
+        assert n_delays(load_generate_streaming_statistics(edited, file_name=file_name))==len(delays)-1
+
+        #the saved statistics are reused (marked with a wrong count), except with other bin edges
+        load_generate_streaming_statistics(df, file_name=file_name)
+        with open(file_name, 'r', encoding='utf-8') as file:
+            state=json.load(file)
+        for accumulator in state['accumulators']:
+            accumulator['state']['moments']['n']+=1000
+        for bin_edges, expected in [(state['bin_edges'][CME_TO_MAX], len(delays)+1000), ([0.0, 1.0], len(delays))]:
+            state['bin_edges'][CME_TO_MAX]=bin_edges
+            with open(file_name, 'w', encoding='utf-8') as file:
+                json.dump(state, file)
+            assert n_delays(load_generate_streaming_statistics(df, file_name=file_name))==expected
+    print("All tests passed!")
+
+
+if __name__ == '__main__':
+    from constants import AB_10, CME_TO_MAX
+    from work import load_generate_dataset
+
+    #Running statistics of the delays, only the events appended to the catalog since the last run are read
+    df=load_generate_dataset()
+    streaming_statistics=load_generate_streaming_statistics(df)
+    print(streaming_statistics['accumulators'][(AB_10, CME_TO_MAX)].summary())
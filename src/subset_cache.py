@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+'''
+This code memoize the selections of subset_selection.
+
+The row positions of each selection are kept in a bounded LRU cache (least recently used selections are dropped first),
+keyed on the normalized selection criteria and on the fingerprint of the dataframe,
+so a repeated selection returns its positions immediately instead of filtering and copying the dataframe again.
+The number of hits and misses of the cache is counted, see subset_cache_info().
+
+The fingerprint of a dataframe is computed once per dataframe object.
+If a dataframe is modified in place after a selection, call forget_fingerprint(df) (or give the new fingerprint).
+'''
+
+import weakref
+from collections import OrderedDict
+
+import numpy as np
+
+from catalog_fingerprint import dataframe_fingerprint
+from mask_index import selection_mask
+from selection_expression import expression_mask, normalize_expression
+
+#Maximum number of selections kept in the cache
+SUBSET_CACHE_SIZE=256
+
+_SUBSET_CACHE=OrderedDict()
+_SUBSET_CACHE_STATISTICS={'hits': 0, 'misses': 0, 'maxsize': SUBSET_CACHE_SIZE}
+
+#Fingerprint of each dataframe object: id(df) -> (weak reference to df, fingerprint)
+_FINGERPRINTS={}
+
+
+def frame_fingerprint(df):
+    '''
+    Return the fingerprint of a dataframe (see catalog_fingerprint.dataframe_fingerprint),
+    computed only the first time it is asked for this dataframe object.
+    '''
+    key=id(df)
+    if key in _FINGERPRINTS:
+        reference,fingerprint=_FINGERPRINTS[key]
+        if reference() is df:
+            return fingerprint
+
+    fingerprint=dataframe_fingerprint(df)
+    _FINGERPRINTS[key]=(weakref.ref(df, lambda _: _FINGERPRINTS.pop(key, None)), fingerprint)
+    return fingerprint
+
+
+def forget_fingerprint(df):
+    '''
+    Forget the fingerprint of a dataframe, to be called after modifying the dataframe in place.
+    '''
+    _FINGERPRINTS.pop(id(df), None)
+
+
+def normalize_criteria(event_type=None,Event_longitude=None,Flare_magnitude=None,CDAW_speed=None,DONKI_speed=None,expression=None):
+    '''
+    Return the selection criteria as a hashable tuple, the same for equivalent criteria
+    (eg a longitude given as a list or a tuple, a speed given as an int or a float).
+    '''
+    def number(value):
+        return None if value is None else float(value)
+
+    return (
+        event_type,
+        None if Event_longitude is None else (float(Event_longitude[0]), float(Event_longitude[1])),
+        number(Flare_magnitude),
+        number(CDAW_speed),
+        number(DONKI_speed),
+        None if expression is None else normalize_expression(expression),
+    )
+
+
+def cached_subset_positions(df,event_type=None,Event_longitude=None,Flare_magnitude=None,CDAW_speed=None,DONKI_speed=None,
+                            expression=None,mask_index=None,fingerprint=None):
+    '''
+    Return the row positions (as used by df.iloc) of the events selected by the criteria (see subset_selection),
+    from the cache if the same selection was already done on the same dataframe.
+
+    Parameters:
+    -----------
+    df : panda DataFrame
+        the dataframe containing all event information
+    event_type, Event_longitude, Flare_magnitude, CDAW_speed, DONKI_speed, expression :
+        the selection criteria, same as subset_selection
+    mask_index : dict, default to None
+        the mask index of df (see mask_index.build_mask_index), used when the selection is not in the cache
+    fingerprint : string, default to None
+        the fingerprint of df, computed with frame_fingerprint(df) if None
+
+    Returns:
+    --------
+    positions : numpy array of int (read-only)
+        the row positions of the selected events
+    '''
+    if fingerprint is None:
+        fingerprint=frame_fingerprint(df)
+    key=(fingerprint, normalize_criteria(event_type, Event_longitude, Flare_magnitude, CDAW_speed, DONKI_speed, expression))
+
+    if key in _SUBSET_CACHE:
+        _SUBSET_CACHE_STATISTICS['hits']+=1
+        _SUBSET_CACHE.move_to_end(key)
+        return _SUBSET_CACHE[key]
+
+    _SUBSET_CACHE_STATISTICS['misses']+=1
+    mask=selection_mask(df, event_type=event_type, Event_longitude=Event_longitude, Flare_magnitude=Flare_magnitude,
+                        CDAW_speed=CDAW_speed, DONKI_speed=DONKI_speed, mask_index=mask_index)
+    if expression is not None:
+        mask=mask & expression_mask(df, expression, mask_index=mask_index)
+
+    positions=np.flatnonzero(mask)
+    positions.flags.writeable=False #The positions are shared by all the users of the cache
+    _SUBSET_CACHE[key]=positions
+    while len(_SUBSET_CACHE)>_SUBSET_CACHE_STATISTICS['maxsize']:
+        _SUBSET_CACHE.popitem(last=False)
+    return positions
+
+
+def cached_subset_index(df,**criteria):
+    '''
+    Return the row labels (df.index) of the events selected by the criteria, see cached_subset_positions.
+    '''
+    return df.index[cached_subset_positions(df, **criteria)]
+
+
+def subset_cache_info():
+    '''
+    Return the statistics of the cache: number of hits, misses, current size and maximum size.
+    '''
+    return {'hits': _SUBSET_CACHE_STATISTICS['hits'], 'misses': _SUBSET_CACHE_STATISTICS['misses'],
+            'size': len(_SUBSET_CACHE), 'maxsize': _SUBSET_CACHE_STATISTICS['maxsize']}
+
+
+def set_subset_cache_size(maxsize):
+    '''
+    Change the maximum number of selections kept in the cache.
+    '''
+    _SUBSET_CACHE_STATISTICS['maxsize']=maxsize
+    while len(_SUBSET_CACHE)>maxsize:
+        _SUBSET_CACHE.popitem(last=False)
+
+
+def clear_subset_cache():
+    '''
+    Empty the cache and reset its statistics.
+    '''
+    _SUBSET_CACHE.clear()
+    _SUBSET_CACHE_STATISTICS['hits']=0
+    _SUBSET_CACHE_STATISTICS['misses']=0
+
+
+def test_cached_subset_positions(df):
+    '''
+    Test that the cached selections are the ones of subset_selection without cache, that a repeated (or equivalent)
+    selection is a hit, and that the least recently used selections are dropped when the cache is full.
+    '''
+    from constants import EVENT_TYPES, EASTERN
+
+    clear_subset_cache()
+    selections=[{'event_type': event_type} for event_type in EVENT_TYPES] + \
+               [{'event_type': EVENT_TYPES[0], 'Event_longitude': EASTERN, 'CDAW_speed': 1000, 'expression': 'not gle'}]
+    for criteria in selections:
+        mask=selection_mask(df, **{key: value for key, value in criteria.items() if key!='expression'})
+        if 'expression' in criteria:
+            mask=mask & expression_mask(df, criteria['expression'])
+        assert np.array_equal(cached_subset_positions(df, **criteria), np.flatnonzero(mask)), criteria
+    assert subset_cache_info()['misses']==len(selections) and subset_cache_info()['hits']==0
+
+    cached_subset_positions(df, event_type=EVENT_TYPES[0], Event_longitude=list(EASTERN), CDAW_speed=1000.0, expression='not  gle')
+    assert subset_cache_info()['hits']==1, "An equivalent selection should be a hit"
+
+    set_subset_cache_size(2)
+    assert subset_cache_info()['size']==2
+    cached_subset_positions(df, event_type=EVENT_TYPES[0])
+    assert subset_cache_info()['misses']==len(selections)+1, "The least recently used selections should be dropped"
+    set_subset_cache_size(SUBSET_CACHE_SIZE)
+    clear_subset_cache()
+    print("All tests passed!")
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+'''
+This code compute the superposed epoch analysis of the flux profiles of the events:
+the flux time series of the selected events are aligned on a time of the event (the flare peak, the CME first look
+or the SEP start), resampled on a common grid of times relative to it, and summarized by their median and percentiles
+at each time of the grid, for each event type.
+
+The series are read from the flux store (see flux_store.py) and resampled all at once
+(linear interpolation between the 2 samples around each time of the grid, see flux_store.interpolate_flux).
+The events are selected with the same criteria as subset_selection, through the cache of the selections (see subset_cache.py).
+'''
+
+import warnings
+
+import numpy as np
+
+from constants import EVENT_TYPES, TIME_FLARE
+
+from flux_store import interpolate_flux, series_times
+from subset_cache import cached_subset_positions
+
+#Relative times of the grid (hours after the alignment time), every 15 minutes from 1 day before to 4 days after
+EPOCH_GRID=np.arange(-24, 96.25, 0.25)
+
+#Percentiles of the envelopes of the profiles
+EPOCH_PERCENTILES=(10, 25, 50, 75, 90)
+
+
+def superposed_epoch(df,store,alignment=TIME_FLARE,grid=EPOCH_GRID,event_types=None,
+                     Event_longitude=None,Flare_magnitude=None,CDAW_speed=None,DONKI_speed=None,expression=None,mask_index=None,
+                     percentiles=EPOCH_PERCENTILES,max_gap=1.0):
+    '''
+    Align the flux profiles of the selected events on a time of the event, and compute their percentiles for each event type.
+
+    Parameters:
+    -----------
+    df : panda DataFrame
+        the dataframe containing all event information (the one the store was built from)
+    store : dict
+        the flux store of df (see flux_store.load_generate_flux_store)
+    alignment : string, default to TIME_FLARE
+        the column of the alignment time, preceded by the event type if such a column exists (eg TIME_SEP),
+        otherwise a time of the event (eg TIME_FLARE, TIME_CME)
+    grid : numpy array of float, default to EPOCH_GRID
+        the times of the common grid, in hours relative to the alignment time
+    event_types : list of string, default to None
+        the event types to analyse, all the event types of the store if None
+    Event_longitude, Flare_magnitude, CDAW_speed, DONKI_speed, expression, mask_index :
+        the selection criteria of the events, same as subset_selection
+    percentiles : tuple of float, default to EPOCH_PERCENTILES
+        the percentiles computed at each time of the grid
+    max_gap : float, default to 1
+        the largest interval (hours) between 2 samples that is interpolated, the flux is unknown in larger data gaps
+
+    Returns:
+    --------
+    epochs : dict
+        {event_type: {'grid': relative times (hours),
+                      'events': index of the events in df (the events without flux file or alignment time are left out),
+                      'profiles': numpy array (n_events x n_times) of the resampled fluxes, NaN where unknown,
+                      'n_profiles': number of known fluxes at each time of the grid,
+                      'percentiles': {percentile: numpy array (n_times)}, NaN where no flux is known,
+                      'median': numpy array (n_times)}}
+    '''
+    if event_types is None:
+        event_types=list(store['event_types'])
+    grid=np.asarray(grid, dtype=float)
+    offsets=np.round(grid*3600).astype(np.int64)
+    times,known=series_times(df, store, alignment)
+
+    epochs={}
+    for event_type in event_types:
+        k=list(store['event_types']).index(event_type)
+        positions=cached_subset_positions(df, event_type=event_type, Event_longitude=Event_longitude, Flare_magnitude=Flare_magnitude,
+                                          CDAW_speed=CDAW_speed, DONKI_speed=DONKI_speed, expression=expression, mask_index=mask_index)
+        series=np.flatnonzero((store['series_event_type']==k) & np.isin(store['series_position'], positions)
+                              & (store['series_segment']>=0) & known)
+
+        profiles=interpolate_flux(store, store['series_segment'][series], times[series, None] + offsets, max_gap=max_gap*3600)
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', category=RuntimeWarning) #All-NaN slices
+            values=np.nanpercentile(profiles, percentiles, axis=0) if len(series)>0 else np.full((len(percentiles), len(grid)), np.nan)
+
+        epochs[event_type]={
+            'grid': grid,
+            'events': df.index[store['series_position'][series]],
+            'profiles': profiles,
+            'n_profiles': np.sum(~np.isnan(profiles), axis=0),
+            'percentiles': dict(zip(percentiles, values)),
+            'median': np.nanmedian(profiles, axis=0) if len(series)>0 else np.full(len(grid), np.nan),
+        }
+    return epochs
+
+
+def test_superposed_epoch(df,store,file_path,alignment=TIME_FLARE,event_type=EVENT_TYPES[0],n_events=20):
+    '''
+    Compare the profiles of the superposed epoch analysis with the interpolation of each flux time series with np.interp.
+    '''
+    from flux_reader import flux_file_name, load_flux_time_series
+
+    epoch=superposed_epoch(df, store, alignment=alignment, event_types=[event_type], max_gap=np.inf)[event_type]
+    grid=epoch['grid']
+    for event, profile in list(zip(epoch['events'], epoch['profiles']))[:n_events]:
+        row=df.loc[event]
+        column=event_type + alignment if event_type + alignment in df.columns else alignment
+        df_flux=load_flux_time_series(flux_file_name(file_path, row, event_type)).dropna(subset=["Time"])
+        time=(df_flux["Time"]-row[column]).dt.total_seconds().to_numpy()/3600
+        expected=np.interp(grid, time, df_flux["Flux"].to_numpy(dtype=float), left=np.nan, right=np.nan)
+        assert np.allclose(profile, expected, equal_nan=True), event
+    print("superposed epoch profiles ok ("+str(len(epoch['events']))+" events)")
+
+
+if __name__ == '__main__':
+    from constants import TC_10, TC_100, WESTERN
+    from flux_store import load_generate_flux_store
+    from plots import plot_superposed_epoch
+    from work import load_generate_dataset
+
+    #Superposed epoch analysis of the flux profiles of the western events, aligned on the flare peak
+    df=load_generate_dataset()
+    flux_store=load_generate_flux_store(df, '../output/opsep/GOES-08_integral_enhance_idsep/')
+    epochs=superposed_epoch(df, flux_store, alignment=TIME_FLARE, event_types=[TC_10, TC_100], Event_longitude=WESTERN)
+    plot_superposed_epoch(epochs, alignment=TIME_FLARE)
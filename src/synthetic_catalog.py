@@ -0,0 +1,793 @@
+#!/usr/bin/env python3
+'''
+This code generate synthetic SEP event catalogs with the column layout of the GOES integral PRIMARY catalog
+(GOES_integral_PRIMARY.1986-02-03.2025-09-10_sep_events.csv, 173 columns), and their flux time series files,
+to test and benchmark the analysis on catalogs of any size (see benchmark.py).
+
+Each event is sampled from a simple physical model, all the events at once (vectorized with numpy, from a seed):
+    the flux of each energy channel (>10, >30, >50 and >100 MeV) follows a power law in energy, with a log-normal >10 MeV max flux,
+    the protons are released at the flare peak, the higher energies arrive first (velocity dispersion over 1.2 AU),
+    the flux rises exponentially from the background to the max flux, then decays exponentially back to the background,
+    the AB (Above Background) events start and end when the flux is above the background of the channel,
+    the TC (Threshold Crossing) events when the flux is above the threshold (10 pfu at >10 MeV, 1 pfu at the other energies),
+    the flare, radio bursts and CME times are around the release time, the CME speed grows with the max flux.
+So the times of an event are ordered as in the real catalog (the flare before the SEP start, the SEP start of the TC event
+after the one of the AB event, the max flux time before the SEP end time...) and the delays are consistent with the times.
+The event times are on the 5 minutes grid of GOES.
+The proportions of known values (eg the flare and CME of an event) are close to the ones of the real catalog.
+
+Two kinds of errors can be added:
+    malformed values (eg a flare magnitude '3.23-6' or a longitude 'FS'), a fraction malformed_rate of the known values
+    of the columns converted by work.prepare_dataframe and of the columns where the real catalog has malformed values,
+    anomalies, a fraction anomaly_rate of the events: an onset peak before the SEP start time (negative rise time to onset),
+    a flare after the SEP start time (negative delays), or an event longitude out of [-180, 180].
+
+The time periods of the events are consecutive over [start, end], with the length of the real periods (a few days).
+If there are too many events to fit (eg millions), the periods are shortened to fit, but not the events,
+so the events then overlap the next periods.
+'''
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from constants import TC_10, TC_30, TC_50, TC_100, AB_10, AB_30, AB_50, AB_100, EVENT_TYPES, ENERGY_CHANNELS, FLUX_THRESHOLDS
+from constants import TIME_FLARE, TIME_CME, TIME_PEAK, TIME_MAX, TIME_SEP, SEP_TO_PEAK, SEP_TO_MAX
+from fluence import ISOTROPIC_SOLID_ANGLE
+from fluence_spectrum import FLUENCE_SPECTRUM, ENERGY_BINS, ENERGY_BIN_CENTERS
+
+CATALOG_FILE='GOES_integral_PRIMARY.1986-02-03.2025-09-10_sep_events.csv'
+
+#Columns of the catalog: the time period, a block of columns per event type (the event types in the order of the file),
+#then the other parameters of the event
+PERIOD_COLUMNS=['Experiment', 'Flux Type', 'Options', 'Background Subtraction', 'Time Period Start', 'Time Period End', 'All Fluxes Time Series']
+EVENT_TYPE_COLUMNS=['Flux Time Series', TIME_SEP, 'SEP End Time', 'SEP Duration (hours)', 'Onset Peak (pfu)', TIME_PEAK, SEP_TO_PEAK,
+                    'Max Flux (pfu)', TIME_MAX, SEP_TO_MAX, 'Fluence (cm^-2)', FLUENCE_SPECTRUM, ENERGY_BINS, ENERGY_BIN_CENTERS]
+OTHER_COLUMNS=['Cycle', 'EventType', 'Case', 'Flare Xray Start Time', TIME_FLARE, 'Flare X-ray End Time', 'Flare Class', 'Flare Opt',
+               'Flare Magnitude', 'Flare Integrated Flux', 'Flare Duration', 'Flare Xray Time To Peak', 'Active Region', 'AR Area',
+               'AR Spot Class', 'AR Mag Class', 'AR Carrington', 'Event Location From Center', 'Event Latitude', 'Event Longitude',
+               'Event Location Source', 'Event Location from Center 2', 'Event Latitude 2', 'Event Longitude 2', 'Event Location Source 2',
+               'Radio Rbr245Max', 'Radio Rbr2695Max', 'Radio Rbr8800', 'Radio TyIII_Imp', 'Radio m_TyII Start Time', 'Radio m_TyII End Time',
+               'Radio TyII Imp', 'Radio TyII Speed', 'Radio m_TyII Start Frequency', 'Radio m_TyII End Frequency', 'Radio Station',
+               'Radio DH Start Time', 'Radio DH End Time', 'Radio DH Start Frequency', 'Radio DH End Frequency', 'Radio DH Note',
+               'Radio TyIV Start Time', 'Radio TyIV End Time', 'Radio TyIV Imp', 'Radio TyIV Duration', TIME_CME, 'CDAW CME Speed',
+               'DONKI CME Speed', 'CME Width', 'CME Mean Position Angle', 'ESP_CME', 'GLE Event Number', 'PRF', 'Comments']
+CATALOG_COLUMNS=PERIOD_COLUMNS + [event_type + column for event_type in sorted(EVENT_TYPES) for column in EVENT_TYPE_COLUMNS] + OTHER_COLUMNS
+
+#Experiments: name, prefix of the flux time series files, start of the experiment, energy bins of the fluence spectra (MeV, as in the catalog)
+_BINS_700=['5.0', '10.0', '30.0', '50.0', '60.0', '100.0', '700.0']
+EXPERIMENTS=[('GOES-06', 'GOES-06_integral_enhance_idsep', '1986-01-01', _BINS_700[:-1] + ['700']),
+             ('GOES-07', 'GOES-07_integral_enhance_idsep', '1988-03-01', _BINS_700[:-1]),
+             ('GOES-08', 'GOES-08_integral_enhance_idsep', '1995-03-01', _BINS_700),
+             ('GOES-11', 'GOES-11_integral_enhance_idsep', '2003-06-01', _BINS_700),
+             ('GOES-13', 'GOES-13_integral_enhance_idsep', '2010-05-01', _BINS_700),
+             ('GOES_RT', 'GOES_RT_integral_primary_enhance_idsep', '2020-11-01', ['1', '5', '10', '30', '50', '60', '100', '500'])]
+
+#Energy channels (MeV): background flux (pfu), median rise time from the SEP start to the max flux (hours),
+#median e-folding time of the decay (hours)
+CHANNELS=[10.0, 30.0, 50.0, 100.0]
+BACKGROUND_FLUX={10.0: 0.25, 30.0: 0.3, 50.0: 0.2, 100.0: 0.1}
+RISE_TIME={10.0: 8.8, 30.0: 5.4, 50.0: 5.0, 100.0: 3.4}
+DECAY_TIME={10.0: 12.0, 30.0: 14.0, 50.0: 13.0, 100.0: 10.0}
+
+#Distance travelled by the protons from the Sun to the Earth (light seconds, 1.2 AU along the Parker spiral)
+PATH_LENGTH=1.2*499.0
+PROTON_MASS=938.272 #MeV
+
+#Cadence of GOES (seconds), the SEP times are on this grid
+CADENCE=300
+
+#Time periods: median length (days), the dates of the catalog
+PERIOD_LENGTH=4.25
+SYNTHETIC_START='1986-02-03'
+SYNTHETIC_END='2025-09-10'
+
+#Starts of the solar cycles 22 to 25
+CYCLE_STARTS={22: '1986-09-01', 23: '1996-08-01', 24: '2008-12-01', 25: '2019-12-01'}
+
+#Number of events generated at once (the larger catalogs are generated by chunks)
+CATALOG_CHUNK=100000
+
+MALFORMED_RATE=0.003
+ANOMALY_RATE=0.01
+ANOMALIES=['negative_rise_time', 'flare_after_sep_start', 'longitude_out_of_range']
+
+
+def _choice(rng,values,probabilities,size):
+    '''
+    Sample values with the probabilities (normalized), as an object array.
+    '''
+    probabilities=np.asarray(probabilities, dtype=float)
+    return np.asarray(values, dtype=object)[rng.choice(len(values), size=size, p=probabilities/probabilities.sum())]
+
+
+def _lognormal(rng,median,sigma,size):
+    return median*np.exp(sigma*rng.standard_normal(size))
+
+
+def _to_seconds(date):
+    return int(pd.Timestamp(date).value//10**9)
+
+
+def format_times(seconds,known=None):
+    '''
+    Format times (seconds since 1970) as the catalog: 'YYYY-MM-DD HH:MM:SS', NaN where they are not known.
+    '''
+    seconds=np.asarray(seconds)
+    if known is None:
+        known=np.isfinite(seconds)
+    text=np.full(len(seconds), np.nan, dtype=object)
+    if known.any():
+        strings=np.datetime_as_string(seconds[known].astype(np.int64).astype('datetime64[s]'), unit='s')
+        strings.view('U1').reshape(len(strings), -1)[:, 10]=' '
+        text[known]=strings.astype(object)
+    return text
+
+
+def _masked(values,known):
+    '''
+    Return the values as floats, NaN where they are not known.
+    '''
+    return np.where(known, values, np.nan)
+
+
+def format_floats(values,decimals=6):
+    '''
+    Format finite floats as strings with at most a number of decimals (without the trailing zeros, eg '24.583333' or '505.0'),
+    the very large and very small floats as numpy does (eg '1e-05').
+    It is vectorized with integers (a few times faster than the conversion of the floats to strings by numpy or pandas).
+    '''
+    values=np.asarray(values, dtype=float)
+    scale=10**decimals
+    large=(np.abs(values)>=2**62/scale) | ((values!=0) & (np.abs(values)<10.0**(3-decimals)))
+    scaled=np.round(np.abs(np.where(large, 0.0, values))*scale).astype(np.int64)
+    integers=(scaled//scale).astype(str)
+    fractions=(scaled%scale + scale).astype(f'U{decimals+1}')
+    fractions=np.ascontiguousarray(fractions.view('U1').reshape(len(values), -1)[:, 1:]).view(f'U{decimals}').ravel()
+    fractions=np.char.rstrip(fractions, '0')
+    fractions=np.where(fractions=='', '0', fractions)
+    text=np.char.add(np.char.add(np.where((values<0) & (scaled>0), '-', ''), integers), np.char.add('.', fractions))
+    if large.any():
+        text=text.astype(object)
+        text[large]=values[large].astype(str)
+    return text
+
+
+def _format_spectra(values,known):
+    '''
+    Format the fluence spectra (n_rows x n_bins) as the catalog: '[f1; f2; ...]', NaN where they are not known.
+    '''
+    text=np.full(len(values), np.nan, dtype=object)
+    if known.any():
+        columns=[format_floats(values[known, k]) for k in range(values.shape[1])]
+        joined=columns[0]
+        for column in columns[1:]:
+            joined=np.char.add(np.char.add(joined, '; '), column)
+        text[known]=np.char.add(np.char.add('[', joined), ']').astype(object)
+    return text
+
+
+def _csv_column(values):
+    '''
+    Format the values of a column of a catalog for a CSV file: the strings as they are, the floats with format_floats,
+    empty for the unknown values (quoted if they contain a comma or a quote).
+    '''
+    if values.dtype==object:
+        text=np.where(pd.notna(values), values, '')
+        joined='\0'.join(text)
+        if ',' in joined or '"' in joined:
+            text=np.array(['"' + value.replace('"', '""') + '"' if ',' in value or '"' in value else value for value in text], dtype=object)
+        return text
+    text=np.full(len(values), '', dtype=object)
+    known=np.isfinite(values)
+    if known.any():
+        text[known]=format_floats(values[known])
+    return text
+
+
+def write_catalog_csv(df,file_name,header=True,mode='w'):
+    '''
+    Write a catalog (eg generated by generate_catalog) in a CSV file, as df.to_csv(file_name, index=False) but faster
+    (the floats are written with at most 6 decimals, see format_floats).
+    '''
+    columns=[_csv_column(df[column].to_numpy()) for column in df.columns]
+    with open(file_name, mode) as file:
+        if header:
+            file.write(','.join(_csv_column(np.array(df.columns, dtype=object))) + '\n')
+        if len(df)>0:
+            file.write('\n'.join(map(','.join, zip(*columns))) + '\n')
+
+
+def _sample_periods(rng,n_events,start,end):
+    '''
+    Sample the consecutive time periods of the events (seconds, on the GOES grid), and their experiment.
+    '''
+    lengths=_lognormal(rng, PERIOD_LENGTH*86400, 0.6, n_events)
+    #half of the periods follow the previous one, the others after a gap
+    gaps=np.where(rng.random(n_events)<0.5, 0.0, rng.exponential(1.0, n_events))
+    span=_to_seconds(end)-_to_seconds(start)
+    free=span-lengths.sum()
+    if free>0:
+        gaps*=free/max(gaps.sum(), 1.0)
+    else:
+        lengths*=span/lengths.sum()
+        gaps[:]=0.0
+    lengths=np.maximum(np.round(lengths/CADENCE), 1)*CADENCE
+    gaps=np.round(gaps/CADENCE)*CADENCE
+    period_start=_to_seconds(start) + np.concatenate([[0], np.cumsum(lengths+gaps)[:-1]]).astype(np.int64)
+    period_end=period_start + lengths.astype(np.int64)
+
+    starts=np.array([_to_seconds(experiment[2]) for experiment in EXPERIMENTS])
+    experiment=np.maximum(np.searchsorted(starts, period_start, side='right')-1, 0)
+    return period_start, period_end, experiment
+
+
+def _sep_events(rng,release,period_start,period_end):
+    '''
+    Sample the flux profiles of the energy channels (see the module docstring).
+
+    Returns:
+    --------
+    channels : dict
+        {energy: dict of numpy arrays} 'max_flux', 'start' (AB event start, when the flux leaves the background),
+        'max_time', 'rise', 'decay' (e-folding time of the decay, seconds),
+        'quiet_flux', 'quiet_time' the max flux of the period and its time if the flux stays at the background
+    gamma : numpy array of float
+        the spectral index of each event
+    '''
+    n_events=len(release)
+    log_flux_10=0.97 + 1.0*rng.standard_normal(n_events)
+    gamma=np.clip(rng.normal(2.2, 0.4, n_events), 0.5, None)
+    injection=rng.exponential(1800.0, n_events)
+
+    channels={}
+    for energy in CHANNELS:
+        lorentz=1 + energy/PROTON_MASS
+        speed=np.sqrt(1 - 1/lorentz**2)
+        max_flux=10**(log_flux_10 - gamma*np.log10(energy/10.0))
+        start=release + injection + PATH_LENGTH/speed + rng.exponential(1200.0, n_events)
+        rise=_lognormal(rng, RISE_TIME[energy]*3600, 0.8, n_events)
+        channels[energy]={'max_flux': max_flux, 'start': start, 'max_time': start+rise, 'rise': rise,
+                          'decay': _lognormal(rng, DECAY_TIME[energy]*3600, 0.5, n_events),
+                          'quiet_flux': np.round(BACKGROUND_FLUX[energy]*rng.uniform(0.6, 1.0, n_events), 3),
+                          'quiet_time': _grid(period_start + rng.random(n_events)*(period_end-period_start))}
+    return channels, gamma
+
+
+def _grid(seconds):
+    return np.round(seconds/CADENCE)*CADENCE
+
+
+def _event_type_columns(rng,event_type,channel,gamma,experiment,file_names,onset_shift):
+    '''
+    Return the columns of the block of an event type, as a dict {column: values} (without the event type prefix),
+    and the times of the event (seconds) as a dict. The onset peak is moved onset_shift seconds before the SEP start time
+    where onset_shift > 0 (anomaly).
+    '''
+    n_events=len(file_names)
+    energy=ENERGY_CHANNELS[event_type]
+    background=BACKGROUND_FLUX[energy]
+    threshold=background if FLUX_THRESHOLDS[event_type]<background else FLUX_THRESHOLDS[event_type]
+    max_flux,rise,decay=channel['max_flux'],channel['rise'],channel['decay']
+
+    #the flux rises as background*exp(slope*t) from the AB start to the max, and decays as max_flux*exp(-t/decay)
+    has_event=max_flux>threshold
+    ratio=np.log(np.maximum(max_flux, threshold)/background)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        slope=ratio/rise
+        crossing=np.where(has_event, np.log(threshold/background)/slope, 0.0)
+    start=_grid(channel['start'] + crossing)
+    max_time=_grid(channel['max_time'])
+    end=_grid(channel['max_time'] + decay*np.log(np.maximum(max_flux, threshold)/threshold))
+    end=np.maximum(end, max_time+CADENCE)
+
+    #without event, the max flux of the period is a fluctuation of the background
+    max_flux_column=np.where(max_flux>background, np.round(max_flux, 3), channel['quiet_flux'])
+    max_time_column=np.where(max_flux>background, max_time, channel['quiet_time'])
+
+    has_onset=has_event & (rng.random(n_events)<0.8)
+    onset_time=_grid(start + rng.uniform(0.2, 1.0, n_events)*(max_time-start))
+    onset_time=np.minimum(np.maximum(onset_time, start), max_time)
+    onset_time=np.where(onset_shift>0, start-onset_shift, onset_time)
+    onset_flux=np.round(background*np.exp(np.minimum(slope*(onset_time - _grid(channel['start'])), ratio)), 3)
+
+    #fluence: integral of the flux above the threshold over the event, over 4 pi sr
+    with np.errstate(invalid='ignore', divide='ignore'):
+        fluence=ISOTROPIC_SOLID_ANGLE*(max_flux-threshold)*(1/slope + decay)
+
+    spectrum=np.full(n_events, np.nan, dtype=object)
+    bins_text=np.empty(n_events, dtype=object)
+    centers_text=np.empty(n_events, dtype=object)
+    noise=np.exp(0.05*rng.standard_normal((n_events, max(len(experiment[3]) for experiment in EXPERIMENTS))))
+    for k, (_, _, _, energies) in enumerate(EXPERIMENTS):
+        rows=experiment==k
+        if not rows.any():
+            continue
+        values=fluence[rows, None]*(np.array(energies, dtype=float)/energy)**(-gamma[rows, None])*noise[rows, :len(energies)]
+        spectrum[rows]=_format_spectra(values, has_event[rows])
+        bins_text[rows]='[' + '; '.join(f'[{value}; -1]' for value in energies) + ']'
+        centers_text[rows]='[' + '; '.join(energies) + ']'
+
+    return {'Flux Time Series': file_names,
+            TIME_SEP: format_times(start, has_event),
+            'SEP End Time': format_times(end, has_event),
+            'SEP Duration (hours)': _masked((end-start)/3600, has_event),
+            'Onset Peak (pfu)': _masked(onset_flux, has_onset),
+            TIME_PEAK: format_times(onset_time, has_onset),
+            SEP_TO_PEAK: _masked((onset_time-start)/60, has_onset),
+            'Max Flux (pfu)': max_flux_column,
+            TIME_MAX: format_times(max_time_column),
+            SEP_TO_MAX: _masked((max_time-start)/60, has_event),
+            'Fluence (cm^-2)': _masked(fluence, has_event),
+            FLUENCE_SPECTRUM: spectrum,
+            ENERGY_BINS: bins_text,
+            ENERGY_BIN_CENTERS: centers_text,
+            }, {'start': start, 'onset_time': onset_time, 'has_event': has_event, 'has_onset': has_onset}
+
+
+def _other_columns(rng,period_start,release,channels,associated,flare_shift,counters):
+    '''
+    Return the other parameters of the events (flare, active region, location, radio bursts, CME), as a dict {column: values}.
+    The flare times are moved by flare_shift seconds (anomaly). counters are the last GLE and PRF numbers
+    of the previous events, they are updated.
+    '''
+    n_events=len(release)
+    log_flux_10=np.log10(channels[10.0]['max_flux'])
+    minute=60.0
+    columns={}
+
+    cycles=np.array([_to_seconds(date) for date in CYCLE_STARTS.values()])
+    cycle=21 + np.searchsorted(cycles, period_start, side='right')
+    columns['Cycle']=_masked(cycle, associated & (cycle>=22))
+    columns['EventType']=np.where(associated, np.where(channels[10.0]['max_flux']>10, 'SPE',
+                                                       _choice(rng, ['ESPE', 'SubEvent', 'SE'], [87, 54, 1], n_events)), np.nan)
+
+    #flare, its peak is the release time of the protons
+    has_flare=associated & (rng.random(n_events)<0.86)
+    flare_peak=np.round((release + flare_shift)/minute)*minute
+    flare_start=flare_peak - np.round(_lognormal(rng, 23*minute, 0.6, n_events)/minute)*minute
+    flare_end=flare_peak + np.round(_lognormal(rng, 40*minute, 0.7, n_events)/minute)*minute
+    magnitude=10**np.clip(-4.3 + 0.3*(log_flux_10-1) + 0.55*rng.standard_normal(n_events), -7.5, -2.5)
+    magnitude=_significant(magnitude, 3)
+    classes=np.array(['A', 'B', 'C', 'M', 'X'])
+    order=np.clip(np.floor(np.log10(magnitude)).astype(int)+8, 0, 4)
+    columns['Flare Xray Start Time']=format_times(flare_start, has_flare)
+    columns[TIME_FLARE]=format_times(flare_peak, has_flare)
+    columns['Flare X-ray End Time']=format_times(flare_end, has_flare)
+    class_text=np.char.add(classes[order], np.char.mod('%.1f', magnitude/10.0**(order-8)))
+    columns['Flare Class']=np.where(has_flare, class_text.astype(object), np.nan)
+    columns['Flare Opt']=np.where(has_flare & (rng.random(n_events)<0.74),
+                                  _choice(rng, ['2B', '3B', '2N', 'SF', '1N', '1F', '1B', '4B', '2F', '3N'], [42, 39, 26, 20, 18, 17, 10, 5, 4, 1], n_events), np.nan)
+    has_magnitude=has_flare | (associated & (rng.random(n_events)<0.3))
+    columns['Flare Magnitude']=np.where(has_magnitude, magnitude.astype(str).astype(object), np.nan)
+    duration=(flare_end-flare_start)/minute
+    columns['Flare Integrated Flux']=_masked(_significant(magnitude*duration*minute*0.4, 2), has_flare)
+    columns['Flare Duration']=_masked(duration, has_flare)
+    columns['Flare Xray Time To Peak']=_masked((flare_peak-flare_start)/minute, has_flare)
+
+    #active region (the NOAA numbers grow with time) and location of the event, mostly western
+    has_region=associated & (rng.random(n_events)<0.9)
+    region=np.round(4875 + (period_start-_to_seconds('1987-11-07'))/(365.25*86400)*245 + rng.normal(0, 3, n_events))
+    columns['Active Region']=np.where(has_region, region.astype(str).astype(object), np.nan)
+    has_spots=has_region & (rng.random(n_events)<0.8)
+    columns['AR Area']=_masked(np.round(_lognormal(rng, 400, 0.8, n_events), -1), has_spots)
+    columns['AR Spot Class']=np.where(has_spots, _choice(rng, ['Fkc', 'Ekc', 'Dkc', 'Eki', 'Dki', 'Dai', 'Eho', 'Dac'], [30, 22, 20, 19, 10, 8, 6, 6], n_events), np.nan)
+    columns['AR Mag Class']=np.where(has_spots, _choice(rng, ['BGD', 'B', 'BG', 'BD', 'A', 'GD'], [75, 63, 39, 21, 10, 2], n_events), np.nan)
+    columns['AR Carrington']=_masked(np.round(rng.uniform(0, 360, n_events)), has_region)
+
+    has_location=associated | (rng.random(n_events)<0.25)
+    latitude=np.clip(np.round(rng.normal(0, 17, n_events)), -45, 45)
+    longitude=np.clip(np.round(rng.normal(45, 50, n_events)), -90, 160)
+    with np.errstate(invalid='ignore'):
+        from_center=np.degrees(np.arccos(np.cos(np.radians(latitude))*np.cos(np.radians(longitude))))
+    columns['Event Location From Center']=_masked(np.round(from_center, 1), has_location & (longitude<=90) & (rng.random(n_events)<0.65))
+    columns['Event Latitude']=_masked(latitude, has_location)
+    columns['Event Longitude']=_masked(longitude, has_location)
+    columns['Event Location Source']=np.where(has_location, _choice(rng, ['IGR List', 'PRF', 'EST', 'HOL', 'LEA', 'SVI', 'RAM'], [94, 60, 59, 49, 40, 22, 10], n_events), np.nan)
+    has_location_2=has_location & (rng.random(n_events)<0.35)
+    columns['Event Location from Center 2']=_masked(np.round(from_center + rng.normal(0, 3, n_events), 1), has_location_2 & (longitude<=90))
+    columns['Event Latitude 2']=np.where(has_location_2, np.round(latitude + rng.normal(0, 3, n_events)).astype(str).astype(object), np.nan)
+    columns['Event Longitude 2']=np.where(has_location_2, np.round(longitude + rng.normal(0, 5, n_events)).astype(str).astype(object), np.nan)
+    columns['Event Location Source 2']=np.where(has_location_2, _choice(rng, ['CDAW', 'LMSAL', 'FS', 'SWPC'], [60, 40, 4, 20], n_events), np.nan)
+
+    columns['Case']=np.where(associated, np.where(longitude>90, 'Farside', _choice(rng, ['AR', 'AR/ESP', 'FE', 'ESP', 'AR/FE', 'Unknown', 'Pending'],
+                                                                                       [165, 27, 10, 10, 7, 2, 3], n_events)), np.nan)
+
+    #radio bursts, around the flare peak
+    has_radio=associated & (rng.random(n_events)<0.7)
+    columns['Radio Rbr245Max']=_masked(_significant(_lognormal(rng, 500, 1.2, n_events), 2), has_radio)
+    columns['Radio Rbr2695Max']=_masked(_significant(_lognormal(rng, 200, 1.2, n_events), 2), has_radio)
+    columns['Radio Rbr8800']=np.where(has_radio, _significant(_lognormal(rng, 800, 1.3, n_events), 2).astype(str).astype(object), np.nan)
+    columns['Radio TyIII_Imp']=_masked(rng.integers(1, 4, n_events), has_radio & (rng.random(n_events)<0.75))
+    type_2_start=release + np.round(rng.normal(-9, 5, n_events))*minute
+    type_2_end=type_2_start + np.round(_lognormal(rng, 15, 0.6, n_events))*minute
+    has_type_2=has_radio
+    cme_speed=np.clip(_lognormal(rng, 1265, 0.4, n_events)*10**(0.08*(log_flux_10-1)), 250, 3500)
+    columns['Radio m_TyII Start Time']=format_times(type_2_start, has_type_2)
+    columns['Radio m_TyII End Time']=format_times(type_2_end, has_type_2)
+    columns['Radio TyII Imp']=_masked(rng.integers(1, 4, n_events), has_type_2)
+    columns['Radio TyII Speed']=_masked(np.round(cme_speed*rng.uniform(0.7, 1.3, n_events), -1), has_type_2 & (rng.random(n_events)<0.75))
+    columns['Radio m_TyII Start Frequency']=_masked(_choice(rng, [245, 180, 100, 80, 50], [20, 10, 20, 10, 40], n_events).astype(float), has_type_2 & (rng.random(n_events)<0.8))
+    columns['Radio m_TyII End Frequency']=_masked(_choice(rng, [45, 35, 25, 20, 7], [30, 30, 15, 15, 10], n_events).astype(float), has_type_2 & (rng.random(n_events)<0.8))
+    columns['Radio Station']=np.where(has_type_2, _choice(rng, ['SVI', 'SAG', 'CUL', 'LEA', 'PALE', 'WEIS', 'CULG'], [37, 34, 27, 27, 20, 20, 15], n_events), np.nan)
+    has_dh=has_radio & (period_start>=_to_seconds('1996-01-01')) & (rng.random(n_events)<0.9)
+    dh_start=_grid(release + rng.normal(3, 10, n_events)*minute)
+    columns['Radio DH Start Time']=format_times(dh_start, has_dh)
+    columns['Radio DH End Time']=format_times(_grid(dh_start + _lognormal(rng, 6*3600, 1.0, n_events)), has_dh)
+    columns['Radio DH Start Frequency']=_masked(_choice(rng, [14000, 10000, 5000, 3000], [50, 25, 15, 10], n_events).astype(float), has_dh)
+    columns['Radio DH End Frequency']=_masked(_choice(rng, [20, 35, 100, 200, 500, 3000], [20, 20, 25, 15, 15, 5], n_events).astype(float), has_dh)
+    columns['Radio DH Note']=np.where(has_dh & (rng.random(n_events)<0.8),
+                                      _choice(rng, ['Narrowband wisps', 'Very fast drift', 'Gap btwn 1000 and 500 kHz', 'Complex', 'Intermittent'], [5, 4, 3, 10, 5], n_events), np.nan)
+    has_type_4=has_radio & (rng.random(n_events)<0.85)
+    type_4_start=release + np.round(rng.normal(-11, 8, n_events))*minute
+    type_4_duration=np.round(_lognormal(rng, 30, 0.8, n_events))
+    columns['Radio TyIV Start Time']=format_times(type_4_start, has_type_4)
+    columns['Radio TyIV End Time']=format_times(type_4_start + type_4_duration*minute, has_type_4)
+    columns['Radio TyIV Imp']=_masked(rng.integers(1, 4, n_events), has_type_4)
+    columns['Radio TyIV Duration']=_masked(type_4_duration, has_type_4)
+
+    #CME (CDAW since SOHO, DONKI since 2010)
+    has_cdaw=associated & (period_start>=_to_seconds('1996-01-01')) & (rng.random(n_events)<0.85)
+    has_donki=associated & (period_start>=_to_seconds('2010-01-01')) & (rng.random(n_events)<0.9)
+    columns[TIME_CME]=format_times(release + np.round(rng.uniform(5, 40, n_events))*minute, has_cdaw)
+    columns['CDAW CME Speed']=_masked(np.round(cme_speed), has_cdaw)
+    columns['DONKI CME Speed']=_masked(np.round(cme_speed*rng.normal(1, 0.15, n_events)), has_donki)
+    width=np.where(rng.random(n_events)<0.8, _choice(rng, ['Halo', 'Halo (OA)', 'Halo (BA)', 'Halo (S)', 'Partial Halo'], [123, 31, 18, 2, 2], n_events),
+                   np.char.mod('%d', rng.integers(90, 300, n_events)).astype(object))
+    columns['CME Width']=np.where(has_cdaw, width, np.nan)
+    columns['CME Mean Position Angle']=_masked(np.round(np.mod(rng.normal(270, 60, n_events), 360)), has_cdaw)
+    columns['ESP_CME']=np.where(associated & (rng.random(n_events)<0.17), _choice(rng, ['RELAT', 'RELAT?', 'UNRELAT', 'UNRELATAT', 'UNK'], [37, 5, 5, 3, 1], n_events), np.nan)
+    gle=(channels[100.0]['max_flux']>30) & (rng.random(n_events)<0.6)
+    gle_number=counters['GLE'] + np.cumsum(gle)
+    prf=counters['PRF'] + np.cumsum(associated)
+    counters['GLE'],counters['PRF']=int(gle_number[-1]),int(prf[-1])
+    columns['GLE Event Number']=np.where(gle, np.char.add('GLE ', np.char.mod('%d', gle_number)).astype(object), np.nan)
+    columns['PRF']=np.where(associated, np.char.mod('%d', prf).astype(object), np.nan)
+    columns['Comments']=np.where(associated & (rng.random(n_events)<0.73),
+                                 _choice(rng, ['IGR List', 'No PRF or RSGA available', 'No  RSGA available', 'Missing CME imagery.', 'ESP', 'FE proximal to AR'],
+                                         [94, 20, 15, 3, 3, 2], n_events), np.nan)
+    return columns
+
+
+def _significant(values,digits):
+    '''
+    Round positive values to a number of significant digits.
+    '''
+    scale=10.0**(digits - 1 - np.floor(np.log10(values)))
+    return np.round(values*scale)/scale
+
+
+def _file_stamps(period_start,experiment):
+    '''
+    Return the base names of the flux time series files of the events: prefix of the experiment + '.YYYY-MM-DDTHHMMSSZ'.
+    '''
+    strings=np.datetime_as_string(period_start.astype('datetime64[s]'), unit='s')
+    characters=strings.view('U1').reshape(len(strings), -1)[:, [0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 14, 15, 17, 18]]
+    stamps=np.ascontiguousarray(characters).view('U17').ravel()
+    prefixes=np.array([prefix + '.' for _, prefix, _, _ in EXPERIMENTS])[experiment]
+    return np.char.add(np.char.add(prefixes, stamps), 'Z')
+
+
+def _malformed_values(rng,column,values):
+    '''
+    Return malformed values (strings) for known values of a column, like the ones of the real catalog.
+    '''
+    n_values=len(values)
+    if column=='Flare Magnitude': #exponent without 'e', eg '3.23-6'
+        magnitude=np.asarray(values, dtype=float)
+        exponent=np.floor(np.log10(magnitude))
+        return np.char.add(np.char.mod('%.2f-', magnitude/10**exponent), np.char.mod('%d', -exponent))
+    if column in ['CDAW CME Speed', 'DONKI CME Speed']: #lower limits
+        return np.char.add('>', np.char.mod('%d', np.asarray(values, dtype=float)))
+    if column in ['Event Longitude', 'Event Latitude 2', 'Event Longitude 2']:
+        return np.full(n_values, 'FS')
+    if column=='Active Region':
+        return np.full(n_values, 'UNK')
+    if column=='Radio Rbr8800':
+        return _choice(rng, ['ESP', 'DSF'], [1, 1], n_values).astype(str)
+    if column=='PRF': #2 reports
+        return np.char.add(np.char.add(values.astype(str), '/'), np.char.mod('%d', values.astype(int)+1))
+    #times: hour 24
+    strings=np.asarray(values, dtype='U19')
+    strings.view('U1').reshape(n_values, -1)[:, 11:13]=['2', '4']
+    return strings
+
+
+def _malformed_columns():
+    '''
+    Return the columns where values can be malformed: the ones converted by work.prepare_dataframe
+    and the ones with malformed values in the real catalog.
+    '''
+    columns=['Flare Magnitude', 'CDAW CME Speed', 'DONKI CME Speed', 'Event Longitude', TIME_FLARE, TIME_CME,
+             'Active Region', 'Event Latitude 2', 'Event Longitude 2', 'Radio Rbr8800', 'PRF']
+    return columns + [event_type + time for event_type in EVENT_TYPES for time in [TIME_SEP, TIME_PEAK, TIME_MAX]]
+
+
+def _catalog_chunk(rng,period_start,period_end,experiment,counters,malformed_rate,anomaly_rate):
+    '''
+    Generate the events of a chunk of the catalog from their time periods (see generate_catalog).
+    Returns the chunk of the catalog and its anomalies.
+    '''
+    n_events=len(period_start)
+    release=np.round((period_start + rng.uniform(0.05, 0.4, n_events)*(period_end-period_start))/60)*60
+    channels,gamma=_sep_events(rng, release, period_start, period_end)
+
+    anomaly=np.where(rng.random(n_events)<anomaly_rate, rng.integers(0, len(ANOMALIES), n_events), -1)
+    onset_shift=np.where(anomaly==0, rng.integers(1, 13, n_events)*CADENCE, 0)
+    flare_shift=np.where(anomaly==1, channels[10.0]['start'] - release + rng.uniform(10, 120, n_events)*60, 0.0)
+
+    stamps=_file_stamps(period_start, experiment)
+    columns={'Experiment': np.array([name for name, _, _, _ in EXPERIMENTS], dtype=object)[experiment],
+             'Flux Type': np.full(n_events, 'integral', dtype=object),
+             'Options': np.full(n_events, np.nan),
+             'Background Subtraction': np.full(n_events, np.nan),
+             'Time Period Start': format_times(period_start),
+             'Time Period End': format_times(period_end),
+             'All Fluxes Time Series': np.char.add(stamps, '_fluxes_all_bins.csv').astype(object)}
+
+    events={}
+    for event_type in sorted(EVENT_TYPES):
+        energy=ENERGY_CHANNELS[event_type]
+        file_names=np.char.add(stamps, f'.{energy:.1f}.MeV.txt').astype(object)
+        block,events[event_type]=_event_type_columns(rng, event_type, channels[energy], gamma, experiment, file_names,
+                                                     onset_shift if event_type==AB_10 else np.zeros(n_events))
+        columns.update({event_type + column: values for column, values in block.items()})
+
+    associated=(channels[10.0]['max_flux']>FLUX_THRESHOLDS[TC_10]) | ((channels[30.0]['max_flux']>BACKGROUND_FLUX[30.0]) & (rng.random(n_events)<0.1))
+    columns.update(_other_columns(rng, period_start, release, channels, associated, flare_shift, counters))
+
+    anomalies=pd.DataFrame({'negative_rise_time': (anomaly==0) & events[AB_10]['has_onset'],
+                            'flare_after_sep_start': (anomaly==1) & pd.notna(columns[TIME_FLARE]) & events[AB_10]['has_event'],
+                            'longitude_out_of_range': (anomaly==2) & pd.notna(columns['Event Longitude'])})
+    longitude=columns['Event Longitude']
+    out_of_range=anomalies['longitude_out_of_range'].to_numpy()
+    longitude[out_of_range]=np.round(np.where(longitude[out_of_range]>=0, 1, -1)*rng.uniform(181, 260, out_of_range.sum()))
+
+    #the anomalies are not hidden by malformed values
+    anomalous=anomalies.any(axis=1).to_numpy()
+    for column in _malformed_columns():
+        values=columns[column]
+        malformed=pd.notna(values) & (rng.random(n_events)<malformed_rate) & ~anomalous
+        if malformed.any():
+            if values.dtype!=object: #the column is read as strings
+                values=np.where(np.isfinite(values), format_floats(np.nan_to_num(values)).astype(object), np.nan)
+            values[malformed]=_malformed_values(rng, column, values[malformed]).astype(object)
+            columns[column]=values
+        anomalies[column]=malformed
+
+    return pd.DataFrame(columns, columns=CATALOG_COLUMNS), anomalies
+
+
+def iterate_catalog(n_events,seed=0,start=SYNTHETIC_START,end=SYNTHETIC_END,malformed_rate=MALFORMED_RATE,anomaly_rate=ANOMALY_RATE):
+    '''
+    Generate a synthetic SEP event catalog (see the module docstring) by chunks of CATALOG_CHUNK events,
+    so that the catalogs of millions of events don't have to fit in memory (see generate_catalog for the parameters).
+    The time periods of all the events are sampled first, then each chunk from its own seed (spawned from seed).
+
+    Returns:
+    --------
+    chunks : generator of (pandas DataFrame, pandas DataFrame)
+        the chunks of the catalog and their anomalies (see generate_catalog), indexed by the position of the events in the catalog
+    '''
+    sequence=np.random.SeedSequence(seed)
+    period_start,period_end,experiment=_sample_periods(np.random.default_rng(sequence.spawn(1)[0]), n_events, start, end)
+    counters={'GLE': 39, 'PRF': 636}
+    for first, chunk_sequence in zip(range(0, n_events, CATALOG_CHUNK), sequence.spawn((n_events+CATALOG_CHUNK-1)//CATALOG_CHUNK)):
+        rows=slice(first, first+CATALOG_CHUNK)
+        df,anomalies=_catalog_chunk(np.random.default_rng(chunk_sequence), period_start[rows], period_end[rows], experiment[rows],
+                                    counters, malformed_rate, anomaly_rate)
+        index=pd.RangeIndex(first, first+len(df))
+        yield df.set_axis(index), anomalies.set_axis(index)
+
+
+def generate_catalog(n_events,seed=0,start=SYNTHETIC_START,end=SYNTHETIC_END,malformed_rate=MALFORMED_RATE,anomaly_rate=ANOMALY_RATE,
+                     return_anomalies=False):
+    '''
+    Generate a synthetic SEP event catalog (see the module docstring).
+    The catalog is in memory (about 3 GB per million events), use write_synthetic_catalog for the larger catalogs.
+
+    Parameters:
+    -----------
+    n_events : int
+        The number of events (rows) of the catalog
+    seed : int, default to 0
+        The seed of the random generator, the same seed gives the same catalog
+    start, end : string, default to SYNTHETIC_START and SYNTHETIC_END
+        The dates covered by the time periods of the events
+    malformed_rate : float, default to MALFORMED_RATE
+        The fraction of the known values of the columns of _malformed_columns that are malformed
+    anomaly_rate : float, default to ANOMALY_RATE
+        The fraction of the events with an anomaly (see ANOMALIES)
+    return_anomalies : boolean, default to False
+        If True, also return the anomalies
+
+    Returns:
+    --------
+    df : pandas DataFrame
+        The catalog, with the columns CATALOG_COLUMNS, the values as in the CSV file of the catalog (the times are strings)
+    anomalies : pandas DataFrame (if return_anomalies is True)
+        A boolean column per anomaly of ANOMALIES, True for the events with this anomaly, and a column per malformed column,
+        True where the value is malformed
+    '''
+    chunks=list(iterate_catalog(n_events, seed=seed, start=start, end=end, malformed_rate=malformed_rate, anomaly_rate=anomaly_rate))
+    df=pd.concat([chunk for chunk, _ in chunks])
+    anomalies=pd.concat([anomalies for _, anomalies in chunks])
+    if return_anomalies:
+        return df, anomalies
+    return df
+
+
+def write_synthetic_catalog(file_name,n_events,seed=0,**parameters):
+    '''
+    Generate a synthetic catalog (see generate_catalog, same parameters) and write it in a CSV file as the real catalog,
+    chunk by chunk (see iterate_catalog). Returns the anomalies of the catalog.
+    '''
+    anomalies=[]
+    for k, (df, chunk_anomalies) in enumerate(iterate_catalog(n_events, seed=seed, **parameters)):
+        write_catalog_csv(df, file_name, header=k==0, mode='w' if k==0 else 'a')
+        anomalies.append(chunk_anomalies)
+    return pd.concat(anomalies)
+
+
+def synthetic_flux(df,position,energy,rng=None,noise=0.03,padding=24.0):
+    '''
+    Return the synthetic flux time series of an event (row position of the catalog df) for an energy channel:
+    the background of the channel, rising exponentially from the SEP start time of the AB event to the max flux
+    at the max flux time, then decaying exponentially to the background at the SEP end time, with a log-normal noise.
+    The series covers the time period of the event and the event, plus padding hours, on the GOES grid.
+
+    Returns:
+    --------
+    times : numpy array of int (seconds since 1970)
+    fluxes : numpy array of float (pfu)
+    '''
+    if rng is None:
+        rng=np.random.default_rng(0)
+    event_type=[event_type for event_type in EVENT_TYPES if event_type in [AB_10, AB_30, AB_50, AB_100] and ENERGY_CHANNELS[event_type]==energy][0]
+    row=df.iloc[position]
+    time=lambda column: pd.to_datetime(row[column], errors='coerce')
+    seconds=lambda value: value.value//10**9
+    background=BACKGROUND_FLUX[energy]
+
+    period_start,period_end=time('Time Period Start'),time('Time Period End')
+    start,max_time,end=time(event_type + TIME_SEP),time(event_type + TIME_MAX),time(event_type + 'SEP End Time')
+    max_flux=pd.to_numeric(row[event_type + 'Max Flux (pfu)'], errors='coerce')
+    first=seconds(period_start)
+    last=max(seconds(period_end), seconds(end) if pd.notna(end) else 0) + int(padding*3600)
+    times=np.arange(first, last+1, CADENCE, dtype=np.int64)
+
+    fluxes=background*np.exp(noise*rng.standard_normal(len(times)))
+    if pd.notna(start) and pd.notna(max_time) and pd.notna(end) and pd.notna(max_flux) and start<max_time<end:
+        start_seconds,max_seconds,end_seconds=seconds(start),seconds(max_time),seconds(end)
+        ratio=np.log(max_flux/background)
+        rising=(times>=start_seconds) & (times<=max_seconds)
+        decaying=(times>max_seconds) & (times<end_seconds)
+        fluxes[rising]*=np.exp(ratio*(times[rising]-start_seconds)/(max_seconds-start_seconds))
+        fluxes[decaying]*=np.exp(ratio*(end_seconds-times[decaying])/(end_seconds-max_seconds))
+    if pd.notna(max_time) and pd.notna(max_flux):
+        #the max of the series is the max flux of the catalog
+        peak=np.searchsorted(times, seconds(max_time))
+        if peak<len(times):
+            fluxes=np.minimum(fluxes, max_flux)
+            fluxes[peak]=max_flux
+    return times, fluxes
+
+
+def write_synthetic_flux_files(df,file_path,seed=0,encoded=False,**parameters):
+    '''
+    Write the synthetic flux time series files of the events of the catalog df (see synthetic_flux, same parameters) in file_path,
+    one file per event and energy channel (the TC and AB event types of an energy share the file),
+    as text files (Time and Flux columns) or, if encoded is True, directly as encoded files (see flux_encoding.py).
+    Returns the number of files written.
+    '''
+    from flux_encoding import write_encoded_flux, encoded_file_name
+
+    rng=np.random.default_rng(seed)
+    n_files=0
+    for position in range(len(df)):
+        for energy, event_type in zip(CHANNELS, [AB_10, AB_30, AB_50, AB_100]):
+            times,fluxes=synthetic_flux(df, position, energy, rng=rng, **parameters)
+            file_name=file_path + df[event_type + 'Flux Time Series'].iloc[position]
+            if encoded:
+                write_encoded_flux(encoded_file_name(file_name), times, fluxes)
+            else:
+                lines=np.char.add(np.char.add(np.datetime_as_string(times.astype('datetime64[s]'), unit='s'), ' '), np.char.mod('%.6g', fluxes))
+                with open(file_name, 'w') as file:
+                    file.write('\n'.join(lines))
+            n_files+=1
+    return n_files
+
+
+def test_generate_catalog(n_events=20000,seed=1):
+    '''
+    Test a synthetic catalog: its columns are the ones of the real catalog, it is the same for the same seed,
+    the times of the events are ordered except for the anomalies, and work.prepare_dataframe coerces the malformed values.
+    '''
+    import tempfile
+    from work import prepare_dataframe
+
+    if os.path.exists('Datasets/' + CATALOG_FILE):
+        assert CATALOG_COLUMNS==list(pd.read_csv('Datasets/' + CATALOG_FILE, nrows=0).columns), "The columns don't match the real catalog"
+    assert len(CATALOG_COLUMNS)==173
+
+    df,anomalies=generate_catalog(n_events, seed=seed, return_anomalies=True)
+    assert list(df.columns)==CATALOG_COLUMNS and len(df)==n_events
+    assert generate_catalog(1000, seed=seed).equals(generate_catalog(1000, seed=seed)), "The catalog is not reproducible"
+
+    with tempfile.TemporaryDirectory() as directory:
+        write_synthetic_catalog(os.path.join(directory, CATALOG_FILE), n_events, seed=seed)
+        prepared=prepare_dataframe(file_path=os.path.join(directory, ''), notify_changes=False)
+    anomalies=anomalies.iloc[:-1] #the last row is removed by prepare_dataframe
+
+    #the malformed values are coerced to NaN
+    for column in ['Flare Magnitude', 'CDAW CME Speed', 'Event Longitude', TIME_FLARE, AB_10 + TIME_SEP]:
+        assert prepared.loc[anomalies[column].to_numpy(), column].isna().all()
+        assert prepared[column].notna().sum()>0
+
+    #time orderings
+    valid=lambda *columns: ~anomalies[list(columns)].any(axis=1).to_numpy()
+    for event_type in EVENT_TYPES:
+        start,max_time=prepared[event_type + TIME_SEP],prepared[event_type + TIME_MAX]
+        known=start.notna() & max_time.notna() & valid(event_type + TIME_SEP, event_type + TIME_MAX)
+        assert (max_time[known]>=start[known]).all(), f"Max flux before the SEP start for {event_type}"
+        peak=prepared[event_type + TIME_PEAK]
+        known=start.notna() & peak.notna() & valid(event_type + TIME_SEP, event_type + TIME_PEAK, 'negative_rise_time')
+        assert (peak[known]>=start[known]).all(), f"Onset peak before the SEP start for {event_type}"
+    for tc, ab in [(TC_10, AB_10), (TC_30, AB_30), (TC_50, AB_50), (TC_100, AB_100)]:
+        known=prepared[tc + TIME_SEP].notna() & valid(tc + TIME_SEP, ab + TIME_SEP)
+        assert prepared.loc[known, ab + TIME_SEP].notna().all()
+        assert (prepared.loc[known, tc + TIME_SEP]>=prepared.loc[known, ab + TIME_SEP]).all(), f"TC event before the AB event for {tc}"
+    known=prepared[TIME_FLARE].notna() & prepared[AB_10 + TIME_SEP].notna() & valid(TIME_FLARE, AB_10 + TIME_SEP, 'flare_after_sep_start')
+    assert (prepared.loc[known, TIME_FLARE]<prepared.loc[known, AB_10 + TIME_SEP]).all(), "Flare after the SEP start"
+    assert (prepared.loc[anomalies['flare_after_sep_start'].to_numpy(), TIME_FLARE]>prepared.loc[anomalies['flare_after_sep_start'].to_numpy(), AB_10 + TIME_SEP]).all()
+    #velocity dispersion: the >100 MeV protons arrive before the >10 MeV protons
+    known=prepared[AB_100 + TIME_SEP].notna() & valid(AB_10 + TIME_SEP, AB_100 + TIME_SEP)
+    assert (prepared.loc[known, AB_100 + TIME_SEP]<=prepared.loc[known, AB_10 + TIME_SEP]).mean()>0.9
+
+    #the rise times are the ones of the times, negative for the anomalies
+    rise=(prepared[AB_10 + TIME_PEAK]-prepared[AB_10 + TIME_SEP]).dt.total_seconds()/60
+    known=rise.notna()
+    assert np.allclose(rise[known], prepared.loc[known, AB_10 + SEP_TO_PEAK])
+    assert (prepared.loc[anomalies['negative_rise_time'].to_numpy(), AB_10 + SEP_TO_PEAK]<0).all()
+    assert (prepared['Event Longitude'].abs()>180).sum()==anomalies['longitude_out_of_range'].sum()
+
+    #proportions of events close to the real catalog
+    for event_type, proportion in [(TC_10, 0.47), (TC_100, 0.15), (AB_10, 0.99), (AB_30, 0.63)]:
+        assert abs(prepared[event_type + TIME_SEP].notna().mean()-proportion)<0.1, f"Proportion of {event_type} events"
+
+    #flux time series of a few events, read back through the flux store: the max of each series is the max flux of the catalog
+    from flux_store import load_generate_flux_store
+    events=prepared.iloc[:30]
+    with tempfile.TemporaryDirectory() as directory:
+        file_path=os.path.join(directory, '')
+        assert write_synthetic_flux_files(events, file_path, seed=seed)==4*len(events)
+        store=load_generate_flux_store(events, file_path, directory=file_path + 'flux_store')
+        assert len(store['files'])==4*len(events) and (store['lengths']>0).all()
+        for k, event_type in enumerate(store['event_types']):
+            if event_type not in [AB_10, AB_30, AB_50, AB_100]:
+                continue
+            for position, segment in zip(store['series_position'][store['series_event_type']==k], store['series_segment'][store['series_event_type']==k]):
+                event=events.iloc[position]
+                if pd.isna(event[event_type + 'Max Flux (pfu)']) or pd.isna(event[event_type + TIME_MAX]):
+                    continue
+                time,flux=store['time'][store['offsets'][segment]:store['offsets'][segment+1]],store['flux'][store['offsets'][segment]:store['offsets'][segment+1]]
+                assert np.isclose(flux.max(), event[event_type + 'Max Flux (pfu)'], rtol=1e-5), (position, event_type)
+                #the noisy background can reach a low max flux, the max flux time is then one of the max samples
+                assert event[event_type + TIME_MAX].value//10**9 in time[np.isclose(flux, flux.max(), rtol=1e-5)], (position, event_type)
+    print("All tests passed!")
+
+
+if __name__ == '__main__':
+    from benchmark import run_benchmarks, benchmark_table
+    from work import prepare_dataframe
+
+    #Synthetic catalog of a million events with the columns of the real catalog, prepared as the real one
+    os.makedirs('Datasets/synthetic/', exist_ok=True)
+    anomalies=write_synthetic_catalog('Datasets/synthetic/' + CATALOG_FILE, 1000000, seed=0)
+    print(anomalies.sum())
+    synthetic_df=prepare_dataframe(file_path='Datasets/synthetic/', notify_changes=False)
+
+    #Flux time series of a smaller synthetic catalog, and benchmark on synthetic catalogs instead of the replicated catalog
+    write_synthetic_flux_files(generate_catalog(1000, seed=0), 'Datasets/synthetic/', encoded=True)
+    print(benchmark_table(run_benchmarks(synthetic_seed=0)).to_string())
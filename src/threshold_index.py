@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+'''
+This code build sorted indexes over the columns used in ">= threshold" selections
+(Flare Magnitude, CDAW CME Speed, DONKI CME Speed).
+
+For each column, the known values are sorted once (argsort), so the events whose value is >= a threshold
+are a contiguous slice of the sorted positions, found with a binary search (searchsorted) in O(log n).
+The indexes can be saved in a .npz file next to the cached dataset.
+'''
+
+import numpy as np
+
+#Columns used with a ">= threshold" selection in subset_selection
+THRESHOLD_COLUMNS=['Flare Magnitude', 'CDAW CME Speed', 'DONKI CME Speed']
+
+
+def build_threshold_index(df,columns=THRESHOLD_COLUMNS):
+    '''
+    Build the sorted index of each threshold column.
+    The events with an unknown value (NaN) are not in the index, as they are never selected by a threshold.
+
+    Parameters:
+    -----------
+    df : panda DataFrame
+        the dataframe containing all event information
+    columns : list of string, default to THRESHOLD_COLUMNS
+        the columns to index
+
+    Returns:
+    --------
+    threshold_index : dict
+        'n_rows' : the number of rows of df
+        column : (values, positions) for each column, values being the known values sorted in increasing order,
+                 and positions the row positions (as used by df.iloc) of these values
+    '''
+    threshold_index={'n_rows': len(df)}
+
+    for column in columns:
+        values=df[column].to_numpy(dtype=float)
+        positions=np.flatnonzero(~np.isnan(values))
+        order=np.argsort(values[positions], kind='stable')
+        threshold_index[column]=(values[positions][order], positions[order])
+
+    return threshold_index
+
+
+def threshold_slice(threshold_index,column,threshold):
+    '''
+    Return the slice of the sorted index of a column corresponding to the values >= threshold.
+    It only needs a binary search, O(log n).
+    '''
+    values,_=threshold_index[column]
+    return slice(int(np.searchsorted(values, threshold, side='left')), len(values))
+
+
+def threshold_positions(threshold_index,column,threshold):
+    '''
+    Return the row positions (as used by df.iloc) of the events whose value of the column is >= threshold.
+    The positions are sorted by increasing value of the column, it is a view on the index (no copy).
+
+    Parameters:
+    -----------
+    threshold_index : dict
+        the threshold index of the dataframe (see build_threshold_index)
+    column : string
+        one of the indexed columns (eg 'Flare Magnitude')
+    threshold : float
+        the minimum value of the column
+
+    Returns:
+    --------
+    positions : numpy array of int
+        the row positions of the selected events
+    '''
+    _,positions=threshold_index[column]
+    return positions[threshold_slice(threshold_index, column, threshold)]
+
+
+def threshold_count(threshold_index,column,threshold):
+    '''
+    Return the number of events whose value of the column is >= threshold, in O(log n).
+    '''
+    selected=threshold_slice(threshold_index, column, threshold)
+    return selected.stop - selected.start
+
+
+def save_threshold_index(threshold_index,file_name):
+    '''
+    Save a threshold index in a .npz file.
+    '''
+    arrays={'n_rows': np.array(threshold_index['n_rows'])}
+    for column in threshold_index:
+        if column!='n_rows':
+            arrays[column + ' values'], arrays[column + ' positions']=threshold_index[column]
+    np.savez(file_name, **arrays)
+
+
+def load_threshold_index(file_name):
+    '''
+    Load a threshold index from a .npz file.
+    '''
+    with np.load(file_name) as arrays:
+        threshold_index={'n_rows': int(arrays['n_rows'])}
+        for key in arrays.files:
+            if key.endswith(' values'):
+                column=key[:-len(' values')]
+                threshold_index[column]=(arrays[key], arrays[column + ' positions'])
+    return threshold_index
+
+
+def test_threshold_index(df):
+    '''
+    Test that the threshold positions and counts are the ones of a direct ">= threshold" filter of df,
+    including at a threshold equal to a value of the column, and after saving and loading the index.
+    '''
+    import os
+    import tempfile
+
+    threshold_index=build_threshold_index(df)
+    with tempfile.TemporaryDirectory() as directory:
+        file_name=os.path.join(directory, 'threshold_index.npz')
+        save_threshold_index(threshold_index, file_name)
+        loaded=load_threshold_index(file_name)
+
+    for column in THRESHOLD_COLUMNS:
+        values=df[column].to_numpy(dtype=float)
+        known=values[~np.isnan(values)]
+        for threshold in [-np.inf, np.median(known), known.max(), np.inf]:
+            expected=np.flatnonzero(values>=threshold)
+            for index in [threshold_index, loaded]:
+                assert np.array_equal(np.sort(threshold_positions(index, column, threshold)), expected), (column, threshold)
+                assert threshold_count(index, column, threshold)==len(expected), (column, threshold)
+    print("All tests passed!")
+
+
+if __name__ == '__main__':
+    from work import load_generate_dataset, load_generate_threshold_index
+
+    #Number of events above each flare magnitude threshold, each threshold is a binary search in the sorted index
+    df=load_generate_dataset()
+    threshold_index=load_generate_threshold_index(df)
+    for flare_magnitude in [1e-6,1e-5,5e-5,1e-4,5e-4,1e-3]:
+        print(f'Flare magnitude >= {flare_magnitude}: {len(threshold_positions(threshold_index,"Flare Magnitude",flare_magnitude))} events')
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+'''
+This code measure the velocity dispersion of the events: the higher energy protons arrive first at the Earth,
+so the onset of the >30, >50 and >100 MeV fluxes is earlier than the onset of the >10 MeV flux.
+
+For every event, the flux time series of the channels of a family of event types (TC or AB) are resampled
+on a common grid over the onset window (from the flux store, see flux_store.py), and each channel is cross-correlated
+with the >10 MeV channel. The lag of the maximum of the correlation is the delay of the >10 MeV onset after the onset of the channel.
+All the events and channels are correlated at once with FFTs (zero padded, so the correlation is linear, not circular).
+The correlation is done on the time derivative of the logarithm of the flux: the onsets span several orders of magnitude,
+and they are steps of the flux whose derivatives are pulses, with a well defined lag.
+'''
+
+import warnings
+
+import numpy as np
+
+from constants import TC_10, TC_30, TC_50, TC_100, AB_10, AB_30, AB_50, AB_100, TIME_SEP
+
+from flux_store import interpolate_flux, to_seconds
+from subset_cache import forget_fingerprint
+
+#Channels of each family of event types, the first one is the reference channel
+CHANNEL_FAMILIES=[[TC_10, TC_30, TC_50, TC_100], [AB_10, AB_30, AB_50, AB_100]]
+
+#Onset window: from ONSET_PADDING hours before the earliest SEP start time of the channels, during ONSET_DURATION hours
+ONSET_PADDING=2.0
+ONSET_DURATION=12.0
+
+#Cadence of the common grid (minutes), the cadence of GOES
+DISPERSION_CADENCE=5.0
+
+#Largest lag searched (hours)
+MAX_LAG=6.0
+
+#Names of the columns of the results (preceded by the event type)
+DISPERSION_LAG='Dispersion Lag (minutes)'
+DISPERSION_CORRELATION='Dispersion Correlation'
+
+
+def channel_segments(df,store,event_types):
+    '''
+    Return the segment of the flux store of each event (row position) for each event type (n_event_types x n_rows),
+    -1 if the event has no flux time series for this event type or it is not in the store.
+    '''
+    segments=np.full((len(event_types), len(df)), -1, dtype=np.int64)
+    store_types=list(store['event_types'])
+    for k, event_type in enumerate(event_types):
+        if event_type in store_types:
+            series=np.flatnonzero(store['series_event_type']==store_types.index(event_type))
+            segments[k, store['series_position'][series]]=store['series_segment'][series]
+    return segments
+
+
+def onset_profiles(df,store,event_types,padding=ONSET_PADDING,duration=ONSET_DURATION,cadence=DISPERSION_CADENCE):
+    '''
+    Resample the log10 of the flux of the channels of every event on a common grid over the onset window.
+
+    Returns:
+    --------
+    profiles : numpy array of float (n_rows x n_event_types x n_times)
+        the log10 of the flux, NaN where it is unknown (or <= 0), all NaN if the event has no SEP start time
+    starts : numpy array of int (n_rows)
+        the start of the onset window of each event (seconds)
+    '''
+    starts=np.full(len(df), np.iinfo(np.int64).max)
+    for event_type in event_types:
+        times,known=to_seconds(df[event_type + TIME_SEP])
+        starts=np.where(known, np.minimum(starts, times), starts)
+    has_start=starts<np.iinfo(np.int64).max
+    starts=np.where(has_start, starts - int(round(padding*3600)), 0)
+
+    grid=np.arange(0, duration*3600, cadence*60).astype(np.int64)
+    segments=np.where(has_start, channel_segments(df, store, event_types), -1).T
+    flux=interpolate_flux(store, segments.ravel(), np.repeat(starts, len(event_types))[:, None] + grid, max_gap=2*cadence*60)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        profiles=np.where(flux>0, np.log10(flux), np.nan)
+    return profiles.reshape(len(df), len(event_types), len(grid)), starts
+
+
+def cross_correlation_lags(profiles,cadence=DISPERSION_CADENCE,max_lag=MAX_LAG,min_overlap=0.5):
+    '''
+    Cross-correlate each channel of each event with the first channel (the reference), all at once with FFTs.
+
+    Parameters:
+    -----------
+    profiles : numpy array of float (n_events x n_channels x n_times)
+        the profiles of the channels on a common grid, NaN where unknown
+    cadence : float, default to DISPERSION_CADENCE
+        the cadence of the grid (minutes)
+    max_lag : float, default to MAX_LAG
+        the largest lag searched (hours)
+    min_overlap : float, default to 0.5
+        the minimum fraction of the grid where the profiles of both channels must be known, else the lag is NaN
+
+    Returns:
+    --------
+    lags : numpy array of float (n_events x n_channels)
+        the delay of the reference channel after each channel (minutes, refined between the grid times by a parabola
+        through the maximum of the correlation), positive if the channel starts earlier, 0 for the reference channel
+    correlations : numpy array of float (n_events x n_channels)
+        the correlation of the 2 centered profiles at this lag, normalized by the norms of the whole profiles
+    '''
+    n_times=profiles.shape[-1]
+    known=~np.isnan(profiles)
+    overlap=np.sum(known & known[:, :1], axis=-1)/n_times
+
+    #centered profiles, the unknown values are set to the median (0)
+    #(the median is the flat background of the profiles, a constant left in the profiles would tilt the correlation)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', category=RuntimeWarning) #All-NaN slice
+        medians=np.nanmedian(profiles, axis=-1, keepdims=True)
+    centered=np.where(known, profiles-np.nan_to_num(medians), 0.0)
+    norms=np.sqrt(np.sum(centered**2, axis=-1))
+
+    #linear correlation: the profiles are zero padded to twice their length
+    size=2*n_times
+    spectra=np.fft.rfft(centered, n=size, axis=-1)
+    correlation=np.fft.irfft(spectra.conj()*spectra[:, :1], n=size, axis=-1)
+    #correlation[..., lag] is sum(reference[t+lag]*channel[t]), the lags < 0 are at the end
+    lag_steps=int(min(max_lag*60/cadence, n_times-1))
+    lags=np.arange(-lag_steps, lag_steps+1)
+    correlation=correlation[..., lags % size]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        correlation=correlation/(norms[:, :1]*norms)[..., None]
+
+    best=np.argmax(np.nan_to_num(correlation, nan=-np.inf), axis=-1)
+    peak=np.take_along_axis(correlation, best[..., None], axis=-1)[..., 0]
+    #parabola through the maximum and its neighbours
+    left=np.take_along_axis(correlation, np.maximum(best-1, 0)[..., None], axis=-1)[..., 0]
+    right=np.take_along_axis(correlation, np.minimum(best+1, len(lags)-1)[..., None], axis=-1)[..., 0]
+    curvature=left-2*peak+right
+    with np.errstate(invalid='ignore', divide='ignore'):
+        shift=np.where((best>0) & (best<len(lags)-1) & (curvature<0), 0.5*(left-right)/curvature, 0.0)
+
+    result=(lags[best]+shift)*cadence
+    valid=(overlap>=min_overlap) & (norms>0) & (norms[:, :1]>0)
+    return np.where(valid, result, np.nan), np.where(valid, peak, np.nan)
+
+
+def compute_dispersion_lags(df,store,families=CHANNEL_FAMILIES,padding=ONSET_PADDING,duration=ONSET_DURATION,cadence=DISPERSION_CADENCE,max_lag=MAX_LAG):
+    '''
+    Compute the dispersion lag of every channel of every event (see cross_correlation_lags),
+    for each family of event types (the onset window and the grid are given as in onset_profiles).
+
+    Returns:
+    --------
+    results : dict
+        {event_type: (lags, correlations)} numpy arrays of the lag (minutes) and the correlation of each event of df
+        (NaN when the lag can't be computed), for the channels other than the reference channels
+    '''
+    results={}
+    for event_types in families:
+        profiles,_=onset_profiles(df, store, event_types, padding=padding, duration=duration, cadence=cadence)
+        lags,correlations=cross_correlation_lags(np.diff(profiles, axis=-1), cadence=cadence, max_lag=max_lag)
+        for k, event_type in enumerate(event_types[1:], start=1):
+            results[event_type]=(lags[:, k], correlations[:, k])
+    return results
+
+
+def add_dispersion_columns(df,store,**parameters):
+    '''
+    Add the dispersion lags computed by compute_dispersion_lags (same parameters) to df, in the columns
+    event_type + DISPERSION_LAG and event_type + DISPERSION_CORRELATION after the column event_type + 'Flux Time Series'.
+    df is modified in place and returned.
+    '''
+    for event_type, (lags, correlations) in compute_dispersion_lags(df, store, **parameters).items():
+        for offset, (column, values) in enumerate([(DISPERSION_LAG, lags), (DISPERSION_CORRELATION, correlations)], start=1):
+            if event_type + column in df.columns:
+                df[event_type + column]=values
+            else:
+                df.insert(df.columns.get_loc(event_type + 'Flux Time Series')+offset, event_type + column, values)
+    forget_fingerprint(df) #the selections cached for df are no longer valid
+    return df
+
+
+def test_cross_correlation_lags(n_events=40,cadence=DISPERSION_CADENCE,seed=0):
+    '''
+    Cross-correlate synthetic onsets (steps of the log10 of the flux, the higher energy channels starting earlier by known delays),
+    check that the delays are recovered within a fraction of the cadence, that the correlations match np.correlate,
+    and that the channels without enough known values get no lag.
+    '''
+    rng=np.random.default_rng(seed)
+    grid=np.arange(0, ONSET_DURATION*60, cadence)
+    reference_onset=rng.uniform(3, 6, n_events)*60
+    delays=np.column_stack([np.zeros(n_events), rng.uniform(0, 90, (n_events, 3))])
+    onsets=reference_onset[:, None]-delays
+    rise=rng.uniform(10, 30, (n_events, 1, 1))
+    profiles=rng.uniform(-2, 0, (n_events, 4, 1)) + rng.uniform(1, 4, (n_events, 4, 1))/(1+np.exp(-(grid-onsets[..., None])/rise))
+    profiles+=rng.normal(0, 1e-3, profiles.shape)
+    #the last event has an unknown >100 MeV channel
+    profiles[-1, 3, :]=np.nan
+
+    derivatives=np.diff(profiles, axis=-1)
+    lags,correlations=cross_correlation_lags(derivatives, cadence=cadence)
+    assert np.allclose(lags[:-1], delays[:-1], atol=cadence/2)
+    assert np.allclose(lags[:, 0], 0) and np.allclose(correlations[:, 0], 1)
+    assert np.isnan(lags[-1, 3]) and np.isnan(correlations[-1, 3])
+
+    #the correlation at the best lag of the grid, computed directly
+    lag_steps=int(min(MAX_LAG*60/cadence, derivatives.shape[-1]-1))
+    for event in range(n_events-1):
+        centered=derivatives[event]-np.median(derivatives[event], axis=-1, keepdims=True)
+        norms=np.sqrt(np.sum(centered**2, axis=-1))
+        for channel in range(1, 4):
+            full=np.correlate(centered[0], centered[channel], 'full')
+            window=full[len(grid)-2-lag_steps:len(grid)-1+lag_steps]/(norms[0]*norms[channel])
+            assert np.isclose(correlations[event, channel], window.max()), (event, channel)
+            assert abs(lags[event, channel]-(np.argmax(window)-lag_steps)*cadence)<=cadence/2, (event, channel)
+    print("All tests passed!")
+
+
+if __name__ == '__main__':
+    from flux_store import load_generate_flux_store
+    from work import load_generate_dataset
+
+    #Lag of the >10 MeV onset after the >30, >50 and >100 MeV onsets, from the flux store
+    df=load_generate_dataset()
+    flux_store=load_generate_flux_store(df, '../output/opsep/GOES-08_integral_enhance_idsep/')
+    add_dispersion_columns(df, flux_store)
+    print(df[[TC_30 + DISPERSION_LAG, TC_50 + DISPERSION_LAG, TC_100 + DISPERSION_LAG]].dropna())
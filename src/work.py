@@ -85,7 +85,6 @@ Other parameters:
 
 import pandas as pd
 import os
-import matplotlib.pyplot as plt
 import numpy as np
 
 from conversion import convert_column_to_numeric, convert_column_to_date
@@ -100,81 +99,21 @@ from dataset_errors_finding import test_longitude_range
 
 from calculate_delays import calculate_flare_to_peak_delay, calculate_CME_to_peak_delay, corrects_sep_to_peak_delay
 from calculate_delays import calculate_CME_to_max_delay, calculate_flare_to_max_delay, corrects_sep_to_max_delay
-plt.style.use('seaborn-v0_8-darkgrid')
 
+from mask_index import build_mask_index
+from threshold_index import build_threshold_index, save_threshold_index, load_threshold_index
+from subset_cache import subset_cache_info, cached_subset_positions
+from plots import plot_flux_time_series, histogram_of_delays_max, histogram_of_delays_peak
+from fluence_spectrum import build_fluence_spectra, save_fluence_spectra, load_fluence_spectra
+from pipeline_profiler import PipelineProfiler
 
-def plot_flux_time_series(file_path,event,event_type):
-    '''
-    Plot the flux time series from a given file path.
-    The file is expected to have two columns: Time and Value, separated by whitespace. 
-    It will be imported into a pandas DataFrame.
-    The Time column is converted to datetime format, and the Value column is plotted on a logarithmic scale.
-
-    Parameters:
-    -----------
-    file_path : string
-        the path to the directory containing the flux time series file
-    event : panda Series
-        a row from the dataframe containing all event information
-    event_type : string
-        the type of differential flux to plot for this event (eg '>10.0 MeV 10.0 pfu')
-
-    Returns:
-    --------
-    fig,ax : the figure and axis object of the plot
-    '''
 
-    #Define which file to open to get the flux time series of the event
-    name_flux_time_series=file_path + event[event_type + 'Flux Time Series']
+#Event 410 of the GOES integral PRIMARY catalog, whose CME time is not consistent (see patch_event_410)
+EVENT_410_PERIOD_START = pd.Timestamp('2013-04-20 09:55:00')
+EVENT_410_EXPERIMENT = 'GOES-13'
 
-    #Read the file into a pandas DataFrame
-    df_plot = pd.read_csv(name_flux_time_series, delim_whitespace=True, names=["Time", "Flux"])
-    
-    #Convert the Time column to datetime format
-    df_plot["Time"] = pd.to_datetime(df_plot["Time"])
-
-    #Plot the flux versus time on a logarithmic scale for the flux
-    fig,ax=plt.subplots(1,1,figsize=(10,6))
-    ax.plot(df_plot["Time"], df_plot["Flux"], marker='o', linestyle='-')
-    ax.set_yscale('log')
-    ax.set_xlabel('Time (Date)')
-    ax.set_ylabel('Flux (pfu)')
-    ax.set_title(f'Event nb {event.name} \nDifferential Flux:\n{event_type}')
-    ax.grid(True, which="both", ls="--")
-
-    #Plot the max peak and onset peak
-
-    if pd.notnull(event[event_type + 'Max Flux Time']):
-        Max_flux_time=pd.to_datetime(event[event_type + 'Max Flux Time'])
-        Max_flux=(event[event_type + 'Max Flux (pfu)'])
-        ax.axvline(Max_flux_time, color='red', linestyle='--', label='Max Flux Time')
-        ax.plot(Max_flux_time, Max_flux, 'ro',markersize=10)  # Mark the max flux point
-
-    if pd.notnull(event[event_type + 'Onset Peak Time']):
-        Onset_peak_time=pd.to_datetime(event[event_type + 'Onset Peak Time'])
-        Onset_peak_flux=(event[event_type + 'Onset Peak (pfu)'])
-        ax.axvline(Onset_peak_time, color='orange', linestyle='--', label='Onset Peak Time')
-        ax.plot(Onset_peak_time, Onset_peak_flux, 'o', color='orange', markersize=10)  # Mark the onset peak point
-        
-    if pd.notnull(event[event_type + 'SEP Start Time']):
-        SEP_start_time=pd.to_datetime(event[event_type + 'SEP Start Time'])
-        ax.axvline(SEP_start_time, color='green', linestyle='--', label='SEP Start Time')
 
-    if pd.notnull(event[TIME_FLARE]):
-        Flare_time=pd.to_datetime(event[TIME_FLARE])
-        ax.axvline(Flare_time, color='yellow', linestyle='--', label='Flare Xray Peak Time')
-    
-    if pd.notnull(event[TIME_CME]):
-        CME_time=pd.to_datetime(event[TIME_CME])
-        ax.axvline(CME_time, color='purple', linestyle='--', label='CME CDAW First Look Time')
-    
-    ax.legend()
-    plt.show()
-
-    return fig,ax
-
-
-def subset_selection(df,event_type=None,Event_longitude=None,Flare_magnitude=None,CDAW_speed=None,DONKI_speed=None):
+def subset_selection(df,event_type=None,Event_longitude=None,Flare_magnitude=None,CDAW_speed=None,DONKI_speed=None,mask_index=None,expression=None):
     '''
     This function return a subset of SEP event data frame according to the selection criteria.
     All the criteria are default to None, meaning no selection on that criteria.
@@ -201,38 +140,30 @@ def subset_selection(df,event_type=None,Event_longitude=None,Flare_magnitude=Non
     DONKI_speed : float, default to None
         The minimum speed of the CME from the DONKI catalog (km/s)
 
+    mask_index : dict, default to None
+        The mask index of df (see mask_index.build_mask_index), used to reuse the masks of the criteria
+        between selections. If None, the masks are computed for this selection only.
+        The selected positions are memoized anyway (see subset_cache.py), a repeated selection is only a take of df.
+        If df is modified in place between two selections, call subset_cache.forget_fingerprint(df).
+
+    expression : string, default to None
+        An additional selection expression (see selection_expression.py),
+        eg "-30 <= latitude <= 30 and (gle or cdaw_speed >= 1500)"
+
     Returns:
     --------
     df : pandas DataFrame
         The filtered dataframe according to the selection criteria
     '''
+    if event_type is None and Event_longitude is None and Flare_magnitude is None and CDAW_speed is None and DONKI_speed is None and expression is None:
+        return df
 
-    if event_type is not None:
-        df = df.loc[df[event_type + 'SEP Start Time'].notnull()]
-    
-    #I considered only the events with a known longitude that respect the criteria
-    if Event_longitude is not None:
-        df = df.loc[(df['Event Longitude'] >= Event_longitude[0]) & (df['Event Longitude'] <= Event_longitude[1])]
-
-    #I considered only the events with a known magnitude that respect the criteria
-    #there is no need to add the '.notnull()' condition, as NaN values are not >= Flare_magnitude
-    #I added it for clarity, and I may remove it to speed up the code
-    if Flare_magnitude is not None:
-        df = df.loc[df['Flare Magnitude'].notnull() & (df['Flare Magnitude'] >= Flare_magnitude)]
-
-    #I considered only the events with a known CDAW speed that respect the criteria
-    #there is no need to add the '.notnull()' condition, as NaN values are not >= CDAW_speed
-    #I added it for clarity, and I may remove it to speed up the code
-    if CDAW_speed is not None:
-        df = df.loc[df['CDAW CME Speed'].notnull() & (df['CDAW CME Speed'] >= CDAW_speed)]
-    
-    #I considered only the events with a known DONKI speed that respect the criteria
-    #there is no need to add the '.notnull()' condition, as NaN values are not >= DONKI_speed
-    #I added it for clarity, and I may remove it to speed up the code
-    if DONKI_speed is not None:
-        df = df.loc[df['DONKI CME Speed'].notnull() & (df['DONKI CME Speed'] >= DONKI_speed)]
+    #I considered only the events that respect all the criteria (AND of the masks of each criteria),
+    #the events with an unknown longitude, magnitude or speed are never selected by the corresponding criteria
+    positions = cached_subset_positions(df, event_type=event_type, Event_longitude=Event_longitude, Flare_magnitude=Flare_magnitude,
+                                        CDAW_speed=CDAW_speed, DONKI_speed=DONKI_speed, expression=expression, mask_index=mask_index)
 
-    return df
+    return df.iloc[positions]
 
 
 def test_subset_selection(df,all=0):
@@ -332,270 +263,183 @@ def test_subset_selection(df,all=0):
         print("Test passed!")
 
 
-def prepare_dataframe():
+def patch_event_410(df):
+    '''
+    This function set the CME to Max delay of the event 410 of the GOES integral PRIMARY catalog to NaN for AB_10 and AB_30
+    (its CME time is not consistent). The event is found by its time period start and its experiment,
+    so the other catalogs are not modified (and the copies of the event in a replicated catalog are all patched).
+    TO BE DELETED WHEN THE ISSUE ON THE FLARE TIME FOR EVENT 410 IS FIXED
+    '''
+    is_event_410 = (df["Time Period Start"] == EVENT_410_PERIOD_START) & (df["Experiment"] == EVENT_410_EXPERIMENT)
+    for index in df.index[is_event_410]:
+        print(f'\n{df.loc[index, "Time Period Start"]} / Event 410 : Checking the cme time consistency...')
+        print(f'\t cme time : {df.loc[index, TIME_CME]}')
+        print(f'\tstart time : {df.loc[index, "Time Period Start"]}')
+        print('setting the CME to Max delay to NaN for this event AB_10, 1B_30...\n')  
+        df.loc[index,AB_10 + CME_TO_MAX]=np.nan
+        df.loc[index,AB_30 + CME_TO_MAX]=np.nan
+    return df
+
+
+def prepare_dataframe(profiler=None,file_path='Datasets/',file_name='GOES_integral_PRIMARY.1986-02-03.2025-09-10_sep_events.csv',notify_changes=True):
     '''
     This function prepare the dataframe by reading the SEP event file,
     converting relevant columns to the correct data type,
     and calculating all additional columns (delays).
 
+    Parameters:
+    -----------
+    profiler : pipeline_profiler.PipelineProfiler, default to None
+        If given, the profiler records the wall time, CPU time, peak RSS and dataframe memory
+        of each stage (and of each converted column)
+    file_path : string, default to 'Datasets/'
+        The directory of the SEP event file
+    file_name : string, default to the GOES integral PRIMARY catalog
+        The name of the SEP event file (eg 'GOES-06_integral_enhance_idsep.1986-01-01.1994-11-30_sep_events.csv',
+        in '../output/opsep/GOES-06_integral_enhance_idsep/')
+    notify_changes : boolean, default to True
+        If True, the values that can't be converted are printed (see conversion.py)
+
     Returns:
     --------
     df : pandas DataFrame
         The prepared dataframe containing all event information
     '''
-    #Define the directory used
-    file_name='GOES_integral_PRIMARY.1986-02-03.2025-09-10_sep_events.csv'
-    #'GOES-06_integral_enhance_idsep.1986-01-01.1994-11-30_sep_events.csv'
-    file_path='Datasets/'
-    #'../output/opsep/GOES-06_integral_enhance_idsep/'
+    if profiler is None:
+        profiler=PipelineProfiler(enabled=False)
 
     #Read the main SEP event file into a pandas DataFrame
-    df = pd.read_csv(file_path + file_name)
+    df = profiler.run('read', pd.read_csv, file_path + file_name)
 
-    df=df.iloc[:-1] #removing the last row because its longitude is out of range [-180;180]
+    df=profiler.run('drop last row', lambda df: df.iloc[:-1], df) #removing the last row because its longitude is out of range [-180;180]
 
     #Convert relevant columns to the correct data type
-    df=convert_column_to_date(df,'Time Period Start',notify_changes=True)
-
-    df=convert_column_to_numeric(df,'Flare Magnitude',notify_changes=True)
-    df=convert_column_to_numeric(df,'CDAW CME Speed',notify_changes=True)
-    df=convert_column_to_numeric(df,'DONKI CME Speed',notify_changes=True)
-    df=convert_column_to_numeric(df,'Event Longitude',notify_changes=True)
-
-    df=convert_column_to_date(df,TIME_FLARE,notify_changes=True)
-    df=convert_column_to_date(df,TIME_CME,notify_changes=True)
-
+    conversions=[(convert_column_to_date,'Time Period Start')]
+    conversions+=[(convert_column_to_numeric,column) for column in ['Flare Magnitude','CDAW CME Speed','DONKI CME Speed','Event Longitude']]
+    conversions+=[(convert_column_to_date,TIME_FLARE),(convert_column_to_date,TIME_CME)]
     for event_type in EVENT_TYPES:
-        df=convert_column_to_date(df,event_type + TIME_SEP,notify_changes=True)
-        df=convert_column_to_date(df,event_type + TIME_PEAK,notify_changes=True)
-        df=convert_column_to_date(df,event_type + TIME_MAX,notify_changes=True)
+        conversions+=[(convert_column_to_date,event_type + time) for time in [TIME_SEP, TIME_PEAK, TIME_MAX]]
+    for convert, column in conversions:
+        df=profiler.run(column, convert, df, column, notify_changes=notify_changes, group='conversions')
 
     #Calculate all aditional columns (delays)
-    df=calculate_CME_to_max_delay(df)
-    df=calculate_flare_to_max_delay(df)
-    df=calculate_flare_to_peak_delay(df)
-    df=calculate_CME_to_peak_delay(df)
+    for calculate in [calculate_CME_to_max_delay, calculate_flare_to_max_delay, calculate_flare_to_peak_delay, calculate_CME_to_peak_delay]:
+        df=profiler.run(calculate.__name__, calculate, df, group='delays')
     
     #Correcting the SEP to peak and SEP to max delay columns if they exist
-    df=corrects_sep_to_max_delay(df)
-    df=corrects_sep_to_peak_delay(df)
+    for correct in [corrects_sep_to_max_delay, corrects_sep_to_peak_delay]:
+        df=profiler.run(correct.__name__, correct, df, group='corrections')
 
     #TO BE DELETED WHEN THE ISSUE ON THE FLARE TIME FOR EVENT 410 IS FIXED
-    print(f'\n{df["Time Period Start"].iloc[410]} / Event 410 : Checking the cme time consistency...')
-    print(f'\t cme time : {df.iloc[410][TIME_CME]}')
-    print(f'\tstart time : {df.iloc[410]["Time Period Start"]}')
-    print('setting the CME to Max delay to NaN for this event AB_10, 1B_30...\n')  
-    df.loc[410,AB_10 + CME_TO_MAX]=np.nan
-    df.loc[410,AB_30 + CME_TO_MAX]=np.nan
+    df=profiler.run('patch event 410', patch_event_410, df)
     
     return df
  
 
-def load_generate_dataset(force=False):
+def load_generate_dataset(force=False,profile=False):
     """
     This function either loads an existing dataset from a pickle file
     or generates a new dataset by calling the prepare_dataframe function.
     If the dataset is generated, it is saved to a pickle file for future use, 
     so that it doesn't need to be regenerated each time.
+    If profile is True, the stages of the generation are profiled (see pipeline_profiler.py),
+    the profile is printed and saved in a JSON file next to the dataset.
     """
     DATA_PATH = "Datasets/my_dataset.pkl" 
+    PROFILE_PATH = "Datasets/my_dataset_profile.json"
     if not force and os.path.exists(DATA_PATH):
         print("Loading the existing dataset...")
         return pd.read_pickle(DATA_PATH)
     else:
         print("Generating the dataset...")
-        df = prepare_dataframe()
+        profiler = PipelineProfiler(enabled=profile)
+        df = prepare_dataframe(profiler=profiler)
+        if profile:
+            profiler.print_summary()
+            profiler.save(PROFILE_PATH)
         df.to_pickle(DATA_PATH)
         print("Dataset saved in", DATA_PATH)
+        #The fluence spectra are parsed once, with the dataset
+        load_generate_fluence_spectra(df, force=True)
         return df
 
 
-def histogram_of_delays_max(df,event_type,Event_longitude=None,Flare_magnitude=None,CDAW_speed=None,DONKI_speed=None,debug=False):
-    '''
-    This function plot the histogram of the delays (CME to Max, Flare to Max, SEP to Max)
-    for a subset of events selected according to the selection criteria.
-    Parameters:
-    -----------
-    df : panda DataFrame
-        the dataframe containing all event information
-    event_type : string
-        The type of event (Threshold Crossing, Above Background, and the differential flux studied).
-        Use the constants defined above (eg TC_10, AB_10...)
-    Event_longitude : (float,float), default to None
-        The minimum and maximum longitude of the events to consider (in degrees)
-    Flare_magnitude : string, default to None
-        The minimum flare magnitude of the SEP. M-class : flare magnitude >= 1e-5 (W/m^2)
-    CDAW_speed : float, default to None
-        The minimum speed of the CME from the CDAW catalog (km/s)
-    DONKI_speed : float, default to None
-        The minimum speed of the CME from the DONKI catalog (km/s)
-    '''
-    #Selecting the subset of events according to the selection criteria
-    df_subset=subset_selection(df, event_type=event_type, Event_longitude=Event_longitude, Flare_magnitude=Flare_magnitude, CDAW_speed=CDAW_speed, DONKI_speed=DONKI_speed)
-    print(df_subset.shape) #to see how many events are in the subset, if there is enough data
-    #Get the delays for the selected subset of events and convert them to hours
-    CME_to_max_delays=df_subset[event_type + CME_TO_MAX].dropna().values/60.0 #in hours
-    Flare_to_max_delays=df_subset[event_type + FLARE_TO_MAX].dropna().values/60.0 #in hours
-    SEP_to_max_delays=df_subset[event_type + SEP_TO_MAX].dropna().values/60.0 #in hours
-
-    #Plot the histogram of the CME to Max delays for the selected subset of events
-    fig,ax=plt.subplots(1,1,figsize=(10,6))
-
-    mean_CME_to_max=np.mean(CME_to_max_delays)
-    std_CME_to_max=np.std(CME_to_max_delays)
-    print(f'Mean CME to Max Delay: {mean_CME_to_max:.2f} hours, Std: {std_CME_to_max:.2f} hours')
-    counts, bins = np.histogram(CME_to_max_delays, bins=30)
-    ax.stairs(counts, bins, label=f' CME to Max Delay, $\mu$={mean_CME_to_max:.2f} h, $\sigma$={std_CME_to_max:.2f} h')
-
-    mean_Flare_to_max=np.mean(Flare_to_max_delays)
-    std_Flare_to_max=np.std(Flare_to_max_delays)
-    print(f'Mean Flare to Max Delay: {mean_Flare_to_max:.2f} hours, Std: {std_Flare_to_max:.2f} hours')
-    counts, bins = np.histogram(Flare_to_max_delays, bins=30)
-    ax.stairs(counts, bins, label=f' Flare to Max Delay, $\mu$={mean_Flare_to_max:.2f} h, $\sigma$={std_Flare_to_max:.2f} h')
-
-    mean_SEP_to_max=np.mean(SEP_to_max_delays)
-    std_SEP_to_max=np.std(SEP_to_max_delays)
-    print(f'Mean SEP to Max Delay: {mean_SEP_to_max:.2f} hours, Std: {std_SEP_to_max:.2f} hours')
-    counts, bins = np.histogram(SEP_to_max_delays, bins=30)
-    ax.stairs(counts, bins, label=f' SEP to Max Delay, $\mu$={mean_SEP_to_max:.2f} h, $\sigma$={std_SEP_to_max:.2f} h')
-
-    #Create the title based on the selection criteria
-    title=f'Histogram of Delays for {event_type}, '
-    if Event_longitude is not None:
-        title+=f'longitude {Event_longitude}, '
-    if Flare_magnitude is not None:
-        title+=f'Flare magnitude >= {Flare_magnitude}, '
-    if CDAW_speed is not None:
-        title+=f'CDAW speed >= {CDAW_speed} km/s, '
-    if DONKI_speed is not None:
-        title+=f'DONKI speed >= {DONKI_speed} km/s, '
-    
-    ax.set_xlabel('CME to Max Delay (hours)')
-    ax.set_ylabel('Number of Events')
-    ax.set_title(title)
-    plt.show()
-    plt.legend()
-
-    if debug:
-        print("CME to peak delays < 0:")
-        print(CME_to_max_delays[CME_to_max_delays<0])
-        print("Flare to peak delays < 0:")
-        print(Flare_to_max_delays[Flare_to_max_delays<0])
-        print("SEP to peak delays < 0:")
-        print(SEP_to_max_delays[SEP_to_max_delays<0])
-    
-
-
-def histogram_of_delays_peak(df,event_type,Event_longitude=None,Flare_magnitude=None,CDAW_speed=None,DONKI_speed=None,debug=False):
-    '''
-    This function plot the histogram of the delays (CME to Peak, Flare to Peak, SEP to Peak)
-    for a subset of events selected according to the selection criteria.
-    Parameters:
-    -----------
-    df : panda DataFrame
-        the dataframe containing all event information
-    event_type : string
-        The type of event (Threshold Crossing, Above Background, and the differential flux studied).
-        Use the constants defined above (eg TC_10, AB_10...)
-    Event_longitude : (float,float), default to None
-        The minimum and maximum longitude of the events to consider (in degrees)
-    Flare_magnitude : string, default to None
-        The minimum flare magnitude of the SEP. M-class : flare magnitude >= 1e-5 (W/m^2)
-    CDAW_speed : float, default to None
-        The minimum speed of the CME from the CDAW catalog (km/s)
-    DONKI_speed : float, default to None
-        The minimum speed of the CME from the DONKI catalog (km/s)
-    '''
-    #Selecting the subset of events according to the selection criteria
-    df_subset=subset_selection(df, event_type=event_type, Event_longitude=Event_longitude, Flare_magnitude=Flare_magnitude, CDAW_speed=CDAW_speed, DONKI_speed=DONKI_speed)
-    print(df_subset.shape) #to see how many events are in the subset, if there is enough data
+def load_generate_threshold_index(df,force=False):
+    """
+    This function either loads the sorted threshold indexes of the dataset (Flare Magnitude, CME speeds)
+    from the .npz file saved next to the cached dataset,
+    or builds them with threshold_index.build_threshold_index and saves them.
+    The indexes are rebuilt if the cached dataset is more recent than the saved indexes.
+    """
+    DATA_PATH = "Datasets/my_dataset.pkl"
+    INDEX_PATH = "Datasets/my_dataset_threshold_index.npz"
+    is_up_to_date = os.path.exists(INDEX_PATH) and (not os.path.exists(DATA_PATH) or os.path.getmtime(INDEX_PATH) >= os.path.getmtime(DATA_PATH))
+    if not force and is_up_to_date:
+        threshold_index = load_threshold_index(INDEX_PATH)
+        if threshold_index['n_rows'] == len(df):
+            return threshold_index
 
-    #Get the delays for the selected subset of events and convert them to hours
-    CME_to_peak_delays=df_subset[event_type + CME_TO_PEAK].dropna().values/60.0 #in hours
+    threshold_index = build_threshold_index(df)
+    save_threshold_index(threshold_index, INDEX_PATH)
+    return threshold_index
 
-    Flare_to_peak_delays=df_subset[event_type + FLARE_TO_PEAK].dropna().values/60.0 #in hours
-    #TO BE DELETED WHEN ISSUE ON NEGATIVE DELAYS IS FIXED
-    Flare_to_peak_delays=Flare_to_peak_delays[Flare_to_peak_delays>= 0] 
 
-    SEP_to_peak_delays=df_subset[event_type + SEP_TO_PEAK].dropna().values/60.0 #in hours
-    #TO BE DELETED WHEN ISSUE ON NEGATIVE DELAYS IS FIXED
-    SEP_to_peak_delays=SEP_to_peak_delays[SEP_to_peak_delays>= 0] 
+def load_generate_fluence_spectra(df,force=False):
+    """
+    This function either loads the parsed fluence spectra of the dataset (ragged arrays, see fluence_spectrum.py)
+    from the .npz file saved next to the cached dataset,
+    or parses them with fluence_spectrum.build_fluence_spectra and saves them.
+    The spectra are parsed again if the cached dataset is more recent than the saved spectra.
+    """
+    DATA_PATH = "Datasets/my_dataset.pkl"
+    SPECTRA_PATH = "Datasets/my_dataset_fluence_spectra.npz"
+    is_up_to_date = os.path.exists(SPECTRA_PATH) and (not os.path.exists(DATA_PATH) or os.path.getmtime(SPECTRA_PATH) >= os.path.getmtime(DATA_PATH))
+    if not force and is_up_to_date:
+        spectra = load_fluence_spectra(SPECTRA_PATH)
+        if spectra['n_rows'] == len(df):
+            return spectra
 
-    #Plot the histogram of the CME to Peak delays for the selected subset of events
-    fig,ax=plt.subplots(1,1,figsize=(10,6))
+    spectra = build_fluence_spectra(df)
+    save_fluence_spectra(spectra, SPECTRA_PATH)
+    return spectra
 
-    mean_CME_to_peak=np.mean(CME_to_peak_delays)
-    std_CME_to_peak=np.std(CME_to_peak_delays)
-    print(f'Mean CME to Peak Delay: {mean_CME_to_peak:.2f} hours, Std: {std_CME_to_peak:.2f} hours')
-    counts, bins = np.histogram(CME_to_peak_delays, bins=30)
-    ax.stairs(counts, bins, label=f' CME to Peak Delay, $\mu$={mean_CME_to_peak:.2f} h, $\sigma$={std_CME_to_peak:.2f} h')
-    
-    mean_Flare_to_peak=np.mean(Flare_to_peak_delays)
-    std_Flare_to_peak=np.std(Flare_to_peak_delays)
-    print(f'Mean Flare to Peak Delay: {mean_Flare_to_peak:.2f} hours, Std: {std_Flare_to_peak:.2f} hours')
-    counts, bins = np.histogram(Flare_to_peak_delays, bins=30)
-    ax.stairs(counts, bins, label=f' Flare to Peak Delay, $\mu$={mean_Flare_to_peak:.2f} h, $\sigma$={std_Flare_to_peak:.2f} h')
-    
-    mean_SEP_to_peak=np.mean(SEP_to_peak_delays)
-    std_SEP_to_peak=np.std(SEP_to_peak_delays)
-    print(f'Mean SEP to Peak Delay: {mean_SEP_to_peak:.2f} hours, Std: {std_SEP_to_peak:.2f} hours')
-    counts, bins = np.histogram(SEP_to_peak_delays, bins=30)
-    ax.stairs(counts, bins, label=f' SEP to Peak Delay, $\mu$={mean_SEP_to_peak:.2f} h, $\sigma$={std_SEP_to_peak:.2f} h')
-
-    #Create the title based on the selection criteria
-    title=f'Histogram of Delays for {event_type}, '
-    if Event_longitude is not None:
-        title+=f'longitude {Event_longitude}, '
-    if Flare_magnitude is not None:
-        title+=f'Flare magnitude >= {Flare_magnitude}, '
-    if CDAW_speed is not None:
-        title+=f'CDAW speed >= {CDAW_speed} km/s, '
-    if DONKI_speed is not None:
-        title+=f'DONKI speed >= {DONKI_speed} km/s, '
-    
-    ax.set_xlabel('CME to Max Delay (hours)')
-    ax.set_ylabel('Number of Events')
-    ax.set_title(title)
-    plt.show()
-    plt.legend()
 
-    if debug:
-        print("CME to peak delays < 0:")
-        print(CME_to_peak_delays[CME_to_peak_delays<0])
-        print("Flare to peak delays < 0:")
-        print(Flare_to_peak_delays[Flare_to_peak_delays<0])
-        print("SEP to peak delays < 0:")
-        print(SEP_to_peak_delays[SEP_to_peak_delays<0])
 
 
-
-df=load_generate_dataset()
+if __name__=='__main__':
+    df=load_generate_dataset()
 
 def main():
+    #The masks of the selection criteria are computed once and reused by all the histograms,
+    #the threshold masks are built from the sorted indexes of the magnitude and speeds
+    threshold_index=load_generate_threshold_index(df)
+    mask_index=build_mask_index(df,threshold_index=threshold_index)
+
     #Varying event type:
     """
-    histogram_of_delays_max(df,TC_10)
-    histogram_of_delays_max(df,TC_30)
-    histogram_of_delays_max(df,TC_50)
-    histogram_of_delays_max(df,TC_100)
+    histogram_of_delays_max(df,TC_10,mask_index=mask_index)
+    histogram_of_delays_max(df,TC_30,mask_index=mask_index)
+    histogram_of_delays_max(df,TC_50,mask_index=mask_index)
+    histogram_of_delays_max(df,TC_100,mask_index=mask_index)
     """
-    histogram_of_delays_max(df,AB_10)
-    histogram_of_delays_max(df,AB_30)
-    histogram_of_delays_max(df,AB_50)
-    histogram_of_delays_max(df,AB_100)
+    histogram_of_delays_max(df,AB_10,mask_index=mask_index)
+    histogram_of_delays_max(df,AB_30,mask_index=mask_index)
+    histogram_of_delays_max(df,AB_50,mask_index=mask_index)
+    histogram_of_delays_max(df,AB_100,mask_index=mask_index)
+    print(subset_cache_info()) #hits and misses of the cache of the selections
     
 
     """
-    histogram_of_delays_peak(df,TC_10,Event_longitude=WESTERN,Flare_magnitude=1e-5)
-    histogram_of_delays_peak(df,TC_30,Event_longitude=WESTERN,Flare_magnitude=1e-5)
-    histogram_of_delays_peak(df,TC_50,Event_longitude=WESTERN,Flare_magnitude=1e-5)
-    histogram_of_delays_peak(df,TC_100,Event_longitude=WESTERN,Flare_magnitude=1e-5)
+    histogram_of_delays_peak(df,TC_10,Event_longitude=WESTERN,Flare_magnitude=1e-5,mask_index=mask_index)
+    histogram_of_delays_peak(df,TC_30,Event_longitude=WESTERN,Flare_magnitude=1e-5,mask_index=mask_index)
+    histogram_of_delays_peak(df,TC_50,Event_longitude=WESTERN,Flare_magnitude=1e-5,mask_index=mask_index)
+    histogram_of_delays_peak(df,TC_100,Event_longitude=WESTERN,Flare_magnitude=1e-5,mask_index=mask_index)
     
     #Varying only the flare magnitude threshold
     flare_magnitudes=[1e-6,1e-5,5e-5,1e-4,5e-4, 1e-3]
     for flare_magnitude in flare_magnitudes:
     
-        histogram_of_delays_peak(df,TC_10,Flare_magnitude=flare_magnitude)
+        histogram_of_delays_peak(df,TC_10,Flare_magnitude=flare_magnitude,mask_index=mask_index)
     """
 
 